@@ -9,44 +9,99 @@ available for the Plex music cleaner.
 
 import os
 import sys
+import bz2
+import gzip
 import logging
+import lzma
 import plistlib
+import shlex
 import urllib.parse
+from array import array
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, NamedTuple, Set, Tuple
+
+from path_keys import make_path_key
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Recognised export file names, mapped to the module that decompresses them
+XML_OPENERS = {'.xml': open, '.xml.gz': gzip.open, '.xml.bz2': bz2.open, '.xml.xz': lzma.open}
+
+# Compress a plain export on the remote host while it is streamed over SSH
+# (gzip, bzip2 or xz; empty streams it uncompressed over SFTP)
+SSH_COMPRESSION = os.environ.get('APPLE_XML_SSH_COMPRESS', '').lower()
+
+# Remote command and local decompressor for each SSH compression method
+_SSH_COMPRESSORS = {'gzip': 'gzip -c', 'bzip2': 'bzip2 -c', 'xz': 'xz -c'}
+_SSH_COMPRESSION_SUFFIXES = {'gzip': '.xml.gz', 'bzip2': '.xml.bz2', 'xz': '.xml.xz'}
+
+# How merge_library_snapshots() picks between copies of the same track:
+# 'newest' Date Modified wins (ties go to the earlier source), or 'priority'
+# where the earlier source always wins
+MERGE_PRECEDENCE = ('newest', 'priority')
+
+# Length of the substrings in the artist n-gram index
+ARTIST_NGRAM = 3
+
+# Metadata fields carried in a compact library snapshot, in tuple order
+SNAPSHOT_FIELDS = ('title', 'artist', 'album', 'size', 'duration', 'persistent_id', 'path_key',
+                   'date_modified')
+
+
+class ApplePlaylist(NamedTuple):
+    """A playlist or playlist folder of an XML library export."""
+    name: str
+    persistent_id: Optional[str]
+    parent_id: Optional[str]    # Persistent ID of the enclosing folder
+    is_folder: bool
+    track_ids: array            # Track IDs (resolved to paths via id_map on demand)
+
+
 class AppleMusicXMLClient:
     """Client for accessing Apple Music data from XML library exports."""
     
-    def __init__(self, xml_path: str):
+    def __init__(self, xml_path: str, snapshot: Optional[Dict[str, Any]] = None):
         """
         Initialize the Apple Music XML client.
         
         Args:
             xml_path: Path to the iTunes/Apple Music XML library export
+            snapshot: Compact snapshot from to_snapshot(); when given the XML
+                      file is not parsed again
         """
         self.xml_path = xml_path
         self.track_map = {}  # Maps file paths to metadata
-        self.id_map = {}     # Maps track IDs to file paths
-        self.playlists = {}  # Maps playlist names to lists of file paths
+        self.id_map = {}     # Maps (integer) track IDs to file paths
+        self.playlists: Dict[str, ApplePlaylist] = {}            # By name
+        self.playlists_by_id: Dict[str, ApplePlaylist] = {}      # By Persistent ID
+        self.playlist_names: Dict[str, str] = {}                 # Case-folded name -> name
+        self.playlist_children: Dict[str, List[ApplePlaylist]] = {}  # Folder ID -> contents
+        self.artist_tracks: Dict[str, List[str]] = {}   # Case-folded artist -> file paths
+        self.artist_ngrams: Dict[str, Set[str]] = {}    # Trigram -> case-folded artists
         
-        self._load_library()
+        if snapshot is not None:
+            self._load_snapshot(snapshot)
+        else:
+            self._load_library()
+        self._build_artist_index()
         
     def _load_library(self) -> None:
         """Load the XML library file and build the track and playlist maps."""
         try:
             logger.info(f"Loading Apple Music XML library from: {self.xml_path}")
             
-            if not os.path.exists(self.xml_path):
+            if not parse_ssh_location(self.xml_path) and not os.path.exists(self.xml_path):
                 logger.error(f"XML library file not found: {self.xml_path}")
                 raise FileNotFoundError(f"XML library file not found: {self.xml_path}")
             
-            # Load the plist XML file
-            with open(self.xml_path, 'rb') as f:
-                library = plistlib.load(f)
+            # Load the plist XML file, decompressing on the fly if needed.
+            # The format is given explicitly so the stream is never rewound,
+            # which a remote stream could not do.
+            with open_xml_library(self.xml_path) as f:
+                library = plistlib.load(f, fmt=plistlib.FMT_XML)
                 
             # Process tracks
             if 'Tracks' in library:
@@ -83,16 +138,22 @@ class AppleMusicXMLClient:
             if not file_path:
                 continue
                 
-            # Extract metadata
+            # Extract metadata (size in bytes and duration in ms feed the
+            # size/duration matcher when paths differ between machines)
             metadata = {
                 'title': track_data.get('Name', ''),
                 'artist': track_data.get('Artist', ''),
-                'album': track_data.get('Album', '')
+                'album': track_data.get('Album', ''),
+                'size': track_data.get('Size'),
+                'duration': track_data.get('Total Time'),
+                'persistent_id': track_data.get('Persistent ID'),
+                'path_key': make_path_key(file_path),
+                'date_modified': _epoch_seconds(track_data.get('Date Modified'))
             }
             
             # Add to mappings
             self.track_map[file_path] = metadata
-            self.id_map[track_id] = file_path
+            self.id_map[int(track_id)] = file_path
             
     def _process_playlists(self, playlists_list: List[Dict[str, Any]]) -> None:
         """
@@ -110,19 +171,99 @@ class AppleMusicXMLClient:
             if not playlist_name:
                 continue
                 
-            # Get playlist tracks
-            tracks = []
-            playlist_items = playlist.get('Playlist Items', [])
-            
-            for item in playlist_items:
-                track_id = str(item.get('Track ID', ''))
-                if track_id in self.id_map:
-                    tracks.append(self.id_map[track_id])
-                    
-            if tracks:
-                self.playlists[playlist_name] = tracks
-                logger.debug(f"Playlist '{playlist_name}' contains {len(tracks)} tracks")
+            # Keep only the IDs of tracks with a file, as a compact array
+            id_map = self.id_map
+            track_ids = array('l', (
+                item['Track ID'] for item in playlist.get('Playlist Items', [])
+                if item.get('Track ID') in id_map
+            ))
+            
+            self._add_playlist(ApplePlaylist(
+                name=playlist_name,
+                persistent_id=playlist.get('Playlist Persistent ID'),
+                parent_id=playlist.get('Parent Persistent ID'),
+                is_folder=bool(playlist.get('Folder', False)),
+                track_ids=track_ids
+            ))
+            logger.debug(f"Playlist '{playlist_name}' contains {len(track_ids)} tracks")
+            
+    def _add_playlist(self, playlist: ApplePlaylist) -> None:
+        """Add a playlist to the catalogue and its name, ID and folder indexes."""
+        # A later playlist with the same name replaces the earlier one in the
+        # name indexes; both stay reachable by Persistent ID
+        self.playlists[playlist.name] = playlist
+        self.playlist_names[playlist.name.casefold()] = playlist.name
+        if playlist.persistent_id:
+            self.playlists_by_id[playlist.persistent_id] = playlist
+        if playlist.parent_id:
+            self.playlist_children.setdefault(playlist.parent_id, []).append(playlist)
                 
+    def _build_artist_index(self) -> None:
+        """
+        Index the tracks by artist for get_tracks_by_artist().
+        
+        Tracks are grouped under their case-folded artist name, and every
+        distinct name is indexed by its trigrams, so a substring query only
+        has to check the names that contain all of its trigrams.
+        """
+        for path, metadata in self.track_map.items():
+            self.artist_tracks.setdefault(metadata['artist'].casefold(), []).append(path)
+        for artist in self.artist_tracks:
+            for i in range(len(artist) - ARTIST_NGRAM + 1):
+                self.artist_ngrams.setdefault(artist[i:i + ARTIST_NGRAM], set()).add(artist)
+        logger.debug(f"Indexed {len(self.artist_tracks)} artists")
+        
+    def _matching_artists(self, query: str) -> List[str]:
+        """Return the case-folded artist names that contain a case-folded query."""
+        if len(query) < ARTIST_NGRAM:
+            # Too short to index: check every distinct name (not every track)
+            candidates = self.artist_tracks
+        else:
+            # Intersect the smallest trigram sets first
+            postings = sorted(
+                (self.artist_ngrams.get(query[i:i + ARTIST_NGRAM], set())
+                 for i in range(len(query) - ARTIST_NGRAM + 1)),
+                key=len
+            )
+            candidates = set(postings[0]).intersection(*postings[1:])
+        return [artist for artist in candidates if query in artist]
+        
+    def to_snapshot(self) -> Dict[str, Any]:
+        """
+        Return a compact, picklable copy of the parsed library.
+        
+        Tracks become plain tuples and playlists refer to tracks by ID, so the
+        snapshot is cheap to hand back from a worker process.
+        
+        Returns:
+            Dictionary with 'tracks' and 'playlists' lists
+        """
+        return {
+            'tracks': [
+                (track_id, path, *(self.track_map[path][field] for field in SNAPSHOT_FIELDS))
+                for track_id, path in self.id_map.items()
+            ],
+            'playlists': [tuple(playlist) for playlist in self.playlists_by_id.values()] + [
+                tuple(playlist) for playlist in self.playlists.values() if not playlist.persistent_id
+            ]
+        }
+        
+    def _load_snapshot(self, snapshot: Dict[str, Any]) -> None:
+        """
+        Rebuild the track and playlist maps from a compact snapshot.
+        
+        Args:
+            snapshot: Dictionary produced by to_snapshot()
+        """
+        for track_id, path, *values in snapshot['tracks']:
+            self.track_map[path] = dict(zip(SNAPSHOT_FIELDS, values))
+            self.id_map[track_id] = path
+            
+        for values in snapshot['playlists']:
+            self._add_playlist(ApplePlaylist(*values))
+            
+        logger.info(f"Loaded {len(self.track_map)} tracks and {len(self.playlists)} playlists from snapshot")
+        
     def _decode_file_url(self, file_url: str) -> Optional[str]:
         """
         Decode an Apple Music file URL to a file path.
@@ -182,38 +323,322 @@ class AppleMusicXMLClient:
         Returns:
             Dictionary mapping file paths to metadata dictionaries
         """
-        artist_name_lower = artist_name.lower()
+        track_map = self.track_map
         return {
-            path: metadata
-            for path, metadata in self.track_map.items()
-            if artist_name_lower in metadata['artist'].lower()
+            path: track_map[path]
+            for artist in self._matching_artists(artist_name.casefold())
+            for path in self.artist_tracks[artist]
         }
         
+    def get_playlist_names(self) -> List[str]:
+        """Return the names of all (non-system) playlists in the library that have tracks, without folders."""
+        return [name for name, playlist in self.playlists.items()
+                if playlist.track_ids and not playlist.is_folder]
+    
+    def get_playlist(self, playlist_name: str) -> Optional[ApplePlaylist]:
+        """
+        Look up a playlist by name or Persistent ID.
+        
+        Args:
+            playlist_name: Name (exact, then case-insensitive, then partial
+                           match) or Persistent ID of the playlist; partial
+                           matches skip folders and empty playlists
+            
+        Returns:
+            The playlist, or None if there is none
+        """
+        # Exact name, Persistent ID and case-insensitive name are dictionary lookups
+        playlist = self.playlists.get(playlist_name) or self.playlists_by_id.get(playlist_name)
+        if playlist is None:
+            name = self.playlist_names.get(playlist_name.casefold())
+            playlist = self.playlists[name] if name is not None else None
+        if playlist is not None:
+            return playlist
+            
+        # Try substring match as a last resort, over playlists with tracks
+        playlist_name_folded = playlist_name.casefold()
+        for folded, name in self.playlist_names.items():
+            playlist = self.playlists[name]
+            if playlist_name_folded in folded and playlist.track_ids and not playlist.is_folder:
+                logger.info(f"Using partial match for playlist: '{name}'")
+                return playlist
+        return None
+        
     def get_playlist_tracks(self, playlist_name: str) -> List[str]:
         """
         Retrieve tracks in a playlist from the Apple Music library.
         
         Args:
-            playlist_name: Name of the playlist (case-insensitive match)
+            playlist_name: Name of the playlist (case-insensitive match) or
+                           its Persistent ID
             
         Returns:
             List of file paths for tracks in the playlist
         """
-        # Try exact match first
-        if playlist_name in self.playlists:
-            return self.playlists[playlist_name]
+        playlist = self.get_playlist(playlist_name)
+        if playlist is None:
+            logger.warning(f"Playlist '{playlist_name}' not found")
+            return []
+        id_map = self.id_map
+        return [id_map[track_id] for track_id in playlist.track_ids]
+        
+    def get_playlist_folders(self, playlist_name: str) -> List[str]:
+        """
+        Return the folders enclosing a playlist, outermost first.
+        
+        Args:
+            playlist_name: Name or Persistent ID of the playlist
             
-        # Try case-insensitive match
-        playlist_name_lower = playlist_name.lower()
-        for name, tracks in self.playlists.items():
-            if name.lower() == playlist_name_lower:
-                return tracks
-                
-        # Try substring match as a last resort
-        for name, tracks in self.playlists.items():
-            if playlist_name_lower in name.lower():
-                logger.info(f"Using partial match for playlist: '{name}'")
-                return tracks
-                
-        logger.warning(f"Playlist '{playlist_name}' not found")
-        return []
+        Returns:
+            Folder names (empty for a top-level or unknown playlist)
+        """
+        folders = []
+        playlist = self.get_playlist(playlist_name)
+        seen = set()
+        while playlist is not None and playlist.parent_id and playlist.parent_id not in seen:
+            seen.add(playlist.parent_id)
+            playlist = self.playlists_by_id.get(playlist.parent_id)
+            if playlist is not None:
+                folders.append(playlist.name)
+        return folders[::-1]
+        
+    def get_folder_contents(self, folder_name: str) -> List[ApplePlaylist]:
+        """
+        Return the playlists and folders directly inside a playlist folder.
+        
+        Args:
+            folder_name: Name or Persistent ID of the folder
+            
+        Returns:
+            Child playlists, in library order
+        """
+        folder = self.get_playlist(folder_name)
+        if folder is None or not folder.persistent_id:
+            return []
+        return list(self.playlist_children.get(folder.persistent_id, []))
+        
+    def close(self) -> None:
+        """Release resources (nothing to close – the library is held in memory)."""
+        pass
+
+
+def xml_library_suffix(path: str) -> Optional[str]:
+    """Return the recognised export suffix of a file name (e.g. '.xml.gz'), if any."""
+    name = path.lower()
+    for suffix in sorted(XML_OPENERS, key=len, reverse=True):
+        if name.endswith(suffix):
+            return suffix
+    return None
+
+
+def parse_ssh_location(location: str) -> Optional[Tuple[str, str, str]]:
+    """
+    Split an SSH location of the form user@host:/path into its parts.
+    
+    Args:
+        location: Path or SSH location of an export
+        
+    Returns:
+        (user, host, remote path), or None for a local path
+    """
+    if '@' not in location or ':' not in location:
+        return None
+    user, rest = location.split('@', 1)
+    host, remote_path = rest.partition(':')[::2]
+    if not user or not host or not remote_path or any(sep in user + host for sep in '/\\'):
+        return None
+    return user, host, remote_path
+
+
+def open_xml_library(xml_path: str):
+    """
+    Open an XML library export for reading as a binary stream.
+    
+    Compressed exports (.xml.gz, .xml.bz2, .xml.xz) are decompressed while
+    they are read, without writing the XML to disk.  user@host:/path
+    locations are streamed over SSH (see open_remote_xml_library()).
+    """
+    if parse_ssh_location(xml_path):
+        return open_remote_xml_library(xml_path)
+    opener = XML_OPENERS.get(xml_library_suffix(xml_path) or '.xml')
+    return opener(xml_path, 'rb')
+
+
+@contextmanager
+def open_remote_xml_library(location: str, compression: Optional[str] = None):
+    """
+    Stream an XML library export from another machine over SSH.
+    
+    The export is read straight from the SSH channel into the caller (the
+    plist parser), so downloading and parsing overlap and nothing is written
+    to local disk.  Exports that are already compressed are read over SFTP
+    with pipelined reads and decompressed locally; a plain export can
+    instead be compressed on the remote host while it is sent.
+    
+    Args:
+        location: user@host:/path/to/Library.xml[.gz|.bz2|.xz]
+        compression: Remote compression for plain exports: 'gzip', 'bzip2'
+                     or 'xz' (defaults to APPLE_XML_SSH_COMPRESS; none if empty)
+        
+    Yields:
+        Binary stream of the decompressed XML
+    """
+    import paramiko
+
+    user, host, remote_path = parse_ssh_location(location)
+    suffix = xml_library_suffix(remote_path) or '.xml'
+    compression = (SSH_COMPRESSION if compression is None else compression) or None
+    if compression and compression not in _SSH_COMPRESSORS:
+        raise ValueError(f"Unknown SSH compression '{compression}' "
+                         f"(expected one of {', '.join(_SSH_COMPRESSORS)})")
+
+    ssh_client = paramiko.SSHClient()
+    ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    ssh_client.connect(hostname=host, username=user)
+    try:
+        if compression and suffix == '.xml':
+            logger.info(f"Streaming {remote_path} from {host} ({compression}-compressed in transit)")
+            cmd = f"{_SSH_COMPRESSORS[compression]} {shlex.quote(remote_path)}"
+            stdin, stdout, stderr = ssh_client.exec_command(cmd)
+            stdin.close()
+            opener = XML_OPENERS[_SSH_COMPRESSION_SUFFIXES[compression]]
+            try:
+                with opener(stdout, 'rb') as stream:
+                    yield stream
+            except Exception as e:
+                # A missing file shows up as a parse error; report the real cause
+                if stdout.channel.exit_status_ready() and stdout.channel.recv_exit_status() != 0:
+                    error = stderr.read().decode(errors='replace').strip()
+                    raise IOError(f"'{cmd}' failed on {host}: {error}") from e
+                raise
+            status = stdout.channel.recv_exit_status()
+            if status != 0:
+                error = stderr.read().decode(errors='replace').strip()
+                raise IOError(f"'{cmd}' failed on {host} (exit {status}): {error}")
+        else:
+            logger.info(f"Streaming {remote_path} from {host} over SFTP")
+            sftp = ssh_client.open_sftp()
+            with sftp.open(remote_path, 'rb') as remote_file:
+                # Request the whole file up front instead of one block per round trip
+                remote_file.prefetch()
+                if suffix == '.xml':
+                    yield remote_file
+                else:
+                    with XML_OPENERS[suffix](remote_file, 'rb') as stream:
+                        yield stream
+            sftp.close()
+    finally:
+        ssh_client.close()
+
+
+def find_xml_library(directory: str = '.') -> Optional[str]:
+    """
+    Pick the XML library export to use from a directory.
+    
+    The most recently modified export wins; ties are broken by name so the
+    choice does not depend on directory listing order.
+    
+    Args:
+        directory: Directory to look in
+        
+    Returns:
+        Absolute path of the export, or None if there is none
+    """
+    candidates = []
+    for entry in os.scandir(directory):
+        if entry.is_file() and xml_library_suffix(entry.name):
+            candidates.append((-entry.stat().st_mtime, entry.name, entry.path))
+    if not candidates:
+        return None
+    return os.path.abspath(min(candidates)[2])
+
+
+def _epoch_seconds(value: Optional[datetime]) -> Optional[int]:
+    """Convert a plist date (naive UTC) to Unix seconds."""
+    if not isinstance(value, datetime):
+        return None
+    return int(value.replace(tzinfo=timezone.utc).timestamp())
+
+
+def load_library_snapshot(xml_path: str) -> Dict[str, Any]:
+    """
+    Parse an XML library export and return its compact snapshot.
+    
+    Module-level so it can run in a worker process; the parent rebuilds a
+    client with AppleMusicXMLClient(xml_path, snapshot=...).
+    
+    Args:
+        xml_path: Path to the iTunes/Apple Music XML library export
+        
+    Returns:
+        Dictionary produced by AppleMusicXMLClient.to_snapshot()
+    """
+    return AppleMusicXMLClient(xml_path).to_snapshot()
+
+
+def merge_library_snapshots(snapshots: List[Dict[str, Any]],
+                            precedence: str = 'newest') -> Dict[str, Any]:
+    """
+    Merge the snapshots of several libraries into one.
+    
+    Tracks are matched by path key, so the same file seen by several Macs
+    becomes one track whose metadata comes from the winning source.
+    Playlists with the same (case-insensitive) name are combined into one
+    playlist holding the tracks of each copy, earlier sources first; folders
+    are only combined with folders.  A track already taken from another
+    source is not added again, but repeats within one source are kept.
+    
+    Args:
+        snapshots: Snapshots from to_snapshot(), in priority order
+        precedence: 'newest' or 'priority' (see MERGE_PRECEDENCE)
+        
+    Returns:
+        Snapshot of the merged library
+    """
+    if precedence not in MERGE_PRECEDENCE:
+        raise ValueError(f"Unknown precedence '{precedence}' (expected one of {', '.join(MERGE_PRECEDENCE)})")
+    key_column = 2 + SNAPSHOT_FIELDS.index('path_key')
+    modified_column = 2 + SNAPSHOT_FIELDS.index('date_modified')
+    
+    # Pick the winning copy of every track
+    winners: Dict[str, tuple] = {}
+    for snapshot in snapshots:
+        for track in snapshot['tracks']:
+            key = track[key_column] or track[1]
+            current = winners.get(key)
+            if current is None or (precedence == 'newest'
+                                   and (track[modified_column] or 0) > (current[modified_column] or 0)):
+                winners[key] = track
+    
+    # Renumber the tracks; each source's track IDs map onto the merged ones
+    merged_ids = {key: track_id for track_id, key in enumerate(winners, 1)}
+    tracks = [(merged_ids[key], *track[1:]) for key, track in winners.items()]
+    
+    playlists: Dict[tuple, list] = {}
+    # Merged track ID -> index of the source that added it, per playlist
+    members: Dict[tuple, Dict[int, int]] = {}
+    renamed_ids: Dict[str, str] = {}
+    for source, snapshot in enumerate(snapshots):
+        source_ids = {track[0]: merged_ids[track[key_column] or track[1]] for track in snapshot['tracks']}
+        for name, persistent_id, parent_id, is_folder, track_ids in snapshot['playlists']:
+            key = (name.casefold(), bool(is_folder))
+            if key not in playlists:
+                playlists[key] = [name, persistent_id, parent_id, is_folder, array('l')]
+                members[key] = {}
+            elif persistent_id:
+                # Children of this copy now belong to the surviving playlist
+                renamed_ids[persistent_id] = playlists[key][1]
+            merged = playlists[key][4]
+            added_by = members[key]
+            for track_id in track_ids:
+                merged_id = source_ids.get(track_id)
+                if merged_id is not None and added_by.setdefault(merged_id, source) == source:
+                    merged.append(merged_id)
+    
+    return {
+        'tracks': tracks,
+        'playlists': [
+            (name, persistent_id, renamed_ids.get(parent_id, parent_id), is_folder, track_ids)
+            for name, persistent_id, parent_id, is_folder, track_ids in playlists.values()
+        ]
+    }
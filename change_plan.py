@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+change_plan.py - Streaming change plans for review before they are applied
+
+A plan lists every change a clean would make, one row per changed field
+(rating key, field, old value, new value, match method and Apple Music
+path).  Plans are written and read row by row as NDJSON or CSV, so a plan
+for any library size is produced and applied in constant memory, and can be
+reviewed, edited or moved to another machine in between.
+"""
+
+import csv
+import json
+from typing import Any, Iterator, List, NamedTuple, Optional, Tuple
+
+# Columns of a plan row, in CSV column order
+PLAN_COLUMNS = ('rating_key', 'field', 'old', 'new', 'method', 'apple_path')
+
+
+class PlannedTrack(NamedTuple):
+    """All planned changes of one track."""
+    rating_key: str
+    method: str
+    apple_path: Optional[str]
+    changes: List[Tuple[str, Any, Any]]  # (field, old value, new value)
+
+
+def plan_format(path: str) -> str:
+    """Return 'csv' for .csv files and 'ndjson' for anything else."""
+    return 'csv' if path.lower().endswith('.csv') else 'ndjson'
+
+
+class PlanWriter:
+    """Writes plan rows to a file as they are produced."""
+
+    def __init__(self, path: str):
+        """
+        Open the plan file.
+
+        Args:
+            path: Output file; '.csv' selects CSV, anything else NDJSON
+
+        Raises:
+            OSError: If the file cannot be created
+        """
+        self.path = path
+        self.format = plan_format(path)
+        self._file = open(path, 'w', encoding='utf-8', newline='')
+        self._csv = None
+        if self.format == 'csv':
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(PLAN_COLUMNS)
+        self.rows = 0
+
+    def write(self, rating_key: Any, field: str, old: Any, new: Any, method: str,
+              apple_path: Optional[str] = None) -> None:
+        """Write one planned field change."""
+        row = (str(rating_key), field, old, new, method, apple_path)
+        if self._csv is not None:
+            self._csv.writerow(['' if value is None else value for value in row])
+        else:
+            self._file.write(json.dumps(dict(zip(PLAN_COLUMNS, row)), ensure_ascii=False) + '\n')
+        self.rows += 1
+
+    def close(self) -> None:
+        """Flush and close the plan file."""
+        self._file.close()
+
+
+def read_plan(path: str) -> Iterator[PlannedTrack]:
+    """
+    Stream the tracks of a plan file.
+
+    Consecutive rows of the same track (as PlanWriter writes them) are
+    grouped into one PlannedTrack.  In CSV plans an empty value stands for
+    a missing one.
+
+    Args:
+        path: Plan file written by PlanWriter
+
+    Yields:
+        PlannedTrack per track, in file order
+
+    Raises:
+        ValueError: If a row lacks a rating key or field
+    """
+    with open(path, 'r', encoding='utf-8', newline='') as source:
+        if plan_format(path) == 'csv':
+            rows = (
+                {column: (value if value != '' else None) for column, value in row.items()}
+                for row in csv.DictReader(source)
+            )
+        else:
+            rows = (json.loads(line) for line in source if line.strip())
+
+        current = None
+        for number, row in enumerate(rows, 1):
+            if not row.get('rating_key') or not row.get('field'):
+                raise ValueError(f"{path}: row {number} has no rating_key or field")
+            rating_key = str(row['rating_key'])
+            if current is None or current.rating_key != rating_key:
+                if current is not None:
+                    yield current
+                current = PlannedTrack(rating_key, row.get('method') or 'plan', row.get('apple_path'), [])
+            current.changes.append((row['field'], row.get('old'), row.get('new')))
+        if current is not None:
+            yield current
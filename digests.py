@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+digests.py - Stable digests over buckets of track rows
+
+A bucket (for example all tracks of one artist) is summarised by a hash over
+its sorted rows, so two libraries can be compared bucket by bucket and only
+the buckets whose digests differ need to be looked at track by track.
+"""
+
+import hashlib
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+# Separators that cannot be confused with ordinary metadata text
+_FIELD_SEPARATOR = '\x1f'
+_ROW_SEPARATOR = b'\x1e'
+
+
+def rows_digest(rows: Iterable[Sequence]) -> str:
+    """
+    Hash a bucket of rows independently of their order.
+
+    Args:
+        rows: Rows of values (None is treated as an empty string)
+
+    Returns:
+        Hex digest
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for row in sorted(tuple('' if value is None else str(value) for value in row) for row in rows):
+        digest.update(_FIELD_SEPARATOR.join(row).encode('utf-8'))
+        digest.update(_ROW_SEPARATOR)
+    return digest.hexdigest()
+
+
+def group_rows(rows: Iterable[Sequence], key: Callable[[Sequence], str]) -> Dict[str, List[Sequence]]:
+    """Split rows into buckets by key(row)."""
+    buckets = defaultdict(list)
+    for row in rows:
+        buckets[key(row)].append(row)
+    return buckets
+
+
+def bucket_stamp(modified: Sequence[Optional[int]]) -> Optional[str]:
+    """
+    Build a cheap change stamp for a bucket from its tracks' modification times.
+
+    The stamp changes whenever a track is added, removed or modified, so an
+    unchanged stamp lets a stored digest be reused without rehashing.
+
+    Args:
+        modified: Modification time of every track in the bucket
+
+    Returns:
+        Stamp string, or None if any track has no modification time
+    """
+    if not modified or any(value is None for value in modified):
+        return None
+    return f"{len(modified)}:{max(modified)}:{sum(modified)}"
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+path_keys.py - Normalized keys for matching file paths across systems
+
+Apple Music on macOS reports decomposed (NFD) Unicode paths, while Plex on
+Linux or Windows usually reports composed (NFC) ones, with different
+separators.  Converting both sides to the same key lets accented paths hit
+the exact-match dictionary lookup instead of falling back to slower matching.
+"""
+
+import os
+import re
+import unicodedata
+from typing import Optional
+
+# Case-fold keys as well (for case-insensitive file systems such as APFS/NTFS)
+CASEFOLD_PATHS = os.environ.get('PATH_KEY_CASEFOLD', '').lower() in ('1', 'true', 'yes')
+
+_SEPARATORS = re.compile(r'[\\/]+')
+
+
+def make_path_key(path: Optional[str], casefold: Optional[bool] = None) -> Optional[str]:
+    """
+    Build the match key for a file path.
+
+    The key is NFC-normalized, uses '/' as its only separator (runs of
+    separators collapse to one) and is optionally case-folded.
+
+    Args:
+        path: File path as reported by Apple Music or Plex
+        casefold: Case-fold the key (defaults to PATH_KEY_CASEFOLD)
+
+    Returns:
+        Normalized key, or None if no path was given
+    """
+    if not path:
+        return None
+    key = _SEPARATORS.sub('/', unicodedata.normalize('NFC', path))
+    if CASEFOLD_PATHS if casefold is None else casefold:
+        key = key.casefold()
+    return key
+
+
+def basename_key(key: str) -> str:
+    """Return the file-name part of a key produced by make_path_key()."""
+    return key.rsplit('/', 1)[-1]
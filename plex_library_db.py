@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+plex_library_db.py - Read-only track snapshots from Plex's own library database
+
+When the cleaner runs on the same machine as Plex Media Server, reading
+com.plexapp.plugins.library.db directly is far faster than paging every track
+through the HTTP API.  The database is only ever opened read-only; all edits
+still go through the API (see PlexClient.update_track_metadata).
+
+The records produced here carry the same attributes the cleaner reads from
+plexapi track objects (ratingKey, title, originalTitle, parentTitle,
+grandparentTitle, media[].parts[]), so they can be used in their place.
+Field lock state is not read from the database.
+"""
+
+import logging
+import os
+import sqlite3
+from pathlib import Path
+from typing import Any, Iterator, List, NamedTuple, Optional
+
+# Open the database with immutable=1 (no locking, ignores the -wal file)
+IMMUTABLE_DB = os.environ.get('PLEX_DB_IMMUTABLE', '').lower() in ('1', 'true', 'yes')
+
+# metadata_items.metadata_type of music tracks
+TRACK_TYPE = 10
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+_TRACKS_QUERY = """
+    SELECT
+        track.id AS rating_key,
+        track.title AS title,
+        track.original_title AS original_title,
+        album.title AS album,
+        artist.title AS album_artist,
+        media.id AS media_id,
+        media.duration AS media_duration,
+        part.file AS file,
+        part.size AS size,
+        part.duration AS part_duration
+    FROM metadata_items AS track
+    LEFT JOIN metadata_items AS album ON album.id = track.parent_id
+    LEFT JOIN metadata_items AS artist ON artist.id = album.parent_id
+    LEFT JOIN media_items AS media ON media.metadata_item_id = track.id
+    LEFT JOIN media_parts AS part ON part.media_item_id = media.id
+    WHERE track.library_section_id = ? AND track.metadata_type = ? {where}
+    ORDER BY track.id, media.id, part.id
+"""
+
+
+class PlexDBPart(NamedTuple):
+    """A media part (file) of a track."""
+    file: Optional[str]
+    size: Optional[int]
+    duration: Optional[int]
+
+
+class PlexDBMedia(NamedTuple):
+    """A media item of a track."""
+    duration: Optional[int]
+    parts: List[PlexDBPart]
+
+
+class PlexDBTrack(NamedTuple):
+    """A track as stored in the Plex library database."""
+    ratingKey: int
+    title: Optional[str]
+    originalTitle: Optional[str]
+    parentTitle: Optional[str]
+    grandparentTitle: Optional[str]
+    media: List[PlexDBMedia]
+
+
+class PlexLibraryDB:
+    """Read-only access to the music tracks in a Plex library database."""
+
+    def __init__(self, db_path: str, section_id: int, immutable: Optional[bool] = None):
+        """
+        Open the database.
+
+        Args:
+            db_path: Path to com.plexapp.plugins.library.db (or a copy/fixture)
+            section_id: Music library section ID
+            immutable: Open with immutable=1 (defaults to PLEX_DB_IMMUTABLE).
+                Only safe for copies, or while Plex is not writing, since
+                changes still in the write-ahead log are not seen.
+
+        Raises:
+            sqlite3.Error: If the database cannot be opened
+        """
+        self.db_path = db_path
+        self.section_id = section_id
+        mode = 'ro&immutable=1' if (IMMUTABLE_DB if immutable is None else immutable) else 'ro'
+        # The client may be created on a loader thread and read on another
+        self.conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode={mode}", uri=True,
+                                    check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        # Fail now rather than on the first page if this is not a Plex database
+        self.conn.execute("SELECT 1 FROM metadata_items LIMIT 1").fetchall()
+        logger.info(f"Opened Plex library database read-only: {db_path}")
+
+    def count_tracks(self) -> int:
+        """Return the number of tracks in the section."""
+        row = self.conn.execute(
+            "SELECT COUNT(*) FROM metadata_items WHERE library_section_id = ? AND metadata_type = ?",
+            (self.section_id, TRACK_TYPE)
+        ).fetchone()
+        return row[0]
+
+    def iter_track_pages(self, page_size: int = 500, where: str = '',
+                         params: tuple = ()) -> Iterator[List[PlexDBTrack]]:
+        """
+        Read the section's tracks one page at a time.
+
+        Rows are streamed from a single query and grouped per track, so only
+        one page of tracks is held in memory.
+
+        Args:
+            page_size: Number of tracks per page
+            where: Extra SQL condition (starting with AND) on the query
+            params: Parameters for the extra condition
+
+        Yields:
+            Lists of at most page_size tracks
+        """
+        cursor = self.conn.execute(_TRACKS_QUERY.format(where=where),
+                                   (self.section_id, TRACK_TYPE) + tuple(params))
+        page = []
+        track = None
+        media = None
+        while True:
+            rows = cursor.fetchmany(page_size)
+            if not rows:
+                break
+            for row in rows:
+                if track is None or track.ratingKey != row['rating_key']:
+                    if track is not None:
+                        page.append(track)
+                        if len(page) >= page_size:
+                            yield page
+                            page = []
+                    track = self._row_track(row)
+                    media = None
+                if row['media_id'] is None:
+                    continue
+                if media is None or media[0] != row['media_id']:
+                    media = (row['media_id'], PlexDBMedia(row['media_duration'], []))
+                    track.media.append(media[1])
+                if row['file'] is not None:
+                    media[1].parts.append(PlexDBPart(row['file'], row['size'], row['part_duration']))
+        if track is not None:
+            page.append(track)
+        if page:
+            yield page
+
+    def get_all_tracks(self) -> List[PlexDBTrack]:
+        """Return every track of the section."""
+        return [track for page in self.iter_track_pages() for track in page]
+
+    def get_tracks_by_artist(self, artist_name: str) -> List[PlexDBTrack]:
+        """
+        Return the tracks of an artist (album artist or track artist, any case).
+
+        Args:
+            artist_name: Name of the artist
+
+        Returns:
+            List of tracks
+        """
+        where = "AND (artist.title = ? COLLATE NOCASE OR track.original_title = ? COLLATE NOCASE)"
+        return [
+            track
+            for page in self.iter_track_pages(where=where, params=(artist_name, artist_name))
+            for track in page
+        ]
+
+    @staticmethod
+    def _row_track(row: sqlite3.Row) -> PlexDBTrack:
+        """Build a track record (without media) from a query row."""
+        return PlexDBTrack(
+            ratingKey=row['rating_key'],
+            title=row['title'],
+            originalTitle=row['original_title'] or None,
+            parentTitle=row['album'],
+            grandparentTitle=row['album_artist'],
+            media=[]
+        )
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self.conn.close()
+
+
+def is_snapshot_track(track: Any) -> bool:
+    """Check whether a track came from the database rather than the API."""
+    return isinstance(track, PlexDBTrack)
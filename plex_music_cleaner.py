@@ -9,14 +9,27 @@ updates Plex to match Apple Music, and can sync playlists between the two system
 import os
 import sys
 import argparse
+import atexit
 import sqlite3
 import logging
+import logging.handlers
+import multiprocessing
+import queue
 import time
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
 import re
-from typing import Dict, List, Tuple, Optional, Set, Any
+import stat
+import urllib.parse
+import json
+import fnmatch
+import threading
+import uuid
+from array import array
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from typing import Dict, List, Tuple, Optional, Set, Any, NamedTuple, Iterable, Iterator
 from collections import defaultdict
+from itertools import islice
 
 try:
     import dotenv
@@ -33,21 +46,146 @@ except ImportError:
     from plexapi.exceptions import NotFound, Unauthorized
     import paramiko
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('plex_music_cleaner.log')
-    ]
-)
+from path_keys import make_path_key, basename_key
+from plex_library_db import PlexLibraryDB, is_snapshot_track
+from digests import rows_digest, group_rows, bucket_stamp
+from change_plan import PlanWriter, PlannedTrack, read_plan
+
+try:
+    from apple_music_xml_client import (AppleMusicXMLClient, load_library_snapshot,
+                                        find_xml_library, xml_library_suffix, parse_ssh_location,
+                                        merge_library_snapshots, MERGE_PRECEDENCE, SNAPSHOT_FIELDS)
+except ImportError:
+    AppleMusicXMLClient = None
+    load_library_snapshot = None
+    merge_library_snapshots = None
+    MERGE_PRECEDENCE = ('newest', 'priority')
+    SNAPSHOT_FIELDS = ()
+    find_xml_library = None
+    xml_library_suffix = None
+    parse_ssh_location = None
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
 logger = logging.getLogger(__name__)
+# Per-track lines (one per field change) go through their own logger so their
+# verbosity can be turned down without hiding run-level messages
+track_logger = logging.getLogger(f'{__name__}.tracks')
+
+# --track-log choices mapped to the level of the per-track logger
+TRACK_LOG_LEVELS = {'all': logging.INFO, 'warnings': logging.WARNING, 'none': logging.ERROR}
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that leaves all formatting to the writer thread."""
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The queue never leaves this process, so the record can be passed
+        # through as is instead of being formatted by the calling thread
+        return record
+
+
+def configure_logging(log_file: str = 'plex_music_cleaner.log', level: int = logging.INFO,
+                      track_log: str = 'all', progress_interval: float = 10.0,
+                      max_bytes: int = 10 * 1024 * 1024,
+                      backup_count: int = 5) -> logging.handlers.QueueListener:
+    """
+    Route all logging through a queue drained by a background writer thread.
+    
+    Callers only enqueue records; formatting and console/file I/O happen on
+    the listener thread.  The log file rotates at max_bytes.
+    
+    Args:
+        log_file: Path of the rotating log file
+        level: Level for run-level messages
+        track_log: Per-track verbosity, one of TRACK_LOG_LEVELS
+        progress_interval: Seconds between aggregated progress lines
+        max_bytes: Size at which the log file is rotated
+        backup_count: Number of rotated files to keep
+        
+    Returns:
+        The started QueueListener; call stop() before exiting to flush it
+    """
+    formatter = logging.Formatter(LOG_FORMAT)
+    console_handler = logging.StreamHandler()
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+    )
+    for handler in (console_handler, file_handler):
+        handler.setFormatter(formatter)
+    
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers[:] = [_DeferredQueueHandler(log_queue)]
+    root.setLevel(level)
+    track_logger.setLevel(TRACK_LOG_LEVELS[track_log])
+    ProgressReporter.interval = progress_interval
+    
+    listener = logging.handlers.QueueListener(log_queue, console_handler, file_handler)
+    listener.start()
+    return listener
+
+
+def _init_worker_logging(level: int) -> None:
+    """Log to the console from worker processes (the parent's queue is not shared)."""
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+
+
+class ProgressReporter:
+    """Thread-safe counters that log one aggregated progress line every few seconds."""
+    
+    # Seconds between progress lines (set by configure_logging)
+    interval = 10.0
+    
+    def __init__(self, label: str, total: Optional[int] = None):
+        """
+        Args:
+            label: What is being processed, e.g. "Compared tracks"
+            total: Expected number of items, if known
+        """
+        self.label = label
+        self.total = total
+        self.processed = 0
+        self.counters: Dict[str, int] = defaultdict(int)
+        self._started = time.monotonic()
+        self._last_report = self._started
+        self._lock = threading.Lock()
+    
+    def add(self, processed: int = 1, **counters: int) -> None:
+        """Count processed items and log a progress line if one is due."""
+        with self._lock:
+            self.processed += processed
+            for name, value in counters.items():
+                self.counters[name] += value
+            now = time.monotonic()
+            if now - self._last_report >= self.interval:
+                self._last_report = now
+                self._report(now)
+    
+    def finish(self) -> None:
+        """Log the final totals."""
+        with self._lock:
+            self._report(time.monotonic())
+    
+    def _report(self, now: float) -> None:
+        elapsed = max(now - self._started, 1e-6)
+        total = f"/{self.total}" if self.total is not None else ''
+        counters = ', '.join(f"{name} {value}" for name, value in sorted(self.counters.items()))
+        logger.info("%s: %d%s (%.0f/s)%s", self.label, self.processed, total,
+                    self.processed / elapsed, f" – {counters}" if counters else '')
+
+# Clean log field names mapped to the Plex track fields they are written to
+PLEX_FIELDS = {'title': 'title', 'artist': 'originalTitle', 'album': 'parentTitle'}
 
 class PlexClient:
     """Interface to Plex server for retrieving and updating music metadata."""
     
-    def __init__(self, url: str, token: str, section_id: int):
+    def __init__(self, url: str, token: str, section_id: int,
+                 library_db: Optional[str] = None):
         """
         Initialize connection to Plex server.
         
@@ -55,13 +193,24 @@ class PlexClient:
             url: Plex server URL
             token: Plex authentication token
             section_id: Music library section ID
+            library_db: Path to Plex's com.plexapp.plugins.library.db; when
+                given, tracks are read from it (read-only) instead of the API
         """
         self.url = url
         self.token = token
         self.section_id = section_id
         self.server = None
         self.music_section = None
+        self.library_db = None
+        # Page requests that failed, so callers can tell a partial listing
+        self.failed_pages = 0
         self.connect()
+        if library_db:
+            try:
+                self.library_db = PlexLibraryDB(library_db, section_id)
+            except sqlite3.Error as e:
+                logger.error(f"Failed to open Plex library database {library_db}: {str(e)}")
+                sys.exit(1)
         
     def connect(self) -> None:
         """Establish connection to Plex server."""
@@ -84,13 +233,67 @@ class PlexClient:
         """Retrieve all music tracks from the Plex library."""
         try:
             logger.info("Retrieving all tracks from Plex...")
-            tracks = self.music_section.searchTracks()
+            if self.library_db is not None:
+                tracks = self.library_db.get_all_tracks()
+            else:
+                tracks = self.music_section.searchTracks()
             logger.info(f"Retrieved {len(tracks)} tracks from Plex")
             return tracks
         except Exception as e:
             logger.error(f"Failed to retrieve tracks: {str(e)}")
             return []
     
+    def count_tracks(self) -> Optional[int]:
+        """Return the number of tracks in the library section, or None if unknown."""
+        try:
+            if self.library_db is not None:
+                return self.library_db.count_tracks()
+            return self.music_section.totalViewSize(libtype='track')
+        except Exception as e:
+            logger.error(f"Failed to count tracks: {str(e)}")
+            return None
+    
+    def iter_track_pages(self, page_size: int = 500) -> Iterator[List]:
+        """
+        Retrieve the library's tracks one page at a time.
+        
+        Only one page is held in memory at once, so callers can start
+        working on the first tracks while the rest are still on the server.
+        Pages are ordered by date added, which the cleaner never edits, so
+        writes made while paging cannot shift tracks between pages.  A failed
+        request ends the listing and is counted in failed_pages.
+        
+        Args:
+            page_size: Number of tracks requested per call
+            
+        Yields:
+            Lists of at most page_size track objects
+        """
+        if self.library_db is not None:
+            try:
+                yield from self.library_db.iter_track_pages(page_size)
+            except sqlite3.Error as e:
+                logger.error(f"Failed to read tracks from the Plex library database: {str(e)}")
+                self.failed_pages += 1
+            return
+        
+        start = 0
+        while True:
+            try:
+                page = self.music_section.searchTracks(
+                    sort='addedAt:asc', container_start=start, container_size=page_size,
+                    maxresults=page_size
+                )
+            except Exception as e:
+                logger.error(f"Failed to retrieve tracks {start}-{start + page_size}: {str(e)}")
+                self.failed_pages += 1
+                return
+            if page:
+                yield page
+            if len(page) < page_size:
+                return
+            start += page_size
+    
     def get_tracks_by_artist(self, artist_name: str) -> List:
         """
         Retrieve tracks filtered by artist name.
@@ -103,7 +306,10 @@ class PlexClient:
         """
         try:
             logger.info(f"Retrieving tracks for artist: {artist_name}")
-            tracks = self.music_section.searchTracks(artist=artist_name)
+            if self.library_db is not None:
+                tracks = self.library_db.get_tracks_by_artist(artist_name)
+            else:
+                tracks = self.music_section.searchTracks(artist=artist_name)
             logger.info(f"Retrieved {len(tracks)} tracks for artist '{artist_name}'")
             return tracks
         except Exception as e:
@@ -122,7 +328,7 @@ class PlexClient:
         """
         try:
             # Extract the base filename without path and extension
-            base_filename = os.path.basename(filename)
+            base_filename = basename_key(make_path_key(filename))
             name_without_ext = os.path.splitext(base_filename)[0]
             
             # Search by filename
@@ -132,7 +338,7 @@ class PlexClient:
             for track in results:
                 for media in track.media:
                     for part in media.parts:
-                        if os.path.basename(part.file) == base_filename:
+                        if part.file and basename_key(make_path_key(part.file)) == base_filename:
                             return track
                         
             # If no exact match but we have results, return the first one
@@ -144,8 +350,30 @@ class PlexClient:
             logger.error(f"Error finding track by filename '{filename}': {str(e)}")
             return None
     
+    def fetch_tracks(self, rating_keys: List[str], chunk_size: int = 200) -> Dict[str, Any]:
+        """
+        Fetch tracks directly by rating key, many per request.
+        
+        Args:
+            rating_keys: Plex rating keys to fetch
+            chunk_size: Number of items requested per call
+            
+        Returns:
+            Dictionary mapping rating keys (as strings) to track objects
+        """
+        tracks = {}
+        for i in range(0, len(rating_keys), chunk_size):
+            chunk = [str(key) for key in rating_keys[i:i + chunk_size]]
+            try:
+                for item in self.server.fetchItems(f"/library/metadata/{','.join(chunk)}"):
+                    tracks[str(item.ratingKey)] = item
+            except Exception as e:
+                logger.error(f"Failed to fetch {len(chunk)} tracks by rating key: {str(e)}")
+        return tracks
+    
     def update_track_metadata(self, track, title: str = None, artist: str = None, 
-                             album: str = None) -> bool:
+                             album: str = None, lock: bool = True,
+                             raise_errors: bool = False) -> bool:
         """
         Update metadata for a track.
         
@@ -154,6 +382,9 @@ class PlexClient:
             title: New track title
             artist: New artist name
             album: New album title
+            lock: Lock the edited fields so Plex agents don't revert them
+            raise_errors: Re-raise the error of a failed edit instead of
+                returning False, so callers can queue it for a retry
             
         Returns:
             True if update was successful, False otherwise
@@ -168,14 +399,25 @@ class PlexClient:
             
         if not update_fields:
             return False
+        
+        edits = {}
+        for field, value in update_fields.items():
+            edits[f'{field}.value'] = value
+            edits[f'{field}.locked'] = 1 if lock else 0
             
         try:
-            logger.info(f"Updating track {track.title} ({track.ratingKey}) with: {update_fields}")
-            track.edit(**update_fields)
-            track.reload()
+            track_logger.info("Updating track %s (%s) with: %s", track.title, track.ratingKey, update_fields)
+            if is_snapshot_track(track):
+                # Database records are read-only – edit through the API
+                self.server.fetchItem(int(track.ratingKey)).edit(**edits)
+            else:
+                track.edit(**edits)
+                track.reload()
             return True
         except Exception as e:
-            logger.error(f"Failed to update track {track.title}: {str(e)}")
+            track_logger.error("Failed to update track %s: %s", track.title, e)
+            if raise_errors:
+                raise
             return False
     
     def create_playlist(self, name: str, tracks: List) -> bool:
@@ -205,17 +447,175 @@ class PlexClient:
         except Exception as e:
             logger.error(f"Failed to create playlist '{name}': {str(e)}")
             return False
+    
+    def get_playlists(self) -> Dict[str, Any]:
+        """
+        Retrieve the server's audio playlists.
+        
+        Returns:
+            Dictionary mapping case-folded playlist titles to playlist objects
+        """
+        try:
+            return {playlist.title.casefold(): playlist
+                    for playlist in self.server.playlists(playlistType='audio')}
+        except Exception as e:
+            logger.error(f"Failed to retrieve playlists: {str(e)}")
+            return {}
+    
+    def reconcile_playlist(self, name: str, tracks: List,
+                           existing: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Bring a Plex playlist in line with a list of tracks using as few requests as possible.
+        
+        An identical playlist is left alone and one that only lacks tracks at
+        the end gets them appended; anything else is recreated.
+        
+        Args:
+            name: Playlist name
+            tracks: Track objects in playlist order
+            existing: Result of get_playlists() (fetched if None)
+            
+        Returns:
+            'unchanged', 'appended', 'created' or 'failed'
+        """
+        if existing is None:
+            existing = self.get_playlists()
+        playlist = existing.get(name.casefold())
+        if playlist is None or playlist.smart:
+            return 'created' if self.create_playlist(name, tracks) else 'failed'
+        
+        try:
+            current = [str(item.ratingKey) for item in playlist.items()]
+            wanted = [str(track.ratingKey) for track in tracks]
+            if current == wanted:
+                return 'unchanged'
+            if current and wanted[:len(current)] == current:
+                logger.info(f"Appending {len(wanted) - len(current)} tracks to playlist '{name}'")
+                playlist.addItems(tracks[len(current):])
+                return 'appended'
+        except Exception as e:
+            logger.error(f"Failed to update playlist '{name}': {str(e)}")
+            return 'failed'
+        return 'created' if self.create_playlist(name, tracks) else 'failed'
+    
+    def close(self) -> None:
+        """Close the Plex library database, if one was opened."""
+        if self.library_db is not None:
+            self.library_db.close()
+
+
+# Copy the Apple Music database into memory (SQLite backup API) before
+# querying it, so long reads see one point in time and never hold the live file
+APPLE_DB_SNAPSHOT = os.environ.get('APPLE_DB_SNAPSHOT', '').lower() in ('1', 'true', 'yes')
+# Bytes of a local Apple Music database to read through mmap (0 disables)
+APPLE_DB_MMAP_SIZE = int(os.environ.get('APPLE_DB_MMAP_SIZE', 256 * 1024 * 1024))
+
+
+def _sqlite_readonly_uri(db_path: str) -> str:
+    """
+    Build a read-only SQLite URI for a local, UNC or mapped-drive path.
+    
+    Path.as_uri() would turn the server of a UNC path into the URI
+    authority, which SQLite rejects; the whole path goes into the URI path
+    instead (file:////server/share/...).  As in Path.as_uri(), ':' and '/'
+    are left unquoted so drive letters stay readable (file:///C:/...).
+    """
+    path = os.path.abspath(db_path).replace('\\', '/')
+    if not path.startswith('/'):
+        path = '/' + path  # C:/... -> /C:/...
+    return f"file://{urllib.parse.quote(path, safe='/:')}?mode=ro"
+
+
+# Remembers where the database inside each .musiclibrary bundle was found
+APPLE_DB_LOCATION_CACHE = os.environ.get('APPLE_DB_LOCATION_CACHE', '.apple_db_location.json')
+# Bundle search: directory levels below the bundle, and directories listed at once
+APPLE_DB_SEARCH_DEPTH = 4
+APPLE_DB_SEARCH_WORKERS = 8
+
+# Database names preferred when a directory holds several candidates
+_PREFERRED_DB_NAMES = ('library.musicdb', 'library.db')
+
+
+def _db_candidates(directory: str) -> Tuple[Optional[str], List[str]]:
+    """
+    List one directory of a .musiclibrary bundle.
+    
+    Args:
+        directory: Directory to list
+        
+    Returns:
+        (best database file in it or None, its subdirectories)
+    """
+    files = []
+    subdirs = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                subdirs.append(entry.path)
+            elif (entry.name.lower().endswith(('.db', '.musicdb')) and 'Library' in entry.name
+                  and entry.is_file()):
+                files.append((entry.name.lower() not in _PREFERRED_DB_NAMES, entry.name, entry.path))
+    return (min(files)[2] if files else None), sorted(subdirs)
+
+
+def find_db_in_bundle(bundle_path: str, max_depth: int = APPLE_DB_SEARCH_DEPTH,
+                      workers: int = APPLE_DB_SEARCH_WORKERS) -> Optional[str]:
+    """
+    Search a .musiclibrary bundle for its database, level by level.
+    
+    All directories of one level are listed in parallel (each listing is a
+    round trip on a network share), and the search stops at the first level
+    holding a match, without listing anything deeper.  Within a level the
+    first match in sorted order wins, so the result does not depend on
+    which listing returns first.
+    
+    Args:
+        bundle_path: Bundle directory
+        max_depth: Number of directory levels below the bundle to search
+        workers: Directories listed concurrently
+        
+    Returns:
+        Path of the database, or None if there is none within max_depth
+    """
+    level = [bundle_path]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for depth in range(max_depth + 1):
+            futures = [pool.submit(_db_candidates, directory) for directory in level]
+            next_level = []
+            for future in futures:
+                try:
+                    match, subdirs = future.result()
+                except OSError as e:
+                    logger.debug(f"Skipping unreadable directory in library bundle: {e}")
+                    continue
+                if match:
+                    for pending in futures:
+                        pending.cancel()
+                    return match
+                if depth < max_depth:
+                    next_level.extend(subdirs)
+            if not next_level:
+                break
+            level = next_level
+    return None
+
+
+def _is_network_path(db_path: str) -> bool:
+    """Check whether a database path is on an SMB/UNC share."""
+    return db_path.startswith(('\\\\', '//'))
 
 
 class AppleMusicClient:
     """Interface to Apple Music library database for retrieving metadata."""
     
-    def __init__(self, library_path: str):
+    def __init__(self, library_path: str, snapshot: Optional[bool] = None):
         """
         Initialize connection to Apple Music library.
         
         Args:
             library_path: Path to the Apple Music library file or directory
+            snapshot: Query an in-memory copy of the database (defaults to
+                      APPLE_DB_SNAPSHOT)
         """
         # Normalise the incoming path – remove wrapping quotes and tidy separators
         library_path = library_path.strip().strip('"').strip("'")
@@ -226,6 +626,8 @@ class AppleMusicClient:
         self.conn = None
         self.ssh_client = None
         self.is_remote = False
+        self._item_columns = None
+        self.snapshot = APPLE_DB_SNAPSHOT if snapshot is None else snapshot
         self._find_and_connect_db()
         
     def _find_and_connect_db(self) -> None:
@@ -233,19 +635,14 @@ class AppleMusicClient:
         try:
             #
             # Search order:
-            #   1. Local path (works for regular folders and most UNC shares)
-            #   2. Network-share specific crawl (in case the UNC share lives on a
-            #      non-Windows server and local APIs fail to enumerate)
-            #   3. SSH path (user@host:/path/to/Library.musiclibrary)
+            #   1. Local path (regular folders, mapped drives and UNC shares),
+            #      starting from the location found on a previous run
+            #   2. SSH path (user@host:/path/to/Library.musiclibrary)
             #
             # Step 1 – local search first
             self._find_db_locally()
 
-            # Step 2 – fall back to explicit network-share walk
-            if not self.db_path:
-                self._find_db_on_network_share()
-
-            # Step 3 – last resort: SSH
+            # Step 2 – last resort: SSH
             is_ssh_path = (
                 not self.db_path
                 and '@' in self.library_path
@@ -260,59 +657,98 @@ class AppleMusicClient:
                 sys.exit(1)
                 
             logger.info(f"Connecting to Apple Music database at: {self.db_path}")
-            self.conn = sqlite3.connect(self.db_path)
+            self.conn = self._connect_db()
             self.conn.row_factory = sqlite3.Row
             logger.info("Connected to Apple Music database")
         except Exception as e:
             logger.error(f"Failed to connect to Apple Music database: {str(e)}")
             sys.exit(1)
     
-    def _find_db_locally(self) -> None:
-        """Find the database file in a local directory."""
-        path = Path(self.library_path)
+    def _connect_db(self) -> sqlite3.Connection:
+        """
+        Open the located database read-only.
         
-        # If direct path to the database file
-        if path.is_file() and path.suffix.lower() in ('.db', '.musicdb', '.musiclibrary'):
-            self.db_path = str(path)
-            logger.info(f"Found Apple Music database locally: {self.db_path}")
-            return
-            
-        # If it's the .musiclibrary bundle/directory
-        if path.is_dir():
-            # Look for SQLite database inside
-            for db_file in path.rglob('*'):
-                if (
-                    db_file.is_file()
-                    and db_file.suffix.lower() in ('.db', '.musicdb')
-                    and 'Library' in db_file.name
-                ):
-                    self.db_path = str(db_file)
-                    logger.info(f"Located Apple Music database locally: {self.db_path}")
-                    return
-    
-    def _find_db_on_network_share(self) -> None:
-        """Find the database file on a network share."""
+        The database is opened in read-only URI mode, so the cleaner never
+        takes a write lock on a library Music.app may be using.  Local files
+        are read through mmap (unsafe on network shares, where it stays off).
+        With snapshot enabled the whole database is copied into memory in
+        one backup step and the file is released before any query runs.
+        
+        Returns:
+            Connection to the database (or to its in-memory copy)
+        """
+        conn = sqlite3.connect(_sqlite_readonly_uri(self.db_path), uri=True)
+        if APPLE_DB_MMAP_SIZE and not _is_network_path(self.db_path):
+            conn.execute(f"PRAGMA mmap_size = {int(APPLE_DB_MMAP_SIZE)}")
+        # Fail now rather than on the first query if this is not a database
+        conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+        if not self.snapshot:
+            return conn
+        
+        memory = sqlite3.connect(':memory:')
         try:
-            # For network shares, we need to handle paths differently
-            path = Path(self.library_path)
+            conn.backup(memory)
+        finally:
+            conn.close()
+        logger.info("Copied Apple Music database into memory")
+        return memory
+    
+    def _find_db_locally(self) -> None:
+        """Find the database file in a local directory or on a network share."""
+        # A location cached by an earlier run costs a single stat to confirm
+        cached_path = self._load_cached_db_path()
+        if cached_path:
+            try:
+                if stat.S_ISREG(os.stat(cached_path).st_mode):
+                    self.db_path = cached_path
+                    logger.info(f"Using cached Apple Music database location: {self.db_path}")
+                    return
+            except OSError:
+                pass
+            logger.info(f"Cached Apple Music database location is gone: {cached_path}")
             
+        try:
             # If direct path to the database file
-            if os.path.isfile(self.library_path) and self.library_path.endswith(('.db', '.musicdb')):
-                self.db_path = self.library_path
-                logger.info(f"Found Apple Music database on network share: {self.db_path}")
+            if os.path.isfile(self.library_path):
+                if self.library_path.lower().endswith(('.db', '.musicdb', '.musiclibrary')):
+                    self.db_path = self.library_path
+                    logger.info(f"Found Apple Music database locally: {self.db_path}")
                 return
                 
             # If it's the .musiclibrary bundle/directory
             if os.path.isdir(self.library_path):
-                # Look for SQLite database inside
-                for root, dirs, files in os.walk(self.library_path):
-                    for file in files:
-                        if file.endswith(('.db', '.musicdb')) and 'Library' in file:
-                            self.db_path = os.path.join(root, file)
-                            logger.info(f"Located Apple Music database on network share: {self.db_path}")
-                            return
-        except Exception as e:
-            logger.error(f"Error accessing network share: {str(e)}")
+                self.db_path = find_db_in_bundle(self.library_path)
+                if self.db_path:
+                    logger.info(f"Located Apple Music database: {self.db_path}")
+                    self._save_cached_db_path(self.db_path)
+        except OSError as e:
+            logger.error(f"Error searching for Apple Music database: {str(e)}")
+    
+    def _load_cached_db_path(self) -> Optional[str]:
+        """Return the database location cached for this library path, if any."""
+        try:
+            with open(APPLE_DB_LOCATION_CACHE, 'r', encoding='utf-8') as f:
+                return json.load(f).get(self.library_path)
+        except (OSError, ValueError, AttributeError):
+            return None
+    
+    def _save_cached_db_path(self, db_path: str) -> None:
+        """Remember the database location for this library path."""
+        try:
+            with open(APPLE_DB_LOCATION_CACHE, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+            if not isinstance(cache, dict):
+                cache = {}
+        except (OSError, ValueError):
+            cache = {}
+        cache[self.library_path] = db_path
+        try:
+            temp_path = f"{APPLE_DB_LOCATION_CACHE}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(cache, f, indent=2)
+            os.replace(temp_path, APPLE_DB_LOCATION_CACHE)
+        except OSError as e:
+            logger.warning(f"Could not cache Apple Music database location: {str(e)}")
     
     def _find_db_via_ssh(self) -> None:
         """Find the database file via SSH connection."""
@@ -379,12 +815,16 @@ class AppleMusicClient:
             cursor = self.conn.cursor()
             
             # Query to get track metadata including file paths
-            query = """
+            query = f"""
             SELECT 
                 item.title, 
                 artist.name as artist_name,
                 album.title as album_title,
-                item.location as file_path
+                item.location as file_path,
+                {self._item_column('file_size', 'size')},
+                {self._item_column('total_time', 'duration')},
+                {self._item_column('date_modified', 'date_modified')},
+                item.persistent_id as persistent_id
             FROM 
                 item
             LEFT JOIN 
@@ -404,11 +844,7 @@ class AppleMusicClient:
                 # Apple Music stores file paths in a special format that needs decoding
                 file_path = self._decode_apple_file_path(row['file_path'])
                 if file_path:
-                    tracks_by_filename[file_path] = {
-                        'title': row['title'],
-                        'artist': row['artist_name'],
-                        'album': row['album_title']
-                    }
+                    tracks_by_filename[file_path] = self._row_metadata(row, file_path)
             
             logger.info(f"Retrieved {len(tracks_by_filename)} tracks from Apple Music")
             return tracks_by_filename
@@ -431,12 +867,16 @@ class AppleMusicClient:
             cursor = self.conn.cursor()
             
             # Query to get track metadata for a specific artist
-            query = """
+            query = f"""
             SELECT 
                 item.title, 
                 artist.name as artist_name,
                 album.title as album_title,
-                item.location as file_path
+                item.location as file_path,
+                {self._item_column('file_size', 'size')},
+                {self._item_column('total_time', 'duration')},
+                {self._item_column('date_modified', 'date_modified')},
+                item.persistent_id as persistent_id
             FROM 
                 item
             LEFT JOIN 
@@ -456,11 +896,7 @@ class AppleMusicClient:
             for row in rows:
                 file_path = self._decode_apple_file_path(row['file_path'])
                 if file_path:
-                    tracks_by_filename[file_path] = {
-                        'title': row['title'],
-                        'artist': row['artist_name'],
-                        'album': row['album_title']
-                    }
+                    tracks_by_filename[file_path] = self._row_metadata(row, file_path)
             
             logger.info(f"Retrieved {len(tracks_by_filename)} tracks for artist '{artist_name}' from Apple Music")
             return tracks_by_filename
@@ -468,12 +904,26 @@ class AppleMusicClient:
             logger.error(f"Failed to retrieve tracks for artist '{artist_name}' from Apple Music: {str(e)}")
             return {}
     
+    def get_playlist_names(self) -> List[str]:
+        """Return the names of all playlists in the Apple Music library."""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT name FROM playlist WHERE name IS NOT NULL ORDER BY name")
+            return [row['name'] for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Failed to retrieve playlist names from Apple Music: {str(e)}")
+            return []
+    
     def get_playlist_tracks(self, playlist_name: str) -> List[str]:
         """
         Retrieve tracks in a playlist from Apple Music library.
         
+        The playlist is looked up by exact name, then by Persistent ID; only
+        if neither matches is the name taken as a substring of a playlist
+        name, so an enumerated name never resolves to a longer one.
+        
         Args:
-            playlist_name: Name of the playlist
+            playlist_name: Name (or Persistent ID) of the playlist
             
         Returns:
             List of file paths for tracks in the playlist
@@ -483,54 +933,78 @@ class AppleMusicClient:
             cursor = self.conn.cursor()
             
             # First get the playlist ID
-            query = """
-            SELECT 
-                persistent_id
-            FROM 
-                playlist
-            WHERE 
-                name LIKE ?
-            """
-            
-            cursor.execute(query, (f"%{playlist_name}%",))
-            playlist_row = cursor.fetchone()
+            playlist_row = None
+            for condition, value in (("name = ?", playlist_name),
+                                     ("persistent_id = ?", playlist_name),
+                                     ("name LIKE ?", f"%{playlist_name}%")):
+                cursor.execute(f"SELECT persistent_id FROM playlist WHERE {condition} ORDER BY name",
+                               (value,))
+                playlist_row = cursor.fetchone()
+                if playlist_row:
+                    break
             
             if not playlist_row:
                 logger.error(f"Playlist '{playlist_name}' not found in Apple Music")
                 return []
-                
-            playlist_id = playlist_row['persistent_id']
-            
-            # Now get the tracks in the playlist
-            query = """
-            SELECT 
-                item.location as file_path
-            FROM 
-                playlist_item
-            JOIN 
-                item ON playlist_item.track_id = item.persistent_id
-            WHERE 
-                playlist_item.playlist_id = ?
-            ORDER BY 
-                playlist_item.position
-            """
-            
-            cursor.execute(query, (playlist_id,))
-            rows = cursor.fetchall()
-            
-            # Process results
-            track_paths = []
-            for row in rows:
-                file_path = self._decode_apple_file_path(row['file_path'])
-                if file_path:
-                    track_paths.append(file_path)
             
+            track_paths = self._playlist_track_paths(playlist_row['persistent_id'])
             logger.info(f"Retrieved {len(track_paths)} tracks for playlist '{playlist_name}' from Apple Music")
             return track_paths
         except Exception as e:
             logger.error(f"Failed to retrieve tracks for playlist '{playlist_name}' from Apple Music: {str(e)}")
             return []
     
+    def _playlist_track_paths(self, playlist_id: str) -> List[str]:
+        """Return the file paths of a playlist's tracks, in playlist order."""
+        query = """
+        SELECT 
+            item.location as file_path
+        FROM 
+            playlist_item
+        JOIN 
+            item ON playlist_item.track_id = item.persistent_id
+        WHERE 
+            playlist_item.playlist_id = ?
+        ORDER BY 
+            playlist_item.position
+        """
+        cursor = self.conn.cursor()
+        cursor.execute(query, (playlist_id,))
+        track_paths = []
+        for row in cursor.fetchall():
+            file_path = self._decode_apple_file_path(row['file_path'])
+            if file_path:
+                track_paths.append(file_path)
+        return track_paths
+    
+    def _item_column(self, column: str, alias: str) -> str:
+        """
+        Return a SELECT expression for an optional column of the item table.
+        
+        Library database schemas differ between Music.app releases, so
+        columns that only some versions have are selected as NULL when absent.
+        """
+        if self._item_columns is None:
+            cursor = self.conn.cursor()
+            self._item_columns = {row[1] for row in cursor.execute('PRAGMA table_info(item)')}
+        if column in self._item_columns:
+            return f"item.{column} as {alias}"
+        return f"NULL as {alias}"
+    
+    @staticmethod
+    def _row_metadata(row: sqlite3.Row, file_path: str) -> Dict[str, Any]:
+        """Convert a track query row into a metadata dictionary."""
+        return {
+            'title': row['title'],
+            'artist': row['artist_name'],
+            'album': row['album_title'],
+            'size': row['size'],
+            'duration': row['duration'],
+            'persistent_id': row['persistent_id'],
+            'path_key': make_path_key(file_path),
+            'date_modified': row['date_modified']
+        }
+    
     def _decode_apple_file_path(self, encoded_path: str) -> Optional[str]:
         """
         Decode Apple Music's encoded file paths.
@@ -576,6 +1050,39 @@ class AppleMusicClient:
             logger.error(f"Failed to decode Apple Music file path: {str(e)}")
             return None
     
+    def to_snapshot(self) -> Dict[str, Any]:
+        """
+        Return the library in the snapshot format of AppleMusicXMLClient.
+        
+        Lets a database be loaded in a worker process and merged with other
+        libraries (see load_merged_library()).
+        
+        Returns:
+            Dictionary with 'tracks' and 'playlists' lists
+        """
+        tracks = self.get_all_tracks()
+        for metadata in tracks.values():
+            # Missing names read as '', as in an XML export (artist and album
+            # come from LEFT JOINs)
+            for field in ('title', 'artist', 'album'):
+                if metadata[field] is None:
+                    metadata[field] = ''
+        path_ids = {path: track_id for track_id, path in enumerate(tracks, 1)}
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT persistent_id, name FROM playlist WHERE name IS NOT NULL ORDER BY name")
+        playlists = []
+        for row in cursor.fetchall():
+            track_ids = array('l', (path_ids[path] for path in self._playlist_track_paths(row['persistent_id'])
+                                    if path in path_ids))
+            playlists.append((row['name'], row['persistent_id'], None, False, track_ids))
+        return {
+            'tracks': [
+                (track_id, path, *(tracks[path][field] for field in SNAPSHOT_FIELDS))
+                for path, track_id in path_ids.items()
+            ],
+            'playlists': playlists
+        }
+    
     def close(self) -> None:
         """Close database connection and clean up resources."""
         if self.conn:
@@ -593,24 +1100,41 @@ class AppleMusicClient:
                 logger.error(f"Failed to remove temporary database file: {str(e)}")
 
 
+# Backoff for queued failed writes: first retry after RETRY_BASE_DELAY seconds,
+# doubling per attempt up to RETRY_MAX_DELAY; automatic retries stop after
+# RETRY_MAX_ATTEMPTS (retry-failed --all still picks them up)
+RETRY_BASE_DELAY = 60
+RETRY_MAX_DELAY = 6 * 60 * 60
+RETRY_MAX_ATTEMPTS = 10
+
+
 class CleanLogger:
     """Logger for tracking metadata changes and processed tracks."""
     
-    def __init__(self, db_path: str = "plex_clean_log.db"):
+    def __init__(self, db_path: str = "plex_clean_log.db", command: str = ''):
         """
         Initialize the cleaning log database.
         
+        Every change written through this logger is tagged with a new run
+        ID, so the whole run can be undone later (see undo_run()).
+        
         Args:
             db_path: Path to the SQLite database file
+            command: Command of this run, shown when listing runs
         """
         self.db_path = db_path
         self.conn = None
+        self.command = command
+        self.run_id = f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+        self._run_recorded = False
+        # One connection is shared by every worker thread of a run
+        self._lock = threading.Lock()
         self._initialize_db()
         
     def _initialize_db(self) -> None:
         """Create the database and tables if they don't exist."""
         try:
-            self.conn = sqlite3.connect(self.db_path)
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
             cursor = self.conn.cursor()
             
             # Create table for tracking cleaned tracks
@@ -621,112 +1145,753 @@ class CleanLogger:
                 field TEXT NOT NULL,
                 old_value TEXT,
                 new_value TEXT,
-                timestamp TEXT NOT NULL
+                timestamp TEXT NOT NULL,
+                target TEXT NOT NULL DEFAULT ''
+            )
+            ''')
+            
+            # Older logs predate multi-target runs and run IDs – add the columns in place
+            columns = {row[1] for row in cursor.execute('PRAGMA table_info(cleaned)')}
+            if 'target' not in columns:
+                cursor.execute("ALTER TABLE cleaned ADD COLUMN target TEXT NOT NULL DEFAULT ''")
+            if 'run_id' not in columns:
+                cursor.execute("ALTER TABLE cleaned ADD COLUMN run_id TEXT")
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_cleaned_run ON cleaned (run_id, target)')
+            
+            # One row per run that changed (or tried to change) anything
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                command TEXT,
+                started TEXT NOT NULL,
+                undone_by TEXT
+            )
+            ''')
+            
+            # Create table for remembering which Apple track each Plex track is
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS matches (
+                target TEXT NOT NULL DEFAULT '',
+                plex_rating_key TEXT NOT NULL,
+                apple_persistent_id TEXT NOT NULL,
+                method TEXT NOT NULL,
+                confidence REAL NOT NULL,
+                plex_path TEXT,
+                plex_size INTEGER,
+                apple_path TEXT,
+                apple_size INTEGER,
+                timestamp TEXT NOT NULL,
+                PRIMARY KEY (target, plex_rating_key)
+            )
+            ''')
+            cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_matches_apple
+            ON matches (target, apple_persistent_id)
+            ''')
+            
+            # Indexes over the change history
+            cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_cleaned_track
+            ON cleaned (target, plex_rating_key, field)
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_cleaned_timestamp ON cleaned (timestamp)')
+            
+            # Materialized current state: one row per cleaned field, kept up
+            # to date on every write so reads never scan the history
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS track_state (
+                target TEXT NOT NULL DEFAULT '',
+                plex_rating_key TEXT NOT NULL,
+                field TEXT NOT NULL,
+                original_value TEXT,
+                new_value TEXT,
+                changes INTEGER NOT NULL DEFAULT 1,
+                timestamp TEXT NOT NULL,
+                PRIMARY KEY (target, plex_rating_key, field)
+            )
+            ''')
+            
+            # Running counters behind get_stats()
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS clean_stats (
+                target TEXT NOT NULL DEFAULT '',
+                metric TEXT NOT NULL,
+                value INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (target, metric)
+            )
+            ''')
+            
+            # Per-day totals of history folded away by compact()
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS cleaned_summary (
+                day TEXT NOT NULL,
+                target TEXT NOT NULL DEFAULT '',
+                field TEXT NOT NULL,
+                changes INTEGER NOT NULL,
+                PRIMARY KEY (day, target, field)
+            )
+            ''')
+            
+            # Dead-letter queue of Plex writes that failed, retried with backoff
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS failed_writes (
+                target TEXT NOT NULL DEFAULT '',
+                plex_rating_key TEXT NOT NULL,
+                changes TEXT NOT NULL,
+                intended TEXT NOT NULL,
+                apple_path TEXT,
+                attempts INTEGER NOT NULL DEFAULT 1,
+                last_error TEXT,
+                first_failed TEXT NOT NULL,
+                next_attempt TEXT NOT NULL,
+                PRIMARY KEY (target, plex_rating_key)
+            )
+            ''')
+            columns = {row[1] for row in cursor.execute('PRAGMA table_info(failed_writes)')}
+            if 'run_id' not in columns:
+                cursor.execute("ALTER TABLE failed_writes ADD COLUMN run_id TEXT")
+            cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_failed_writes_due
+            ON failed_writes (target, next_attempt)
+            ''')
+            
+            # Per-artist digests from the last verify run, per library side
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS digests (
+                target TEXT NOT NULL DEFAULT '',
+                side TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                stamp TEXT,
+                track_count INTEGER NOT NULL,
+                timestamp TEXT NOT NULL,
+                PRIMARY KEY (target, side, bucket)
             )
             ''')
             
+            self._materialize_history(cursor)
             self.conn.commit()
             logger.debug(f"Initialized clean log database at {self.db_path}")
         except Exception as e:
             logger.error(f"Failed to initialize clean log database: {str(e)}")
             sys.exit(1)
     
+    def _materialize_history(self, cursor: sqlite3.Cursor) -> None:
+        """Build track_state and clean_stats from an older log that lacks them."""
+        # clean_stats only empties with the whole log, while an undo can
+        # leave track_state empty on purpose (see finish_undo())
+        if cursor.execute('SELECT 1 FROM clean_stats LIMIT 1').fetchone():
+            return
+        if cursor.execute('SELECT 1 FROM track_state LIMIT 1').fetchone():
+            return
+        if not cursor.execute('SELECT 1 FROM cleaned LIMIT 1').fetchone():
+            return
+        
+        logger.info("Building clean log state tables from existing history...")
+        cursor.execute('''
+        INSERT INTO track_state (target, plex_rating_key, field, original_value,
+                                 new_value, changes, timestamp)
+        SELECT history.target, history.plex_rating_key, history.field,
+               first.old_value, last.new_value, history.changes, last.timestamp
+        FROM (
+            SELECT target, plex_rating_key, field, MIN(id) AS first_id,
+                   MAX(id) AS last_id, COUNT(*) AS changes
+            FROM cleaned
+            GROUP BY target, plex_rating_key, field
+        ) AS history
+        JOIN cleaned AS first ON first.id = history.first_id
+        JOIN cleaned AS last ON last.id = history.last_id
+        ''')
+        cursor.execute('''
+        INSERT OR REPLACE INTO clean_stats (target, metric, value)
+        SELECT target, 'total_changes', COUNT(*) FROM cleaned GROUP BY target
+        UNION ALL
+        SELECT target, 'field:' || field, COUNT(*) FROM cleaned GROUP BY target, field
+        UNION ALL
+        SELECT target, 'tracks_changed', COUNT(DISTINCT plex_rating_key) FROM cleaned GROUP BY target
+        ''')
+    
+    def _record_run(self, cursor: sqlite3.Cursor) -> None:
+        """Register this run the first time it writes anything."""
+        if not self._run_recorded:
+            cursor.execute('INSERT OR IGNORE INTO runs (run_id, command, started) VALUES (?, ?, ?)',
+                           (self.run_id, self.command, datetime.now().isoformat()))
+            self._run_recorded = True
+    
+    @staticmethod
+    def _bump(cursor: sqlite3.Cursor, target: str, metric: str, amount: int = 1) -> None:
+        """Increment one of the clean_stats counters."""
+        cursor.execute('''
+        INSERT INTO clean_stats (target, metric, value) VALUES (?, ?, ?)
+        ON CONFLICT (target, metric) DO UPDATE SET value = value + excluded.value
+        ''', (target, metric, amount))
+    
     def record_change(self, rating_key: str, field: str, old_value: str, 
-                     new_value: str) -> None:
+                     new_value: str, target: str = '') -> None:
         """
         Record a metadata change in the log.
         
+        The history row, the track's current state and the statistics
+        counters are written in one transaction.
+        
         Args:
             rating_key: Plex rating key for the track
             field: Metadata field that was changed
             old_value: Previous value
             new_value: New value
+            target: Name of the Plex target the track belongs to
         """
         try:
-            cursor = self.conn.cursor()
             timestamp = datetime.now().isoformat()
+            rating_key = str(rating_key)
             
-            cursor.execute('''
-            INSERT INTO cleaned (plex_rating_key, field, old_value, new_value, timestamp)
-            VALUES (?, ?, ?, ?, ?)
-            ''', (rating_key, field, old_value, new_value, timestamp))
-            
-            self.conn.commit()
+            with self._lock:
+                cursor = self.conn.cursor()
+                self._record_run(cursor)
+                cursor.execute('''
+                INSERT INTO cleaned (plex_rating_key, field, old_value, new_value, timestamp, target,
+                                     run_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (rating_key, field, old_value, new_value, timestamp, target, self.run_id))
+                
+                new_track = cursor.execute(
+                    'SELECT 1 FROM track_state WHERE target = ? AND plex_rating_key = ? LIMIT 1',
+                    (target, rating_key)
+                ).fetchone() is None
+                cursor.execute('''
+                INSERT INTO track_state (target, plex_rating_key, field, original_value,
+                                         new_value, changes, timestamp)
+                VALUES (?, ?, ?, ?, ?, 1, ?)
+                ON CONFLICT (target, plex_rating_key, field) DO UPDATE SET
+                    new_value = excluded.new_value,
+                    changes = changes + 1,
+                    timestamp = excluded.timestamp
+                ''', (target, rating_key, field, old_value, new_value, timestamp))
+                
+                self._bump(cursor, target, 'total_changes')
+                self._bump(cursor, target, f'field:{field}')
+                if new_track:
+                    self._bump(cursor, target, 'tracks_changed')
+                
+                self.conn.commit()
         except Exception as e:
             logger.error(f"Failed to record change: {str(e)}")
     
-    def is_track_cleaned(self, rating_key: str, field: str) -> bool:
+    def is_track_cleaned(self, rating_key: str, field: str, target: str = '') -> bool:
         """
         Check if a track has already been cleaned for a specific field.
         
         Args:
             rating_key: Plex rating key for the track
             field: Metadata field to check
+            target: Name of the Plex target the track belongs to
             
         Returns:
             True if the track field has been cleaned, False otherwise
         """
         try:
-            cursor = self.conn.cursor()
-            
-            cursor.execute('''
-            SELECT COUNT(*) FROM cleaned
-            WHERE plex_rating_key = ? AND field = ?
-            ''', (rating_key, field))
-            
-            count = cursor.fetchone()[0]
-            return count > 0
+            with self._lock:
+                cursor = self.conn.cursor()
+                cursor.execute('''
+                SELECT 1 FROM track_state
+                WHERE target = ? AND plex_rating_key = ? AND field = ?
+                ''', (target, str(rating_key), field))
+                
+                return cursor.fetchone() is not None
         except Exception as e:
             logger.error(f"Failed to check if track is cleaned: {str(e)}")
             return False
     
-    def get_cleaned_tracks(self) -> Set[str]:
+    def get_cleaned_tracks(self, target: str = '') -> Set[str]:
         """
         Get the set of all track rating keys that have been cleaned.
         
+        Args:
+            target: Name of the Plex target to restrict the lookup to
+            
         Returns:
-            Set of Plex rating keys
+            Set of Plex rating keys (as strings)
         """
         try:
-            cursor = self.conn.cursor()
-            
-            cursor.execute('SELECT DISTINCT plex_rating_key FROM cleaned')
-            
-            return {row[0] for row in cursor.fetchall()}
+            with self._lock:
+                cursor = self.conn.cursor()
+                cursor.execute(
+                    'SELECT DISTINCT plex_rating_key FROM track_state WHERE target = ?',
+                    (target,)
+                )
+                return {row[0] for row in cursor.fetchall()}
         except Exception as e:
             logger.error(f"Failed to get cleaned tracks: {str(e)}")
             return set()
     
-    def get_stats(self) -> Dict[str, int]:
+    def get_last_values(self, target: str = '',
+                        rating_keys: Optional[List[str]] = None) -> Dict[str, Dict[str, str]]:
         """
-        Get statistics about the cleaning process.
+        Get the most recent value written to each field of cleaned tracks.
         
-        Returns:
-            Dictionary with statistics
+        Args:
+            target: Name of the Plex target to restrict the lookup to
+            rating_keys: Only look up these tracks (all cleaned tracks if None)
+            
+        Returns:
+            Dictionary mapping rating keys to {field: last new_value}; tracks
+            that were never cleaned are absent
         """
         try:
+            select = 'SELECT plex_rating_key, field, new_value FROM track_state WHERE target = ?'
+            last_values = defaultdict(dict)
+            with self._lock:
+                cursor = self.conn.cursor()
+                if rating_keys is None:
+                    batches = [cursor.execute(select, (target,)).fetchall()]
+                else:
+                    keys = [str(key) for key in rating_keys]
+                    batches = (
+                        cursor.execute(
+                            f"{select} AND plex_rating_key IN ({','.join('?' * len(chunk))})",
+                            (target, *chunk)
+                        ).fetchall()
+                        for chunk in (keys[i:i + 500] for i in range(0, len(keys), 500))
+                    )
+                for rows in batches:
+                    for rating_key, field, new_value in rows:
+                        last_values[rating_key][field] = new_value
+            return dict(last_values)
+        except Exception as e:
+            logger.error(f"Failed to get last written values: {str(e)}")
+            return {}
+    
+    def compact(self, older_than_days: int) -> int:
+        """
+        Fold old change history into per-day summaries.
+        
+        Current state and statistics are unaffected; only the individual
+        history rows older than the cutoff are replaced by daily totals.
+        
+        Args:
+            older_than_days: Keep individual rows newer than this many days
+            
+        Returns:
+            Number of history rows folded away
+        """
+        cutoff = datetime.fromtimestamp(time.time() - older_than_days * 86400).isoformat()
+        try:
+            with self._lock:
+                cursor = self.conn.cursor()
+                cursor.execute('''
+                INSERT INTO cleaned_summary (day, target, field, changes)
+                SELECT substr(timestamp, 1, 10), target, field, COUNT(*)
+                FROM cleaned WHERE timestamp < ?
+                GROUP BY substr(timestamp, 1, 10), target, field
+                ON CONFLICT (day, target, field) DO UPDATE SET
+                    changes = changes + excluded.changes
+                ''', (cutoff,))
+                cursor.execute('DELETE FROM cleaned WHERE timestamp < ?', (cutoff,))
+                folded = cursor.rowcount
+                self.conn.commit()
+                if folded:
+                    self.conn.execute('VACUUM')
+            logger.info(f"Compacted {folded} clean log rows older than {older_than_days} days")
+            return folded
+        except Exception as e:
+            logger.error(f"Failed to compact clean log: {str(e)}")
+            return 0
+    
+    def _fetch_matches(self, column: str, values: Optional[List[str]],
+                       target: str) -> List[Dict[str, Any]]:
+        """Select match rows for the given values of a column, in chunks."""
+        select = 'SELECT * FROM matches WHERE target = ?'
+        with self._lock:
             cursor = self.conn.cursor()
+            if values is None:
+                cursor.execute(select, (target,))
+                rows = cursor.fetchall()
+            else:
+                rows = []
+                for i in range(0, len(values), 500):
+                    chunk = values[i:i + 500]
+                    cursor.execute(
+                        f"{select} AND {column} IN ({','.join('?' * len(chunk))})",
+                        (target, *chunk)
+                    )
+                    rows.extend(cursor.fetchall())
+            names = [description[0] for description in cursor.description or []]
+        return [dict(zip(names, row)) for row in rows]
+    
+    def get_matches(self, target: str = '',
+                    rating_keys: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Get remembered Plex ↔ Apple Music track pairs.
+        
+        Args:
+            target: Name of the Plex target the pairs belong to
+            rating_keys: Only return pairs for these Plex tracks (all if None)
+            
+        Returns:
+            Dictionary mapping rating keys to match rows
+        """
+        try:
+            keys = [str(key) for key in rating_keys] if rating_keys is not None else None
+            return {row['plex_rating_key']: row
+                    for row in self._fetch_matches('plex_rating_key', keys, target)}
+        except Exception as e:
+            logger.error(f"Failed to get cached matches: {str(e)}")
+            return {}
+    
+    def get_matches_by_persistent_id(self, persistent_ids: List[str],
+                                     target: str = '') -> Dict[str, Dict[str, Any]]:
+        """
+        Get remembered pairs by Apple Music Persistent ID.
+        
+        Args:
+            persistent_ids: Apple Music Persistent IDs to look up
+            target: Name of the Plex target the pairs belong to
+            
+        Returns:
+            Dictionary mapping Persistent IDs to match rows
+        """
+        try:
+            return {row['apple_persistent_id']: row
+                    for row in self._fetch_matches('apple_persistent_id', persistent_ids, target)}
+        except Exception as e:
+            logger.error(f"Failed to get cached matches: {str(e)}")
+            return {}
+    
+    def record_matches(self, matches: List[Tuple], target: str = '') -> None:
+        """
+        Remember Plex ↔ Apple Music track pairs for later runs.
+        
+        Args:
+            matches: Tuples of (rating_key, apple_persistent_id, method,
+                     confidence, plex_path, plex_size, apple_path, apple_size)
+            target: Name of the Plex target the pairs belong to
+        """
+        if not matches:
+            return
+        try:
+            timestamp = datetime.now().isoformat()
+            with self._lock:
+                cursor = self.conn.cursor()
+                cursor.executemany('''
+                INSERT OR REPLACE INTO matches (target, plex_rating_key, apple_persistent_id,
+                    method, confidence, plex_path, plex_size, apple_path, apple_size, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', [(target, str(match[0]), *match[1:], timestamp) for match in matches])
+                self.conn.commit()
+        except Exception as e:
+            logger.error(f"Failed to record matches: {str(e)}")
+    
+    def forget_matches(self, rating_keys: List[str], target: str = '') -> None:
+        """
+        Drop remembered pairs that no longer hold.
+        
+        Args:
+            rating_keys: Plex rating keys whose pairs are stale
+            target: Name of the Plex target the pairs belong to
+        """
+        if not rating_keys:
+            return
+        try:
+            with self._lock:
+                cursor = self.conn.cursor()
+                cursor.executemany(
+                    'DELETE FROM matches WHERE target = ? AND plex_rating_key = ?',
+                    [(target, str(key)) for key in rating_keys]
+                )
+                self.conn.commit()
+        except Exception as e:
+            logger.error(f"Failed to forget matches: {str(e)}")
+    
+    def record_failed_write(self, rating_key: str, changes: List[Tuple[str, Any, Any]],
+                            intended: Dict[str, Any], error: str, target: str = '',
+                            apple_path: Optional[str] = None) -> int:
+        """
+        Add a failed write to the retry queue, or count another failed attempt.
+        
+        The next attempt is scheduled with exponential backoff
+        (RETRY_BASE_DELAY doubling per attempt, capped at RETRY_MAX_DELAY).
+        
+        Args:
+            rating_key: Plex rating key of the track
+            changes: (field, old value, new value) changes that were not written
+            intended: Wanted title, artist and album
+            error: Error message of the failed attempt
+            target: Name of the Plex target
+            apple_path: Path of the Apple Music track the values came from
+            
+        Returns:
+            Number of failed attempts so far
+        """
+        now = datetime.now()
+        try:
+            with self._lock:
+                cursor = self.conn.cursor()
+                cursor.execute(
+                    'SELECT attempts FROM failed_writes WHERE target = ? AND plex_rating_key = ?',
+                    (target, str(rating_key))
+                )
+                row = cursor.fetchone()
+                attempts = (row[0] if row else 0) + 1
+                delay = min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+                self._record_run(cursor)
+                # A retried entry keeps the run ID of the run that planned it
+                cursor.execute(
+                    '''INSERT INTO failed_writes
+                    (target, plex_rating_key, changes, intended, apple_path, attempts,
+                     last_error, first_failed, next_attempt, run_id)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (target, plex_rating_key) DO UPDATE SET
+                        changes = excluded.changes,
+                        intended = excluded.intended,
+                        apple_path = COALESCE(excluded.apple_path, failed_writes.apple_path),
+                        attempts = excluded.attempts,
+                        last_error = excluded.last_error,
+                        next_attempt = excluded.next_attempt''',
+                    (target, str(rating_key), json.dumps(changes), json.dumps(intended), apple_path,
+                     attempts, error, now.isoformat(), (now + timedelta(seconds=delay)).isoformat(),
+                     self.run_id)
+                )
+                self.conn.commit()
+                return attempts
+        except Exception as e:
+            logger.error(f"Failed to queue failed write for track {rating_key}: {str(e)}")
+            return 0
+    
+    def get_failed_writes(self, target: str = '', due_only: bool = True) -> List[Dict[str, Any]]:
+        """
+        Get queued failed writes.
+        
+        Args:
+            target: Name of the Plex target
+            due_only: Only writes whose backoff has expired and that have not
+                used up RETRY_MAX_ATTEMPTS
+                
+        Returns:
+            List of dictionaries with rating_key, changes, intended,
+            apple_path, attempts and last_error
+        """
+        query = '''SELECT plex_rating_key, changes, intended, apple_path, attempts, last_error
+                   FROM failed_writes WHERE target = ?'''
+        params = [target]
+        if due_only:
+            query += ' AND next_attempt <= ? AND attempts < ?'
+            params += [datetime.now().isoformat(), RETRY_MAX_ATTEMPTS]
+        try:
+            with self._lock:
+                cursor = self.conn.cursor()
+                cursor.execute(query + ' ORDER BY next_attempt', params)
+                return [
+                    {
+                        'rating_key': rating_key,
+                        'changes': json.loads(changes),
+                        'intended': json.loads(intended),
+                        'apple_path': apple_path,
+                        'attempts': attempts,
+                        'last_error': last_error
+                    }
+                    for rating_key, changes, intended, apple_path, attempts, last_error in cursor.fetchall()
+                ]
+        except Exception as e:
+            logger.error(f"Failed to get failed writes: {str(e)}")
+            return []
+    
+    def clear_failed_write(self, rating_key: str, target: str = '') -> None:
+        """Remove a track from the retry queue."""
+        try:
+            with self._lock:
+                cursor = self.conn.cursor()
+                cursor.execute('DELETE FROM failed_writes WHERE target = ? AND plex_rating_key = ?',
+                               (target, str(rating_key)))
+                self.conn.commit()
+        except Exception as e:
+            logger.error(f"Failed to clear failed write for track {rating_key}: {str(e)}")
+    
+    def get_runs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        List the most recent runs that changed anything.
+        
+        Args:
+            limit: Maximum number of runs
             
-            # Get total number of changes
-            cursor.execute('SELECT COUNT(*) FROM cleaned')
-            total_changes = cursor.fetchone()[0]
+        Returns:
+            Dictionaries with run_id, command, started, undone_by, changes
+            and tracks, newest first
+        """
+        try:
+            with self._lock:
+                cursor = self.conn.cursor()
+                cursor.execute('''
+                SELECT runs.run_id, runs.command, runs.started, runs.undone_by,
+                       (SELECT COUNT(*) FROM cleaned WHERE cleaned.run_id = runs.run_id),
+                       (SELECT COUNT(DISTINCT plex_rating_key) FROM cleaned
+                        WHERE cleaned.run_id = runs.run_id)
+                FROM runs ORDER BY runs.started DESC LIMIT ?
+                ''', (limit,))
+                return [
+                    {'run_id': run_id, 'command': command, 'started': started,
+                     'undone_by': undone_by, 'changes': changes, 'tracks': tracks}
+                    for run_id, command, started, undone_by, changes, tracks in cursor.fetchall()
+                ]
+        except Exception as e:
+            logger.error(f"Failed to list runs: {str(e)}")
+            return []
+    
+    def get_run_reverts(self, run_id: str, target: str = '') -> List[Dict[str, Any]]:
+        """
+        Work out what undoing a run has to write back.
+        
+        For every field the run changed, the value before the run (the old
+        value of its first change) and the value the run left behind (the
+        new value of its last change) are looked up by index.  A field is
+        marked superseded when a later run changed it again.
+        
+        Args:
+            run_id: Run to undo
+            target: Name of the Plex target
             
-            # Get number of unique tracks changed
-            cursor.execute('SELECT COUNT(DISTINCT plex_rating_key) FROM cleaned')
-            tracks_changed = cursor.fetchone()[0]
+        Returns:
+            Dictionaries with rating_key, field, before, after and
+            superseded, ordered by rating key
+        """
+        try:
+            with self._lock:
+                cursor = self.conn.cursor()
+                cursor.execute('''
+                SELECT run.plex_rating_key, run.field, first.old_value, last.new_value,
+                       EXISTS (
+                           SELECT 1 FROM cleaned AS later
+                           WHERE later.target = run.target
+                             AND later.plex_rating_key = run.plex_rating_key
+                             AND later.field = run.field
+                             AND later.id > run.last_id
+                       )
+                FROM (
+                    SELECT target, plex_rating_key, field, MIN(id) AS first_id, MAX(id) AS last_id
+                    FROM cleaned WHERE run_id = ? AND target = ?
+                    GROUP BY plex_rating_key, field
+                ) AS run
+                JOIN cleaned AS first ON first.id = run.first_id
+                JOIN cleaned AS last ON last.id = run.last_id
+                ORDER BY run.plex_rating_key
+                ''', (run_id, target))
+                return [
+                    {'rating_key': rating_key, 'field': field, 'before': before,
+                     'after': after, 'superseded': bool(superseded)}
+                    for rating_key, field, before, after, superseded in cursor.fetchall()
+                ]
+        except Exception as e:
+            logger.error(f"Failed to look up changes of run {run_id}: {str(e)}")
+            return []
+    
+    def finish_undo(self, run_id: str, target: str = '') -> int:
+        """
+        Mark a run as undone and drop its still-queued failed writes.
+        
+        The current state of every track the run changed is forgotten, so
+        the next clean compares those tracks with Apple Music again instead
+        of taking the restored values for ones it wrote itself.
+        
+        Args:
+            run_id: Run that was undone
+            target: Name of the Plex target
             
-            # Get counts by field
-            cursor.execute('''
-            SELECT field, COUNT(*) FROM cleaned
-            GROUP BY field
-            ''')
+        Returns:
+            Number of queued writes dropped
+        """
+        try:
+            with self._lock:
+                cursor = self.conn.cursor()
+                cursor.execute('UPDATE runs SET undone_by = ? WHERE run_id = ?', (self.run_id, run_id))
+                cursor.execute('DELETE FROM failed_writes WHERE run_id = ? AND target = ?',
+                               (run_id, target))
+                dropped = cursor.rowcount
+                cursor.execute('''
+                DELETE FROM track_state WHERE target = ? AND plex_rating_key IN (
+                    SELECT plex_rating_key FROM cleaned WHERE run_id = ? AND target = ?
+                )
+                ''', (target, run_id, target))
+                self.conn.commit()
+                return dropped
+        except Exception as e:
+            logger.error(f"Failed to mark run {run_id} as undone: {str(e)}")
+            return 0
+    
+    def get_digests(self, side: str, target: str = '') -> Dict[str, Dict[str, Any]]:
+        """
+        Get the bucket digests stored by the last verify run.
+        
+        Args:
+            side: 'plex' or 'apple'
+            target: Name of the Plex target
             
-            field_counts = {row[0]: row[1] for row in cursor.fetchall()}
+        Returns:
+            Dictionary mapping bucket names to {'digest', 'stamp', 'track_count'}
+        """
+        try:
+            with self._lock:
+                cursor = self.conn.cursor()
+                cursor.execute(
+                    'SELECT bucket, digest, stamp, track_count FROM digests WHERE target = ? AND side = ?',
+                    (target, side)
+                )
+                return {
+                    bucket: {'digest': digest, 'stamp': stamp, 'track_count': count}
+                    for bucket, digest, stamp, count in cursor.fetchall()
+                }
+        except Exception as e:
+            logger.error(f"Failed to get digests: {str(e)}")
+            return {}
+    
+    def record_digests(self, side: str, digests: Dict[str, Tuple[str, Optional[str], int]],
+                       target: str = '') -> None:
+        """
+        Replace the stored bucket digests of one side.
+        
+        Args:
+            side: 'plex' or 'apple'
+            digests: Dictionary mapping bucket names to (digest, stamp, track count)
+            target: Name of the Plex target
+        """
+        timestamp = datetime.now().isoformat()
+        try:
+            with self._lock:
+                cursor = self.conn.cursor()
+                cursor.execute('DELETE FROM digests WHERE target = ? AND side = ?', (target, side))
+                cursor.executemany(
+                    '''INSERT INTO digests (target, side, bucket, digest, stamp, track_count, timestamp)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                    [(target, side, bucket, digest, stamp, count, timestamp)
+                     for bucket, (digest, stamp, count) in digests.items()]
+                )
+                self.conn.commit()
+        except Exception as e:
+            logger.error(f"Failed to record digests: {str(e)}")
+    
+    def get_stats(self, target: Optional[str] = None) -> Dict[str, int]:
+        """
+        Get statistics about the cleaning process.
+        
+        Args:
+            target: Restrict the statistics to one Plex target (all if None)
+        
+        Returns:
+            Dictionary with statistics
+        """
+        try:
+            with self._lock:
+                cursor = self.conn.cursor()
+                if target is None:
+                    cursor.execute('SELECT metric, SUM(value) FROM clean_stats GROUP BY metric')
+                else:
+                    cursor.execute('SELECT metric, value FROM clean_stats WHERE target = ?', (target,))
+                counters = dict(cursor.fetchall())
             
             stats = {
-                'total_changes': total_changes,
-                'tracks_changed': tracks_changed,
-                **field_counts
+                'total_changes': counters.pop('total_changes', 0),
+                'tracks_changed': counters.pop('tracks_changed', 0),
+                # Counts by field
+                **{metric[len('field:'):]: value for metric, value in counters.items()
+                   if metric.startswith('field:')}
             }
             
             return stats
@@ -740,121 +1905,1115 @@ class CleanLogger:
             self.conn.close()
 
 
-def clean_all_tracks(plex_client: PlexClient, apple_music_client: AppleMusicClient, 
-                    clean_logger: CleanLogger) -> Dict[str, int]:
+# How much a pair found by each matching method can be trusted
+MATCH_CONFIDENCE = {'path': 1.0, 'size_duration': 0.9, 'basename': 0.8}
+
+
+class TrackMatch(NamedTuple):
+    """A Plex track paired with its Apple Music counterpart."""
+    track: Any
+    apple_path: str
+    apple_track: Dict[str, Any]
+    method: str
+
+
+class AppleTrackIndex:
     """
-    Clean metadata for all tracks in the Plex library.
+    In-memory lookup over an Apple Music track map.
     
-    Args:
-        plex_client: PlexClient instance
-        apple_music_client: AppleMusicClient instance
-        clean_logger: CleanLogger instance
-        
-    Returns:
-        Dictionary with statistics about the cleaning process
+    Built once per run so that any number of Plex libraries can be matched
+    against the same Apple Music data without re-reading the library.
     """
-    logger.info("Starting full library clean...")
     
-    # Get all tracks from Plex
-    plex_tracks = plex_client.get_all_tracks()
+    def __init__(self, tracks: Dict[str, Dict]):
+        """
+        Build the index.
+        
+        Args:
+            tracks: Dictionary mapping file paths to metadata dictionaries
+        """
+        self.tracks = tracks
+        self.by_key: Dict[str, str] = {}
+        self.by_basename: Dict[str, str] = {}
+        self.by_size_duration: Dict[Tuple[int, int], List[str]] = defaultdict(list)
+        self.by_persistent_id: Dict[str, str] = {}
+        for path, metadata in tracks.items():
+            # Clients precompute the key; older snapshots may lack it
+            key = metadata.get('path_key') or make_path_key(path)
+            self.by_key.setdefault(key, path)
+            # Keep the first path per filename, as the old linear scan did
+            self.by_basename.setdefault(basename_key(key), path)
+            if metadata.get('persistent_id'):
+                self.by_persistent_id[metadata['persistent_id']] = path
+            key = _size_duration_key(metadata.get('size'), metadata.get('duration'))
+            if key:
+                self.by_size_duration[key].append(path)
     
-    # Get all tracks from Apple Music
-    apple_tracks = apple_music_client.get_all_tracks()
+    @classmethod
+    def from_client(cls, apple_music_client) -> 'AppleTrackIndex':
+        """Build an index from any Apple Music client's full track list."""
+        return cls(apple_music_client.get_all_tracks())
     
-    # Track statistics
-    stats = {
-        'total_tracks': len(plex_tracks),
+    def __len__(self) -> int:
+        return len(self.tracks)
+    
+    def lookup_path(self, file_path: str,
+                    path_key: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Find the Apple Music track for a Plex file path.
+        
+        Paths are compared by their normalized keys, so NFD paths from macOS
+        and NFC paths from Plex still match exactly.
+        
+        Args:
+            file_path: Path of the media file as reported by Plex
+            path_key: Precomputed make_path_key(file_path), if available
+            
+        Returns:
+            Tuple of (Apple Music path, match method), or (None, None)
+        """
+        # Try direct path match first
+        if file_path in self.tracks:
+            return file_path, 'path'
+        
+        key = path_key or make_path_key(file_path)
+        apple_path = self.by_key.get(key)
+        if apple_path is not None:
+            return apple_path, 'path'
+        
+        # Fall back to matching by filename
+        apple_path = self.by_basename.get(basename_key(key))
+        if apple_path is not None:
+            return apple_path, 'basename'
+        return None, None
+    
+    def size_duration_candidates(self, size: Optional[int], duration: Optional[int]) -> Set[str]:
+        """
+        Return the Apple Music paths whose file size and duration match.
+        
+        Durations are compared in whole seconds; the neighbouring seconds are
+        probed as well so rounding differences between the two apps don't
+        split a pair.
+        """
+        key = _size_duration_key(size, duration)
+        if not key:
+            return set()
+        size, seconds = key
+        candidates = set()
+        for probe in (seconds - 1, seconds, seconds + 1):
+            candidates.update(self.by_size_duration.get((size, probe), ()))
+        return candidates
+    
+    def cached_path(self, entry: Dict[str, Any], file_path: Optional[str],
+                    size: Optional[int]) -> Optional[str]:
+        """
+        Validate a remembered pair and return its Apple Music path.
+        
+        A pair is only trusted while neither side's path or file size has
+        changed since it was recorded.
+        
+        Args:
+            entry: Row from CleanLogger.get_matches()
+            file_path: Current Plex file path
+            size: Current Plex file size
+            
+        Returns:
+            Apple Music path, or None if the pair is stale
+        """
+        apple_path = self.by_persistent_id.get(entry['apple_persistent_id'])
+        if apple_path is None:
+            return None
+        if entry['plex_path'] != file_path or entry['plex_size'] != size:
+            return None
+        if entry['apple_path'] != apple_path or entry['apple_size'] != self.tracks[apple_path].get('size'):
+            return None
+        return apple_path
+    
+    def match_direct(self, plex_tracks: Iterable,
+                     known: Optional[Dict[str, Dict[str, Any]]] = None) -> Tuple[List[TrackMatch], List[Tuple[Any, Set[str]]]]:
+        """
+        Pair Plex tracks by remembered pair, path or filename.
+        
+        Args:
+            plex_tracks: Plex track objects
+            known: Remembered pairs keyed by rating key (see CleanLogger.get_matches)
+            
+        Returns:
+            Tuple of (matches, [(unmatched track, size/duration candidates)]);
+            tracks without any candidate are dropped
+        """
+        known = known or {}
+        matches = []
+        unmatched = []
+        for track in plex_tracks:
+            file_path, size, duration = _get_track_media_info(track)
+            
+            entry = known.get(str(track.ratingKey))
+            if entry is not None:
+                apple_path = self.cached_path(entry, file_path, size)
+                if apple_path is not None:
+                    matches.append(TrackMatch(track, apple_path, self.tracks[apple_path], 'cache'))
+                    continue
+            
+            apple_path, method = self.lookup_path(file_path) if file_path else (None, None)
+            if apple_path is not None:
+                matches.append(TrackMatch(track, apple_path, self.tracks[apple_path], method))
+                continue
+            
+            candidates = self.size_duration_candidates(size, duration)
+            if candidates:
+                unmatched.append((track, candidates))
+        return matches, unmatched
+    
+    def join_size_duration(self, unmatched: List[Tuple[Any, Set[str]]],
+                           claimed: Optional[Set[str]] = None) -> Tuple[List[TrackMatch], List[Tuple[Any, List[str]]]]:
+        """
+        Hash-join unmatched tracks on (file size, duration).
+        
+        A pair is only accepted when the key is unique on both sides,
+        otherwise it is reported as ambiguous.  Apple Music tracks that are
+        already paired with another Plex track (by path, filename or
+        remembered pair) are not candidates at all.  The join must see every
+        unmatched track of the library at once to count the claims correctly.
+        
+        Args:
+            unmatched: Second element of match_direct() results
+            claimed: Apple Music paths already paired in this run
+            
+        Returns:
+            Tuple of (matches, [(track, candidate Apple paths)]); tracks
+            whose candidates are all claimed appear in neither list
+        """
+        if claimed:
+            unmatched = [(track, candidates - claimed) for track, candidates in unmatched]
+            unmatched = [(track, candidates) for track, candidates in unmatched if candidates]
+        
+        # Count how many Plex tracks compete for each Apple track
+        claims = defaultdict(int)
+        for _, candidates in unmatched:
+            for apple_path in candidates:
+                claims[apple_path] += 1
+        
+        matches = []
+        ambiguous = []
+        for track, candidates in unmatched:
+            if len(candidates) == 1:
+                apple_path = next(iter(candidates))
+                if claims[apple_path] == 1:
+                    matches.append(TrackMatch(track, apple_path, self.tracks[apple_path], 'size_duration'))
+                    continue
+            ambiguous.append((track, sorted(candidates)))
+        
+        return matches, ambiguous
+
+
+class WriteBudget:
+    """Thread-safe cap on the number of tracks a run is allowed to update."""
+    
+    def __init__(self, limit: Optional[int] = None):
+        """
+        Args:
+            limit: Maximum number of track updates, or None for no limit
+        """
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+    
+    def acquire(self) -> bool:
+        """Reserve one write. Returns False once the budget is exhausted."""
+        with self._lock:
+            if self.limit is not None and self.used >= self.limit:
+                return False
+            self.used += 1
+            return True
+
+
+def _size_duration_key(size: Optional[int], duration: Optional[int]) -> Optional[Tuple[int, int]]:
+    """Return the (bytes, whole seconds) join key for a file, if both are known."""
+    if not size or not duration:
+        return None
+    return int(size), int(round(int(duration) / 1000))
+
+
+def _get_track_media_info(track) -> Tuple[Optional[str], Optional[int], Optional[int]]:
+    """
+    Return file path, file size and duration (ms) of a Plex track's first media part.
+    """
+    try:
+        for media in track.media:
+            for part in media.parts:
+                if part.file:
+                    duration = getattr(part, 'duration', None) or getattr(media, 'duration', None)
+                    return part.file, getattr(part, 'size', None), duration
+    except Exception:
+        pass
+    return None, None, None
+
+
+def _get_track_file_path(track) -> Optional[str]:
+    """Return the file path of the first media part of a Plex track."""
+    return _get_track_media_info(track)[0]
+
+
+def _track_artist(track) -> str:
+    """Return the artist Plex shows for a track."""
+    return getattr(track, 'originalTitle', None) or track.grandparentTitle
+
+
+def _locked_fields(track) -> Set[str]:
+    """Return the names of the Plex fields locked on a track."""
+    # Read from the instance dict: plexapi reloads partial objects whenever an
+    # attribute is empty, which would cost one request per unlocked track
+    fields = getattr(track, '__dict__', {}).get('fields') or []
+    return {field.name for field in fields if getattr(field, 'locked', False)}
+
+
+def _new_clean_stats(total_tracks: int) -> Dict[str, int]:
+    """Return an empty statistics dictionary for a clean run."""
+    return {
+        'total_tracks': total_tracks,
         'matched_tracks': 0,
         'updated_tracks': 0,
         'title_updates': 0,
         'artist_updates': 0,
         'album_updates': 0,
-        'skipped_tracks': 0
+        'skipped_tracks': 0,
+        'budget_skipped': 0,
+        'failed_updates': 0,
+        'locked_tracks': 0,
+        'drifted_fields': 0,
+        'size_duration_matches': 0,
+        'cached_matches': 0,
+        'ambiguous_tracks': 0,
+        'queued_retries': 0,
+        'retried_updates': 0,
+        'retry_queued': 0,
+        'failed_pages': 0
     }
+
+
+def _current_values(track) -> Dict[str, Any]:
+    """Return the values Plex currently shows for the fields we manage."""
+    return {
+        'title': track.title,
+        'artist': _track_artist(track),
+        'album': track.parentTitle
+    }
+
+
+def _select_pending(plex_tracks: List, clean_logger: CleanLogger, target: str,
+                    stats: Dict[str, int], queued: Optional[Set[str]] = None) -> List:
+    """
+    Drop tracks that were already cleaned and have not drifted since.
     
-    # Get already cleaned tracks to skip
-    cleaned_tracks = clean_logger.get_cleaned_tracks()
+    Already cleaned tracks are skipped unless Plex has drifted away from the
+    values we wrote, which only happens to unlocked fields.  Tracks waiting
+    in the retry queue are skipped too; they are written by
+    retry_failed_writes() once their backoff has expired.
+    
+    Args:
+        plex_tracks: Plex track objects
+        clean_logger: CleanLogger instance
+        target: Name of the Plex target
+        stats: Statistics to count skipped and drifted tracks in
+        queued: Rating keys in the retry queue
     
-    # Process each track
+    Returns:
+        Tracks that still need to be compared with Apple Music
+    """
+    if queued:
+        remaining = [track for track in plex_tracks if str(track.ratingKey) not in queued]
+        stats['retry_queued'] += len(plex_tracks) - len(remaining)
+        plex_tracks = remaining
+    last_values = clean_logger.get_last_values(target, [str(track.ratingKey) for track in plex_tracks])
+    if not last_values:
+        return list(plex_tracks)
+    
+    pending = []
     for track in plex_tracks:
-        # Skip already cleaned tracks
-        if track.ratingKey in cleaned_tracks:
-            stats['skipped_tracks'] += 1
+        rating_key = str(track.ratingKey)
+        if rating_key in last_values:
+            current = _current_values(track)
+            locked = _locked_fields(track)
+            drifted = [
+                field for field, value in last_values.get(rating_key, {}).items()
+                if PLEX_FIELDS.get(field) not in locked and current.get(field, value) != value
+            ]
+            if not drifted:
+                stats['skipped_tracks'] += 1
+                continue
+            for field in drifted:
+                track_logger.warning("Track %s %s drifted back to '%s' (was '%s', unlocked)",
+                                     track.ratingKey, field, current[field],
+                                     last_values[rating_key][field])
+            stats['drifted_fields'] += len(drifted)
+        pending.append(track)
+    return pending
+
+
+def _count_matches(matches: List[TrackMatch], stats: Dict[str, int]) -> None:
+    """Add a batch of matches to the clean statistics."""
+    stats['matched_tracks'] += len(matches)
+    stats['size_duration_matches'] += sum(1 for match in matches if match.method == 'size_duration')
+    stats['cached_matches'] += sum(1 for match in matches if match.method == 'cache')
+
+
+def _report_ambiguous(ambiguous: List[Tuple[Any, List[str]]], stats: Dict[str, int]) -> None:
+    """Count and log tracks whose size/duration pair was not unique."""
+    stats['ambiguous_tracks'] += len(ambiguous)
+    if ambiguous:
+        logger.warning(f"{len(ambiguous)} tracks share their size/duration with other tracks and were left alone")
+        for track, candidates in ambiguous:
+            logger.debug(f"Ambiguous track {track.ratingKey} ({_get_track_file_path(track)}): "
+                         f"{', '.join(candidates)}")
+
+
+def _remember_matches(matches: List[TrackMatch], clean_logger: CleanLogger, target: str = '') -> None:
+    """Record newly found pairs so the next run can reuse them."""
+    new_pairs = []
+    for match in matches:
+        if match.method == 'cache' or not match.apple_track.get('persistent_id'):
             continue
-            
-        # Get file path from track
-        file_path = None
+        file_path, size, _ = _get_track_media_info(match.track)
+        new_pairs.append((
+            match.track.ratingKey, match.apple_track['persistent_id'], match.method,
+            MATCH_CONFIDENCE[match.method], file_path, size,
+            match.apple_path, match.apple_track.get('size')
+        ))
+    clean_logger.record_matches(new_pairs, target)
+
+
+def _match_pending(apple_index: AppleTrackIndex, plex_tracks: List, stats: Dict[str, int],
+                   clean_logger: Optional[CleanLogger] = None, target: str = '',
+                   deferred: Optional[List[Tuple[Any, Set[str]]]] = None,
+                   remember: bool = True, claimed: Optional[Set[str]] = None) -> List[TrackMatch]:
+    """
+    Match tracks against Apple Music, counting and reporting ambiguous pairs.
+    
+    When a clean logger is given, pairs remembered from earlier runs are
+    reused and (unless remember is False) newly found pairs are remembered
+    for the next run.
+    
+    Args:
+        apple_index: Index over the Apple Music tracks
+        plex_tracks: Plex track objects
+        stats: Statistics dictionary to update
+        clean_logger: CleanLogger instance, if pairs should be remembered
+        target: Name of the Plex target
+        deferred: If given, tracks that can only be matched by size/duration
+            are appended here for _match_deferred() instead of joined now
+        remember: Record new pairs and forget stale ones in the clean log
+        claimed: Apple Music paths paired so far in this run; the direct
+            matches found here are added to it
+    
+    Returns:
+        List of matches
+    """
+    known = {}
+    if clean_logger is not None:
+        known = clean_logger.get_matches(target, [str(track.ratingKey) for track in plex_tracks])
+    
+    matches, unmatched = apple_index.match_direct(plex_tracks, known)
+    if claimed is None:
+        claimed = set()
+    claimed.update(match.apple_path for match in matches)
+    if deferred is None:
+        joined, ambiguous = apple_index.join_size_duration(unmatched, claimed)
+        matches += joined
+        _report_ambiguous(ambiguous, stats)
+    else:
+        deferred.extend(unmatched)
+    _count_matches(matches, stats)
+    
+    if clean_logger is not None and remember:
+        _remember_matches(matches, clean_logger, target)
+        
+        # Remembered pairs that could not be confirmed again are stale
+        matched_keys = {str(match.track.ratingKey) for match in matches}
+        clean_logger.forget_matches([key for key in known if key not in matched_keys], target)
+    
+    return matches
+
+
+def _match_deferred(apple_index: AppleTrackIndex, deferred: List[Tuple[Any, Set[str]]],
+                    stats: Dict[str, int], clean_logger: Optional[CleanLogger] = None,
+                    target: str = '', remember: bool = True,
+                    claimed: Optional[Set[str]] = None) -> List[TrackMatch]:
+    """
+    Join the tracks collected by _match_pending() on size/duration.
+    
+    Args:
+        claimed: Apple Music paths already paired in this run
+    
+    Returns:
+        List of matches
+    """
+    matches, ambiguous = apple_index.join_size_duration(deferred, claimed)
+    _report_ambiguous(ambiguous, stats)
+    _count_matches(matches, stats)
+    if clean_logger is not None and remember:
+        _remember_matches(matches, clean_logger, target)
+    return matches
+
+
+class PlannedUpdate(NamedTuple):
+    """A matched track together with the field changes it needs."""
+    match: TrackMatch
+    changes: List[Tuple[str, Any, Any]]
+
+
+def _plan_updates(matches: List[TrackMatch], stats: Dict[str, int]) -> List[PlannedUpdate]:
+    """
+    Diff each matched track against its Apple Music metadata.
+    
+    Only fields whose Plex value differs are planned; a track without
+    changes but with locked fields is counted in 'locked_tracks'.
+    
+    Returns:
+        Tracks that need updating, with their (field, old, new) changes
+    """
+    planned = []
+    for match in matches:
+        apple_track = match.apple_track
+        changes = [
+            (field, old, apple_track[field])
+            for field, old in _current_values(match.track).items()
+            if old != apple_track[field]
+        ]
+        if changes:
+            planned.append(PlannedUpdate(match, changes))
+        elif any(PLEX_FIELDS[field] in _locked_fields(match.track) for field in PLEX_FIELDS):
+            stats['locked_tracks'] += 1
+    return planned
+
+
+class WritePipeline:
+    """
+    Background writers that apply planned updates to Plex.
+    
+    Every writer thread has its own bounded queue and updates are routed by
+    artist, so an artist's tracks are always written by the same thread and
+    the producer blocks instead of running ahead of Plex.
+    """
+    
+    def __init__(self, plex_client: PlexClient, clean_logger: CleanLogger, target: str = '',
+                 budget: Optional[WriteBudget] = None, workers: int = 1,
+                 progress: Optional[ProgressReporter] = None, queue_size: int = 200,
+                 lock: bool = True, queue_failures: bool = True):
+        """
+        Start the writer threads.
+        
+        Args:
+            plex_client: PlexClient the tracks belong to
+            clean_logger: CleanLogger instance
+            target: Name of the Plex target, used to separate clean log entries
+            budget: Optional cap on the number of tracks to update
+            workers: Number of writer threads
+            progress: Progress reporter to add updated/failed counts to
+            queue_size: Maximum number of updates waiting per writer
+            lock: Lock the written fields (unlock them if False)
+            queue_failures: Queue failed writes for retry; if False they are
+                only counted
+        """
+        self.plex_client = plex_client
+        self.clean_logger = clean_logger
+        self.target = target
+        self.budget = budget
+        self.progress = progress
+        self.lock = lock
+        self.queue_failures = queue_failures
+        self.stats = _new_clean_stats(0)
+        # Tracks waiting in the retry queue, dropped from it by any successful write
+        self._queued_keys = {entry['rating_key'] for entry in clean_logger.get_failed_writes(target, False)}
+        self._lock = threading.Lock()
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(max(1, workers))]
+        self._threads = [
+            threading.Thread(target=self._run, args=(work_queue,), name=f"plex-writer-{i}", daemon=True)
+            for i, work_queue in enumerate(self._queues)
+        ]
+        for thread in self._threads:
+            thread.start()
+    
+    def __enter__(self) -> 'WritePipeline':
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+    
+    def submit(self, update: PlannedUpdate) -> None:
+        """Queue an update, blocking while its writer is busy."""
+        artist = _track_artist(update.match.track) or ''
+        self._queues[hash(artist) % len(self._queues)].put(update)
+    
+    def close(self) -> Dict[str, int]:
+        """
+        Wait for all queued updates to be written.
+        
+        Returns:
+            Dictionary with update statistics (total_tracks is left at 0)
+        """
+        for work_queue in self._queues:
+            work_queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        return self.stats
+    
+    def _run(self, work_queue: queue.Queue) -> None:
+        """Writer thread: apply updates until the end marker arrives."""
+        while True:
+            update = work_queue.get()
+            if update is None:
+                return
+            try:
+                counters = self._apply(update)
+            except Exception as e:
+                logger.error(f"Failed to apply update for track {update.match.track.ratingKey}: {str(e)}")
+                counters = {'failed_updates': 1}
+            with self._lock:
+                _merge_stats(self.stats, counters)
+            if self.progress is not None:
+                self.progress.add(0, updated=counters.get('updated_tracks', 0),
+                                  failed=counters.get('failed_updates', 0))
+    
+    def _apply(self, update: PlannedUpdate) -> Dict[str, int]:
+        """
+        Write one planned update to Plex.
+        
+        Changes are recorded in the clean log only once Plex has accepted
+        them.  A write that fails is queued in the clean log's retry queue
+        instead, unless the track no longer exists.
+        """
+        track, apple_track = update.match.track, update.match.apple_track
+        if self.budget is not None and not self.budget.acquire():
+            return {'budget_skipped': 1}
+        
+        for field, old, new in update.changes:
+            track_logger.info("Updating %s for track %s: '%s' -> '%s'", field, track.ratingKey, old, new)
+        
+        # Update track metadata (only the changed fields, so nothing else
+        # gets written or locked)
         try:
-            for media in track.media:
-                for part in media.parts:
-                    file_path = part.file
-                    break
-                if file_path:
-                    break
-        except Exception:
-            continue
+            updated = self.plex_client.update_track_metadata(
+                track,
+                **{field: new for field, _, new in update.changes},
+                lock=self.lock,
+                raise_errors=True
+            )
+        except NotFound:
+            if update.match.method == 'retry':
+                self.clean_logger.clear_failed_write(track.ratingKey, self.target)
+            return {'failed_updates': 1}
+        except Exception as e:
+            if not self.queue_failures:
+                return {'failed_updates': 1}
+            intended = {field: apple_track[field] for field in PLEX_FIELDS}
+            attempts = self.clean_logger.record_failed_write(
+                track.ratingKey, update.changes, intended, str(e), self.target, update.match.apple_path
+            )
+            track_logger.warning("Queued track %s for retry (attempt %s)", track.ratingKey, attempts)
+            return {'failed_updates': 1, 'queued_retries': 1}
+        if not updated:
+            return {'failed_updates': 1}
+        
+        counters = defaultdict(int)
+        for field, old, new in update.changes:
+            self.clean_logger.record_change(track.ratingKey, field, old, new, self.target)
+            counters[f'{field}_updates'] += 1
+        counters['updated_tracks'] += 1
+        if update.match.method == 'retry' or str(track.ratingKey) in self._queued_keys:
+            self.clean_logger.clear_failed_write(track.ratingKey, self.target)
+            counters['retried_updates'] += 1
+        return counters
+
+
+class PlanRecorder:
+    """
+    Stand-in for a WritePipeline that writes planned updates to a plan file.
+    
+    Nothing is written to Plex or the clean log; every change is streamed to
+    the plan as soon as it is planned, so memory stays constant.
+    """
+    
+    def __init__(self, plan: PlanWriter):
+        self.plan = plan
+        self.stats = _new_clean_stats(0)
+        self._lock = threading.Lock()
+    
+    def __enter__(self) -> 'PlanRecorder':
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+    
+    def submit(self, update: PlannedUpdate) -> None:
+        """Write the changes of one planned update to the plan."""
+        match = update.match
+        with self._lock:
+            for field, old, new in update.changes:
+                self.plan.write(match.track.ratingKey, field, old, new, match.method, match.apple_path)
+            self.stats['planned_tracks'] = self.stats.get('planned_tracks', 0) + 1
+            self.stats['planned_changes'] = self.stats.get('planned_changes', 0) + len(update.changes)
+    
+    def close(self) -> Dict[str, int]:
+        """Return the planning statistics (the plan file is closed by its owner)."""
+        return self.stats
+
+
+def _merge_stats(stats: Dict[str, int], other: Dict[str, int]) -> None:
+    """Add the counters of one statistics dictionary to another."""
+    for key, value in other.items():
+        stats[key] = stats.get(key, 0) + value
+
+
+def _clean_pages(plex_client: PlexClient, pages: Iterable[List], apple_index: AppleTrackIndex,
+                 clean_logger: CleanLogger, target: str = '',
+                 budget: Optional[WriteBudget] = None, workers: int = 1,
+                 total: Optional[int] = None,
+                 pairs: Optional[Dict[str, str]] = None,
+                 plan: Optional[PlanWriter] = None) -> Dict[str, int]:
+    """
+    Stream pages of Plex tracks through match, diff and write.
+    
+    Each page is matched and diffed (in one bulk pass) as soon as it
+    arrives, and its updates are handed to a WritePipeline, so writes start
+    with the first page and memory is bounded by the page size plus the
+    Apple Music index.  Only tracks that can just be matched by size/duration
+    are held back until every page has been seen, since such a pair is only
+    trusted when its key is unique across the whole library.
+    
+    Args:
+        plex_client: PlexClient instance the tracks belong to
+        pages: Iterable of lists of Plex track objects
+        apple_index: Index over the Apple Music tracks
+        clean_logger: CleanLogger instance
+        target: Name of the Plex target, used to separate clean log entries
+        budget: Optional cap on the number of tracks to update
+        workers: Number of writer threads (tracks are routed by artist)
+        total: Expected number of tracks, for progress reporting
+        pairs: If given, every track is matched (not only those still to be
+            cleaned) and this dictionary is filled with Apple Music path ->
+            Plex rating key
+        plan: Write the planned changes to this plan instead of to Plex
+            (the clean log is then only read)
+        
+    Returns:
+        Dictionary with statistics about the cleaning process
+    """
+    stats = _new_clean_stats(0)
+    deferred = []
+    # Apple Music tracks already paired with a Plex track, which the
+    # size/duration join must not hand to another one
+    claimed = set()
+    pending_keys = set()
+    failed_pages = plex_client.failed_pages
+    # Queued writes keep their own backoff schedule (see retry_failed_writes)
+    queued = {entry['rating_key'] for entry in clean_logger.get_failed_writes(target, False)}
+    # Planning only reads the clean log
+    remember = plan is None
+    
+    progress = ProgressReporter(f"{'Planned' if plan else 'Cleaned'} tracks{f' [{target}]' if target else ''}",
+                                total)
+    if plan is not None:
+        pipeline = PlanRecorder(plan)
+    else:
+        pipeline = WritePipeline(plex_client, clean_logger, target, budget, workers, progress)
+    with pipeline:
+        for page in pages:
+            stats['total_tracks'] += len(page)
+            pending = _select_pending(page, clean_logger, target, stats, queued)
+            if pairs is None:
+                # Tracks that are not matched again keep their remembered pair
+                selected = {id(track) for track in pending}
+                skipped = [str(track.ratingKey) for track in page if id(track) not in selected]
+                if skipped:
+                    remembered = clean_logger.get_matches(target, skipped)
+                    claimed.update(entry['apple_path'] for entry in remembered.values())
+                matches = _match_pending(apple_index, pending, stats, clean_logger, target, deferred,
+                                         remember, claimed)
+            else:
+                keys = {str(track.ratingKey) for track in pending}
+                pending_keys.update(keys)
+                matches = _match_pending(apple_index, page, stats, clean_logger, target, deferred,
+                                         remember, claimed)
+                pairs.update((match.apple_path, str(match.track.ratingKey)) for match in matches)
+                matches = [match for match in matches if str(match.track.ratingKey) in keys]
+            for update in _plan_updates(matches, stats):
+                pipeline.submit(update)
+            progress.add(len(page))
+        
+        if deferred:
+            logger.info(f"Joining {len(deferred)} unmatched tracks on file size and duration")
+            matches = _match_deferred(apple_index, deferred, stats, clean_logger, target, remember,
+                                      claimed)
+            if pairs is not None:
+                pairs.update((match.apple_path, str(match.track.ratingKey)) for match in matches)
+                matches = [match for match in matches if str(match.track.ratingKey) in pending_keys]
+            for update in _plan_updates(matches, stats):
+                pipeline.submit(update)
+    _merge_stats(stats, pipeline.stats)
+    progress.finish()
+    stats['failed_pages'] = plex_client.failed_pages - failed_pages
+    
+    if stats['failed_pages']:
+        logger.error(f"{stats['failed_pages']} Plex page requests failed – the library was only partly cleaned")
+    if stats['budget_skipped']:
+        logger.warning(f"Write budget exhausted – {stats['budget_skipped']} tracks left for a later run")
+    return stats
+
+
+def _clean_tracks(plex_client: PlexClient, plex_tracks: List, apple_index: AppleTrackIndex,
+                  clean_logger: CleanLogger, target: str = '',
+                  budget: Optional[WriteBudget] = None, workers: int = 1) -> Dict[str, int]:
+    """
+    Compare a list of Plex tracks with Apple Music and update any that differ.
+    
+    Returns:
+        Dictionary with statistics about the cleaning process
+    """
+    return _clean_pages(plex_client, [plex_tracks], apple_index, clean_logger, target,
+                        budget, workers, total=len(plex_tracks))
+
+
+def retry_failed_writes(plex_client: PlexClient, clean_logger: CleanLogger, target: str = '',
+                        budget: Optional[WriteBudget] = None, workers: int = 1,
+                        due_only: bool = True, batch_size: int = 200) -> Dict[str, int]:
+    """
+    Retry queued failed writes without a full clean.
+    
+    Queued tracks are fetched from Plex in batches and compared with the
+    values that were meant to be written; tracks that already show them are
+    dropped from the queue, the rest go through a WritePipeline again.
+    
+    Args:
+        plex_client: PlexClient instance
+        clean_logger: CleanLogger instance holding the retry queue
+        target: Name of the Plex target
+        budget: Optional cap on the number of tracks to update
+        workers: Number of writer threads
+        due_only: Only retry writes whose backoff has expired
+        batch_size: Number of tracks fetched per request
+        
+    Returns:
+        Dictionary with statistics about the retries
+    """
+    stats = _new_clean_stats(0)
+    entries = clean_logger.get_failed_writes(target, due_only)
+    if not entries:
+        return stats
+    
+    logger.info(f"Retrying {len(entries)} failed writes{f' for {target}' if target else ''}...")
+    stats['total_tracks'] = len(entries)
+    with WritePipeline(plex_client, clean_logger, target, budget, workers) as pipeline:
+        for i in range(0, len(entries), batch_size):
+            batch = entries[i:i + batch_size]
+            tracks = plex_client.fetch_tracks([entry['rating_key'] for entry in batch])
+            matches = []
+            for entry in batch:
+                track = tracks.get(entry['rating_key'])
+                if track is None:
+                    track_logger.warning("Could not fetch track %s for retry", entry['rating_key'])
+                    stats['failed_updates'] += 1
+                    continue
+                matches.append(TrackMatch(track, entry['apple_path'], entry['intended'], 'retry'))
             
-        if not file_path:
-            continue
+            planned = _plan_updates(matches, stats)
+            for update in planned:
+                pipeline.submit(update)
+            
+            # Someone (or a later run) already wrote these values
+            planned_keys = {str(update.match.track.ratingKey) for update in planned}
+            for match in matches:
+                if str(match.track.ratingKey) not in planned_keys:
+                    clean_logger.clear_failed_write(match.track.ratingKey, target)
+    _merge_stats(stats, pipeline.stats)
+    
+    logger.info(f"Retried {stats['retried_updates']} writes, {stats['queued_retries']} failed again")
+    return stats
+
+
+def _write_back(plex_client: PlexClient, clean_logger: CleanLogger, planned: Iterable[PlannedTrack],
+                stats: Dict[str, int], target: str = '', budget: Optional[WriteBudget] = None,
+                workers: int = 1, force: bool = False, batch_size: int = 200,
+                lock: bool = True, queue_failures: bool = True) -> None:
+    """
+    Write known field values to tracks through a WritePipeline.
+    
+    Tracks are read from the iterable and fetched from Plex in batches, so
+    any number of them is handled in constant memory.  Each change carries
+    the value the field is expected to hold; a field that shows something
+    else was edited in the meantime and is left alone unless forced.
+    
+    Args:
+        plex_client: PlexClient instance
+        clean_logger: CleanLogger instance
+        planned: Tracks with their (field, expected value, new value) changes
+        stats: Statistics to add to (needs an 'edited_fields' counter)
+        target: Name of the Plex target
+        budget: Optional cap on the number of tracks to update
+        workers: Number of writer threads
+        force: Write fields whose current value is not the expected one
+        batch_size: Number of tracks fetched per request
+        lock: Lock the written fields (unlock them if False)
+        queue_failures: Queue failed writes for retry
+    """
+    planned = iter(planned)
+    with WritePipeline(plex_client, clean_logger, target, budget, workers,
+                       lock=lock, queue_failures=queue_failures) as pipeline:
+        while True:
+            batch = list(islice(planned, batch_size))
+            if not batch:
+                break
+            tracks = plex_client.fetch_tracks([item.rating_key for item in batch])
+            matches = []
+            for item in batch:
+                stats['total_tracks'] += 1
+                track = tracks.get(item.rating_key)
+                if track is None:
+                    track_logger.warning("Could not fetch track %s", item.rating_key)
+                    stats['failed_updates'] += 1
+                    continue
+                intended = _current_values(track)
+                for field, expected, new in item.changes:
+                    if field not in intended:
+                        track_logger.warning("Ignoring unknown field '%s' for track %s", field, item.rating_key)
+                        continue
+                    # CSV plans cannot tell an empty value from a missing one
+                    if (intended[field] or '') != (expected or '') and not force:
+                        track_logger.warning("Leaving %s of track %s alone: now '%s', expected '%s'",
+                                             field, item.rating_key, intended[field], expected)
+                        stats['edited_fields'] += 1
+                        continue
+                    # An empty new value clears the field instead of being
+                    # skipped as "no change" by update_track_metadata
+                    if (intended[field] or '') != (new or ''):
+                        intended[field] = new if new is not None else ''
+                stats['matched_tracks'] += 1
+                matches.append(TrackMatch(track, item.apple_path, intended, item.method))
             
-        # Try to find matching track in Apple Music
-        apple_track = None
+            for update in _plan_updates(matches, stats):
+                pipeline.submit(update)
+    _merge_stats(stats, pipeline.stats)
+
+
+def apply_plan(plex_client: PlexClient, clean_logger: CleanLogger, plan_path: str, target: str = '',
+               budget: Optional[WriteBudget] = None, workers: int = 1,
+               force: bool = False) -> Dict[str, int]:
+    """
+    Apply a plan file written by --plan-out.
+    
+    The plan is streamed track by track through the same batched write
+    path as undo, so it can be applied on another machine, long after it
+    was reviewed.  Fields that no longer hold the plan's old value are left
+    alone unless forced.
+    
+    Args:
+        plex_client: PlexClient instance
+        clean_logger: CleanLogger instance
+        plan_path: NDJSON or CSV plan file
+        target: Name of the Plex target
+        budget: Optional cap on the number of tracks to update
+        workers: Number of writer threads
+        force: Also write fields changed since the plan was made
         
-        # Try direct path match first
-        if file_path in apple_tracks:
-            apple_track = apple_tracks[file_path]
-            stats['matched_tracks'] += 1
-        else:
-            # Try matching by filename
-            filename = os.path.basename(file_path)
-            for apple_path, metadata in apple_tracks.items():
-                if os.path.basename(apple_path) == filename:
-                    apple_track = metadata
-                    stats['matched_tracks'] += 1
-                    break
+    Returns:
+        Dictionary with statistics about the writes
+    """
+    stats = _new_clean_stats(0)
+    stats['edited_fields'] = 0
+    logger.info(f"Applying change plan {plan_path}...")
+    _write_back(plex_client, clean_logger, read_plan(plan_path), stats, target, budget, workers, force)
+    logger.info(f"Plan applied. Updated {stats['updated_tracks']} of {stats['total_tracks']} tracks.")
+    return stats
+
+
+def undo_run(plex_client: PlexClient, clean_logger: CleanLogger, run_id: str, target: str = '',
+             budget: Optional[WriteBudget] = None, workers: int = 1, force: bool = False,
+             batch_size: int = 200) -> Dict[str, int]:
+    """
+    Write back the values a run replaced.
+    
+    The revert set comes from the clean log; the affected tracks are fetched
+    from Plex in batches and go through a WritePipeline like any other
+    update, so the undo is itself logged (under the current run) and can be
+    undone in turn.  Fields a later run changed again, and fields that no
+    longer show the value the run wrote, are left alone unless forced.
+    
+    Reverted fields are written unlocked, and the run's tracks are dropped
+    from the clean log's current state, so later cleans compare them with
+    Apple Music again.  Failed reverts are not queued for retry; running
+    the undo again picks up whatever is still left.
+    
+    Args:
+        plex_client: PlexClient instance
+        clean_logger: CleanLogger instance holding the history
+        run_id: Run to undo
+        target: Name of the Plex target
+        budget: Optional cap on the number of tracks to update
+        workers: Number of writer threads
+        force: Also revert superseded and since-edited fields
+        batch_size: Number of tracks fetched per request
         
-        if not apple_track:
+    Returns:
+        Dictionary with statistics about the undo
+    """
+    stats = _new_clean_stats(0)
+    stats.update({'superseded_fields': 0, 'edited_fields': 0, 'dropped_retries': 0})
+    reverts = defaultdict(list)
+    for revert in clean_logger.get_run_reverts(run_id, target):
+        if revert['superseded'] and not force:
+            stats['superseded_fields'] += 1
             continue
-            
-        # Compare and update metadata
-        updated = False
-        
-        # Check title
-        if track.title != apple_track['title']:
-            logger.info(f"Updating title for track {track.ratingKey}: '{track.title}' -> '{apple_track['title']}'")
-            clean_logger.record_change(track.ratingKey, 'title', track.title, apple_track['title'])
-            stats['title_updates'] += 1
-            updated = True
-            
-        # Check artist
-        track_artist = getattr(track, 'originalTitle', None) or track.grandparentTitle
-        if track_artist != apple_track['artist']:
-            logger.info(f"Updating artist for track {track.ratingKey}: '{track_artist}' -> '{apple_track['artist']}'")
-            clean_logger.record_change(track.ratingKey, 'artist', track_artist, apple_track['artist'])
-            stats['artist_updates'] += 1
-            updated = True
-            
-        # Check album
-        if track.parentTitle != apple_track['album']:
-            logger.info(f"Updating album for track {track.ratingKey}: '{track.parentTitle}' -> '{apple_track['album']}'")
-            clean_logger.record_change(track.ratingKey, 'album', track.parentTitle, apple_track['album'])
-            stats['album_updates'] += 1
-            updated = True
-            
-        # Update track metadata if needed
-        if updated:
-            plex_client.update_track_metadata(
-                track,
-                title=apple_track['title'],
-                artist=apple_track['artist'],
-                album=apple_track['album']
-            )
-            stats['updated_tracks'] += 1
+        # Expect the value the run left behind and put back the one before it
+        reverts[revert['rating_key']].append((revert['field'], revert['after'], revert['before']))
+    if not reverts and not stats['superseded_fields']:
+        logger.warning(f"No changes logged for run {run_id}{f' on {target}' if target else ''}")
+        return stats
+    
+    logger.info(f"Undoing run {run_id}: {len(reverts)} tracks to revert")
+    _write_back(plex_client, clean_logger,
+                (PlannedTrack(rating_key, 'undo', None, changes) for rating_key, changes in reverts.items()),
+                stats, target, budget, workers, force, batch_size, lock=False, queue_failures=False)
+    
+    stats['dropped_retries'] = clean_logger.finish_undo(run_id, target)
+    return stats
+
+
+def print_undo_stats(run_id: str, stats: Dict[str, int]) -> None:
+    """Print the summary of an undo."""
+    print(f"\n===== Undo of run {run_id} =====")
+    print(f"Tracks to revert: {stats['total_tracks']}")
+    print(f"Reverted tracks: {stats['updated_tracks']}")
+    print(f"Title reverts: {stats['title_updates']}")
+    print(f"Artist reverts: {stats['artist_updates']}")
+    print(f"Album reverts: {stats['album_updates']}")
+    print(f"Changed by a later run (left alone): {stats['superseded_fields']}")
+    print(f"Edited since the run (left alone): {stats['edited_fields']}")
+    print(f"Over write budget: {stats['budget_skipped']}")
+    print(f"Failed updates (run the undo again to retry): {stats['failed_updates']}")
+    print(f"Dropped queued writes of the run: {stats['dropped_retries']}")
+
+
+def print_runs(runs: List[Dict[str, Any]]) -> None:
+    """Print the runs listed by CleanLogger.get_runs()."""
+    if not runs:
+        print("No runs logged yet")
+        return
+    for run in runs:
+        undone = f"  (undone by {run['undone_by']})" if run['undone_by'] else ''
+        print(f"{run['run_id']}  {run['started'][:19]}  {run['command'] or '-':<12} "
+              f"{run['changes']} changes to {run['tracks']} tracks{undone}")
+
+
+def _artist_matches(artist: str, patterns: Optional[List[str]]) -> bool:
+    """Check an artist name against shell-style patterns (case-insensitive)."""
+    artist = (artist or '').lower()
+    return any(fnmatch.fnmatchcase(artist, pattern.lower()) for pattern in patterns or [])
+
+
+def _filter_pages(pages: Iterable[List], include_artists: Optional[List[str]] = None,
+                  exclude_artists: Optional[List[str]] = None) -> Iterator[List]:
+    """Apply the --artist / --exclude-artist patterns to a stream of track pages."""
+    for page in pages:
+        if include_artists:
+            page = [t for t in page if _artist_matches(_track_artist(t), include_artists)]
+        if exclude_artists:
+            page = [t for t in page if not _artist_matches(_track_artist(t), exclude_artists)]
+        yield page
+
+
+def clean_all_tracks(plex_client: PlexClient, apple_music_client: AppleMusicClient, 
+                    clean_logger: CleanLogger, apple_index: Optional[AppleTrackIndex] = None,
+                    target: str = '', budget: Optional[WriteBudget] = None,
+                    plex_tracks: Optional[List] = None,
+                    include_artists: Optional[List[str]] = None,
+                    exclude_artists: Optional[List[str]] = None,
+                    workers: int = 1, page_size: int = 500,
+                    pairs: Optional[Dict[str, str]] = None,
+                    plan: Optional[PlanWriter] = None) -> Dict[str, int]:
+    """
+    Clean metadata for all tracks in the Plex library.
+    
+    Tracks are streamed from Plex page by page and written as they are
+    found, so the first updates happen within seconds of starting.
+    
+    Args:
+        plex_client: PlexClient instance
+        apple_music_client: AppleMusicClient instance
+        clean_logger: CleanLogger instance
+        apple_index: Prebuilt Apple Music index (built from the client if None)
+        target: Name of the Plex target, used to separate clean log entries
+        budget: Optional cap on the number of tracks to update
+        plex_tracks: Already retrieved Plex tracks (streamed page by page if None)
+        include_artists: Only clean artists matching one of these patterns
+        exclude_artists: Skip artists matching any of these patterns
+        workers: Number of writer threads; tracks are routed by artist
+        page_size: Number of Plex tracks fetched per request
+        pairs: Filled with Apple Music path -> Plex rating key for every
+            matched track (see _clean_pages)
+        plan: Only write the planned changes to this plan (nothing is
+            written to Plex and queued retries are left alone)
+        
+    Returns:
+        Dictionary with statistics about the cleaning process
+    """
+    logger.info("Planning full library clean..." if plan else "Starting full library clean...")
+    
+    # Get all tracks from Apple Music
+    if apple_index is None:
+        apple_index = AppleTrackIndex.from_client(apple_music_client)
+    
+    # Writes that failed on earlier runs and are due again go first
+    if plan is None:
+        retry_stats = retry_failed_writes(plex_client, clean_logger, target, budget, workers)
+    else:
+        retry_stats = _new_clean_stats(0)
+    
+    # Stream tracks from Plex unless they were already retrieved
+    if plex_tracks is None:
+        pages = plex_client.iter_track_pages(page_size)
+        total = None if include_artists or exclude_artists else plex_client.count_tracks()
+    else:
+        pages = [plex_tracks]
+        total = None if include_artists or exclude_artists else len(plex_tracks)
+    pages = _filter_pages(pages, include_artists, exclude_artists)
+    
+    stats = _clean_pages(plex_client, pages, apple_index, clean_logger, target, budget,
+                         workers, total, pairs, plan)
+    for key in ('updated_tracks', 'title_updates', 'artist_updates', 'album_updates',
+                'budget_skipped', 'failed_updates', 'queued_retries', 'retried_updates'):
+        stats[key] += retry_stats[key]
     
     logger.info(f"Library clean complete. Updated {stats['updated_tracks']} of {stats['total_tracks']} tracks.")
     return stats
 
 
+def print_clean_stats(stats: Dict[str, int]) -> None:
+    """Print the summary of a non-interactive clean run."""
+    print("\n===== Cleaning Complete =====")
+    print(f"Total tracks: {stats['total_tracks']}")
+    print(f"Matched tracks: {stats['matched_tracks']}")
+    print(f"Updated tracks: {stats['updated_tracks']}")
+    print(f"Title updates: {stats['title_updates']}")
+    print(f"Artist updates: {stats['artist_updates']}")
+    print(f"Album updates: {stats['album_updates']}")
+    print(f"Skipped tracks: {stats['skipped_tracks']}")
+    print(f"Left to the retry queue: {stats['retry_queued']}")
+    print(f"Over write budget: {stats['budget_skipped']}")
+    print(f"Failed updates: {stats['failed_updates']}")
+    print(f"Failed page requests: {stats['failed_pages']}")
+    print(f"Queued for retry: {stats['queued_retries']}")
+    print(f"Retried successfully: {stats['retried_updates']}")
+    print(f"Locked and in sync: {stats['locked_tracks']}")
+    print(f"Drifted fields re-applied: {stats['drifted_fields']}")
+    print(f"Matched from cache: {stats['cached_matches']}")
+    print(f"Matched by size/duration: {stats['size_duration_matches']}")
+    print(f"Ambiguous (left alone): {stats['ambiguous_tracks']}")
+    if 'planned_tracks' in stats:
+        print(f"Planned changes: {stats['planned_changes']} to {stats['planned_tracks']} tracks (nothing written)")
+    if 'edited_fields' in stats:
+        print(f"Changed since the plan (left alone): {stats['edited_fields']}")
+
+
 def clean_artist_tracks(plex_client: PlexClient, apple_music_client: AppleMusicClient, 
                        clean_logger: CleanLogger, artist_name: str) -> Dict[str, int]:
     """
@@ -875,104 +3034,154 @@ def clean_artist_tracks(plex_client: PlexClient, apple_music_client: AppleMusicC
     plex_tracks = plex_client.get_tracks_by_artist(artist_name)
     
     # Get tracks for the artist from Apple Music
-    apple_tracks = apple_music_client.get_tracks_by_artist(artist_name)
+    apple_index = AppleTrackIndex(apple_music_client.get_tracks_by_artist(artist_name))
     
-    # Track statistics
-    stats = {
-        'total_tracks': len(plex_tracks),
-        'matched_tracks': 0,
-        'updated_tracks': 0,
-        'title_updates': 0,
-        'artist_updates': 0,
-        'album_updates': 0,
-        'skipped_tracks': 0
-    }
+    stats = _clean_tracks(plex_client, plex_tracks, apple_index, clean_logger)
     
-    # Get already cleaned tracks to skip
-    cleaned_tracks = clean_logger.get_cleaned_tracks()
+    logger.info(f"Artist clean complete. Updated {stats['updated_tracks']} of {stats['total_tracks']} tracks.")
+    return stats
+
+
+def load_artist_names(names: Optional[List[str]] = None,
+                      names_file: Optional[str] = None) -> List[str]:
+    """
+    Combine artist names given on the command line and in a names file.
     
-    # Process each track
-    for track in plex_tracks:
-        # Skip already cleaned tracks
-        if track.ratingKey in cleaned_tracks:
-            stats['skipped_tracks'] += 1
-            continue
-            
-        # Get file path from track
-        file_path = None
-        try:
-            for media in track.media:
-                for part in media.parts:
-                    file_path = part.file
-                    break
-                if file_path:
-                    break
-        except Exception:
-            continue
-            
-        if not file_path:
-            continue
-            
-        # Try to find matching track in Apple Music
-        apple_track = None
+    The file holds one name per line; blank lines and lines starting with
+    '#' are ignored.  Surrounding whitespace is dropped, empty names are
+    ignored and names differing only in case are kept once.
+    
+    Args:
+        names: Artist names
+        names_file: Path to a file of artist names
         
-        # Try direct path match first
-        if file_path in apple_tracks:
-            apple_track = apple_tracks[file_path]
-            stats['matched_tracks'] += 1
-        else:
-            # Try matching by filename
-            filename = os.path.basename(file_path)
-            for apple_path, metadata in apple_tracks.items():
-                if os.path.basename(apple_path) == filename:
-                    apple_track = metadata
-                    stats['matched_tracks'] += 1
-                    break
+    Returns:
+        List of unique artist names, in the order given
+    """
+    all_names = list(names or [])
+    if names_file:
+        with open(names_file, 'r', encoding='utf-8') as f:
+            all_names.extend(line.strip() for line in f)
+    
+    unique = {}
+    for name in all_names:
+        name = name.strip()
+        if name and not name.startswith('#'):
+            unique.setdefault(name.casefold(), name)
+    return list(unique.values())
+
+
+def clean_artists_tracks(plex_client: PlexClient, apple_music_client: AppleMusicClient,
+                         clean_logger: CleanLogger, artist_names: List[str],
+                         workers: int = 1, budget: Optional[WriteBudget] = None,
+                         plex_tracks: Optional[List] = None,
+                         page_size: int = 500,
+                         plan: Optional[PlanWriter] = None) -> Dict[str, Any]:
+    """
+    Clean metadata for the tracks of many artists in one pass.
+    
+    The Plex library is streamed once, keeping only the requested artists'
+    tracks (matched case-insensitively on album or track artist), and the
+    Apple Music library is filtered once into a single index (artist names
+    match case-insensitively too, on the whole name, so both sides hold
+    the same artists and the size/duration join only sees those).  All
+    changes go through one shared write pipeline.
+    
+    Args:
+        plex_client: PlexClient instance
+        apple_music_client: AppleMusicClient instance
+        clean_logger: CleanLogger instance
+        artist_names: Names of the artists to clean
+        workers: Number of writer threads
+        budget: Optional cap on the number of tracks to update
+        plex_tracks: Already retrieved Plex tracks (streamed if None)
+        page_size: Number of Plex tracks fetched per request
+        plan: Only write the planned changes to this plan
         
-        if not apple_track:
-            continue
-            
-        # Compare and update metadata
-        updated = False
-        
-        # Check title
-        if track.title != apple_track['title']:
-            logger.info(f"Updating title for track {track.ratingKey}: '{track.title}' -> '{apple_track['title']}'")
-            clean_logger.record_change(track.ratingKey, 'title', track.title, apple_track['title'])
-            stats['title_updates'] += 1
-            updated = True
-            
-        # Check artist
-        track_artist = getattr(track, 'originalTitle', None) or track.grandparentTitle
-        if track_artist != apple_track['artist']:
-            logger.info(f"Updating artist for track {track.ratingKey}: '{track_artist}' -> '{apple_track['artist']}'")
-            clean_logger.record_change(track.ratingKey, 'artist', track_artist, apple_track['artist'])
-            stats['artist_updates'] += 1
-            updated = True
-            
-        # Check album
-        if track.parentTitle != apple_track['album']:
-            logger.info(f"Updating album for track {track.ratingKey}: '{track.parentTitle}' -> '{apple_track['album']}'")
-            clean_logger.record_change(track.ratingKey, 'album', track.parentTitle, apple_track['album'])
-            stats['album_updates'] += 1
-            updated = True
-            
-        # Update track metadata if needed
-        if updated:
-            plex_client.update_track_metadata(
-                track,
-                title=apple_track['title'],
-                artist=apple_track['artist'],
-                album=apple_track['album']
-            )
-            stats['updated_tracks'] += 1
+    Returns:
+        Clean statistics, plus 'artists_not_found': requested artists
+        without any Plex track
+    """
+    logger.info(f"Starting clean for {len(artist_names)} artists...")
+    wanted = {name.casefold(): name for name in artist_names}
+    
+    # One Apple Music pass for every requested artist
+    apple_index = AppleTrackIndex({
+        path: metadata
+        for path, metadata in apple_music_client.get_all_tracks().items()
+        if (metadata.get('artist') or '').casefold() in wanted
+    })
+    logger.info(f"Found {len(apple_index)} Apple Music tracks for the requested artists")
+    
+    found = set()
+    
+    def artist_pages():
+        pages = [plex_tracks] if plex_tracks is not None else plex_client.iter_track_pages(page_size)
+        for page in pages:
+            selected = []
+            for track in page:
+                for artist in (track.grandparentTitle, getattr(track, 'originalTitle', None)):
+                    key = (artist or '').casefold()
+                    if key in wanted:
+                        found.add(key)
+                        selected.append(track)
+                        break
+            yield selected
+    
+    stats = _clean_pages(plex_client, artist_pages(), apple_index, clean_logger,
+                         budget=budget, workers=workers, plan=plan)
+    stats['artists_not_found'] = [name for key, name in wanted.items() if key not in found]
+    if stats['artists_not_found']:
+        logger.warning(f"No Plex tracks found for {len(stats['artists_not_found'])} artists: "
+                       f"{', '.join(stats['artists_not_found'])}")
     
     logger.info(f"Artist clean complete. Updated {stats['updated_tracks']} of {stats['total_tracks']} tracks.")
     return stats
 
 
+def _cached_playlist_tracks(plex_client: PlexClient, apple_index: AppleTrackIndex,
+                            apple_track_paths: List[str], clean_logger: CleanLogger,
+                            target: str = '') -> Dict[str, Any]:
+    """
+    Resolve playlist tracks through pairs remembered by earlier clean runs.
+    
+    Known pairs are fetched by rating key in bulk; a pair is only used while
+    the Plex file path and size still match what was recorded.
+    
+    Returns:
+        Dictionary mapping Apple Music paths to Plex track objects
+    """
+    persistent_ids = {}
+    for path in apple_track_paths:
+        persistent_id = apple_index.tracks.get(path, {}).get('persistent_id')
+        if persistent_id:
+            persistent_ids[persistent_id] = path
+    if not persistent_ids:
+        return {}
+    
+    entries = clean_logger.get_matches_by_persistent_id(list(persistent_ids), target)
+    entries = {
+        persistent_id: entry for persistent_id, entry in entries.items()
+        if entry['apple_path'] == persistent_ids[persistent_id]
+        and entry['apple_size'] == apple_index.tracks[entry['apple_path']].get('size')
+    }
+    fetched = plex_client.fetch_tracks([entry['plex_rating_key'] for entry in entries.values()])
+    
+    resolved = {}
+    for persistent_id, entry in entries.items():
+        track = fetched.get(entry['plex_rating_key'])
+        if track is None:
+            continue
+        file_path, size, _ = _get_track_media_info(track)
+        if file_path == entry['plex_path'] and size == entry['plex_size']:
+            resolved[persistent_ids[persistent_id]] = track
+    return resolved
+
+
 def sync_playlist(plex_client: PlexClient, apple_music_client: AppleMusicClient, 
-                 playlist_name: str) -> Dict[str, int]:
+                 playlist_name: str, apple_track_paths: Optional[List[str]] = None,
+                 clean_logger: Optional[CleanLogger] = None, target: str = '',
+                 apple_index: Optional[AppleTrackIndex] = None) -> Dict[str, int]:
     """
     Sync a playlist from Apple Music to Plex.
     
@@ -980,6 +3189,10 @@ def sync_playlist(plex_client: PlexClient, apple_music_client: AppleMusicClient,
         plex_client: PlexClient instance
         apple_music_client: AppleMusicClient instance
         playlist_name: Name of the playlist to sync
+        apple_track_paths: Already resolved playlist tracks (looked up if None)
+        clean_logger: CleanLogger whose remembered track pairs are reused
+        target: Name of the Plex target, used to select remembered pairs
+        apple_index: Prebuilt Apple Music index (built from the client if None)
         
     Returns:
         Dictionary with statistics about the sync process
@@ -987,22 +3200,33 @@ def sync_playlist(plex_client: PlexClient, apple_music_client: AppleMusicClient,
     logger.info(f"Starting sync for playlist: {playlist_name}")
     
     # Get tracks in the playlist from Apple Music
-    apple_track_paths = apple_music_client.get_playlist_tracks(playlist_name)
+    if apple_track_paths is None:
+        apple_track_paths = apple_music_client.get_playlist_tracks(playlist_name)
     
     # Track statistics
     stats = {
         'total_tracks': len(apple_track_paths),
         'matched_tracks': 0,
-        'missing_tracks': 0
+        'missing_tracks': 0,
+        'cached_tracks': 0
     }
     
+    # Tracks paired by earlier clean runs need no search
+    known_tracks = {}
+    if clean_logger is not None and apple_track_paths:
+        if apple_index is None:
+            apple_index = AppleTrackIndex.from_client(apple_music_client)
+        known_tracks = _cached_playlist_tracks(plex_client, apple_index, apple_track_paths,
+                                               clean_logger, target)
+        stats['cached_tracks'] = len(known_tracks)
+    
     # Find matching tracks in Plex
     plex_tracks = []
     missing_tracks = []
     
     for file_path in apple_track_paths:
         # Try to find matching track in Plex
-        plex_track = plex_client.find_track_by_filename(file_path)
+        plex_track = known_tracks.get(file_path) or plex_client.find_track_by_filename(file_path)
         
         if plex_track:
             plex_tracks.append(plex_track)
@@ -1032,8 +3256,427 @@ def sync_playlist(plex_client: PlexClient, apple_music_client: AppleMusicClient,
     return stats
 
 
+def sync_library(plex_client: PlexClient, apple_music_client, clean_logger: CleanLogger,
+                 playlist_names: Optional[List[str]] = None, target: str = '',
+                 budget: Optional[WriteBudget] = None, workers: int = 1,
+                 page_size: int = 500) -> Dict[str, Any]:
+    """
+    Clean all metadata and reconcile playlists in one pass over shared state.
+    
+    The Apple Music library is indexed once and the Plex library is streamed
+    once.  The clean pass records which Plex track every Apple Music track
+    is paired with, so playlists are resolved from that map (one bulk fetch
+    for all playlist tracks) instead of one Plex search per track.
+    
+    Args:
+        plex_client: PlexClient instance
+        apple_music_client: AppleMusicClient or AppleMusicXMLClient instance
+        clean_logger: CleanLogger instance
+        playlist_names: Playlists to sync (all Apple Music playlists if None)
+        target: Name of the Plex target
+        budget: Optional cap on the number of tracks to update
+        workers: Number of writer threads
+        page_size: Number of Plex tracks fetched per request
+        
+    Returns:
+        Dictionary with 'clean' statistics and per-playlist 'playlists' statistics
+    """
+    logger.info("Starting sync...")
+    apple_index = AppleTrackIndex.from_client(apple_music_client)
+    
+    pairs = {}
+    clean_stats = clean_all_tracks(plex_client, apple_music_client, clean_logger,
+                                   apple_index=apple_index, target=target, budget=budget,
+                                   workers=workers, page_size=page_size, pairs=pairs)
+    
+    if playlist_names is None:
+        playlist_names = apple_music_client.get_playlist_names()
+    playlists = {name: apple_music_client.get_playlist_tracks(name) for name in playlist_names}
+    
+    # Fetch every Plex track used by any playlist once
+    needed = {pairs[path] for paths in playlists.values() for path in paths if path in pairs}
+    logger.info(f"Fetching {len(needed)} Plex tracks for {len(playlists)} playlists")
+    plex_tracks = plex_client.fetch_tracks(sorted(needed))
+    existing = plex_client.get_playlists()
+    
+    results = {}
+    for name, paths in playlists.items():
+        tracks = [plex_tracks[pairs[path]] for path in paths
+                  if path in pairs and pairs[path] in plex_tracks]
+        stats = {
+            'total_tracks': len(paths),
+            'matched_tracks': len(tracks),
+            'missing_tracks': len(paths) - len(tracks),
+            'action': 'skipped'
+        }
+        if tracks:
+            stats['action'] = plex_client.reconcile_playlist(name, tracks, existing)
+        else:
+            logger.warning(f"No matching tracks found for playlist '{name}'")
+        results[name] = stats
+    
+    logger.info(f"Sync complete. Updated {clean_stats['updated_tracks']} tracks, "
+                f"reconciled {len(results)} playlists")
+    return {'clean': clean_stats, 'playlists': results}
+
+
+def print_sync_results(results: Dict[str, Any]) -> None:
+    """Print the combined summary of a sync run."""
+    print_clean_stats(results['clean'])
+    
+    playlists = results['playlists']
+    actions = defaultdict(int)
+    for stats in playlists.values():
+        actions[stats['action']] += 1
+    print("\n===== Playlists =====")
+    print(f"Playlists: {len(playlists)}")
+    for action in ('created', 'appended', 'unchanged', 'skipped', 'failed'):
+        print(f"{action.capitalize()}: {actions[action]}")
+    print(f"Playlist tracks matched: {sum(stats['matched_tracks'] for stats in playlists.values())}")
+    print(f"Playlist tracks missing: {sum(stats['missing_tracks'] for stats in playlists.values())}")
+    for name, stats in sorted(playlists.items()):
+        if stats['missing_tracks'] or stats['action'] == 'failed':
+            print(f"  '{name}': {stats['action']}, {stats['missing_tracks']} of "
+                  f"{stats['total_tracks']} tracks missing")
+
+
+# Columns of the rows hashed by verify_library(); rating keys ride along last
+VERIFY_COLUMNS = ('path_key', 'title', 'artist', 'album')
+
+
+def _verify_row(identity: Optional[str], title: Any, artist: Any, album: Any,
+                rating_key: Any = None) -> Tuple:
+    """Build one verify row; values are compared as text."""
+    return (identity, title or '', artist or '', album or '', rating_key)
+
+
+def _artist_bucket(row: Tuple) -> str:
+    return row[2].casefold()
+
+
+def _album_bucket(row: Tuple) -> str:
+    return row[3].casefold()
+
+
+def _bucket_digests(buckets: Dict[str, List[Tuple]]) -> Dict[str, str]:
+    """Digest every bucket over the hashed columns of its rows."""
+    return {
+        bucket: rows_digest(row[:len(VERIFY_COLUMNS)] for row in rows)
+        for bucket, rows in buckets.items()
+    }
+
+
+def verify_library(plex_client: PlexClient, apple_music_client, clean_logger: CleanLogger,
+                   target: str = '', apple_index: Optional[AppleTrackIndex] = None,
+                   page_size: int = 500) -> Dict[str, Any]:
+    """
+    Check whether Plex is still in sync with Apple Music without changing anything.
+    
+    Both libraries are reduced to (path key, title, artist, album) rows; Plex
+    rows use the path key of the Apple track they are paired with.  Rows are
+    bucketed by artist and each bucket is hashed on both sides.  Only buckets
+    whose digests differ are split by album, and only differing albums are
+    compared track by track.
+    
+    Digests are stored in the clean log.  An Apple bucket whose tracks'
+    modification times are unchanged since the last run reuses its stored
+    digest instead of being hashed again.
+    
+    Args:
+        plex_client: PlexClient instance
+        apple_music_client: AppleMusicClient or AppleMusicXMLClient instance
+        clean_logger: CleanLogger instance (pairs are read, digests stored)
+        target: Name of the Plex target
+        apple_index: Prebuilt Apple Music index (built from the client if None)
+        page_size: Number of Plex tracks fetched per request
+        
+    Returns:
+        Drift report
+    """
+    logger.info("Starting verify...")
+    if apple_index is None:
+        apple_index = AppleTrackIndex.from_client(apple_music_client)
+    
+    def apple_key(apple_path: str) -> str:
+        return apple_index.tracks[apple_path].get('path_key') or make_path_key(apple_path)
+    
+    def make_plex_row(track, identity: Optional[str]) -> Tuple:
+        if identity is None:
+            identity = make_path_key(_get_track_file_path(track)) or f"plex:{track.ratingKey}"
+        return _verify_row(identity, track.title, _track_artist(track), track.parentTitle,
+                           str(track.ratingKey))
+    
+    # Plex side: pair tracks with Apple Music (remembered pairs first)
+    plex_rows = []
+    deferred = []
+    claimed = set()
+    failed_pages = plex_client.failed_pages
+    for page in plex_client.iter_track_pages(page_size):
+        known = clean_logger.get_matches(target, [str(track.ratingKey) for track in page])
+        matches, unmatched = apple_index.match_direct(page, known)
+        claimed.update(match.apple_path for match in matches)
+        paired = {id(match.track) for match in matches} | {id(track) for track, _ in unmatched}
+        plex_rows.extend(make_plex_row(match.track, apple_key(match.apple_path)) for match in matches)
+        plex_rows.extend(make_plex_row(track, None) for track in page if id(track) not in paired)
+        deferred.extend(unmatched)
+    joined, _ = apple_index.join_size_duration(deferred, claimed)
+    joined_ids = {id(match.track) for match in joined}
+    plex_rows.extend(make_plex_row(match.track, apple_key(match.apple_path)) for match in joined)
+    plex_rows.extend(make_plex_row(track, None) for track, _ in deferred if id(track) not in joined_ids)
+    
+    # Apple side
+    apple_rows = []
+    apple_modified = {}
+    for path, metadata in apple_index.tracks.items():
+        row = _verify_row(apple_key(path), metadata.get('title'), metadata.get('artist'),
+                          metadata.get('album'))
+        apple_rows.append(row)
+        apple_modified[row[0]] = metadata.get('date_modified')
+    
+    plex_buckets = group_rows(plex_rows, _artist_bucket)
+    apple_buckets = group_rows(apple_rows, _artist_bucket)
+    plex_digests = _bucket_digests(plex_buckets)
+    
+    # Reuse stored Apple digests for buckets that have not changed
+    stored = clean_logger.get_digests('apple', target)
+    apple_digests = {}
+    apple_stamps = {}
+    reused = 0
+    for bucket, rows in apple_buckets.items():
+        stamp = bucket_stamp([apple_modified.get(row[0]) for row in rows])
+        apple_stamps[bucket] = stamp
+        previous = stored.get(bucket)
+        if stamp is not None and previous and previous['stamp'] == stamp:
+            apple_digests[bucket] = previous['digest']
+            reused += 1
+        else:
+            apple_digests[bucket] = rows_digest(row[:len(VERIFY_COLUMNS)] for row in rows)
+    
+    clean_logger.record_digests('plex', {
+        bucket: (digest, None, len(plex_buckets[bucket])) for bucket, digest in plex_digests.items()
+    }, target)
+    clean_logger.record_digests('apple', {
+        bucket: (digest, apple_stamps[bucket], len(apple_buckets[bucket]))
+        for bucket, digest in apple_digests.items()
+    }, target)
+    
+    # Descend into differing artists, then differing albums
+    differing_artists = sorted(
+        bucket for bucket in set(plex_digests) | set(apple_digests)
+        if plex_digests.get(bucket) != apple_digests.get(bucket)
+    )
+    differing_albums = 0
+    plex_changed = {}
+    apple_changed = {}
+    for artist in differing_artists:
+        plex_albums = group_rows(plex_buckets.get(artist, []), _album_bucket)
+        apple_albums = group_rows(apple_buckets.get(artist, []), _album_bucket)
+        plex_album_digests = _bucket_digests(plex_albums)
+        apple_album_digests = _bucket_digests(apple_albums)
+        for album in set(plex_albums) | set(apple_albums):
+            if plex_album_digests.get(album) == apple_album_digests.get(album):
+                continue
+            differing_albums += 1
+            plex_changed.update((row[0], row) for row in plex_albums.get(album, []))
+            apple_changed.update((row[0], row) for row in apple_albums.get(album, []))
+    
+    # Compare the remaining tracks field by field
+    plex_keys = {row[0] for row in plex_rows}
+    apple_keys = {row[0] for row in apple_rows}
+    drift = []
+    for identity, apple_row in apple_changed.items():
+        plex_row = plex_changed.get(identity)
+        if plex_row is None:
+            continue
+        for column, field in enumerate(VERIFY_COLUMNS[1:], start=1):
+            if plex_row[column] != apple_row[column]:
+                drift.append((plex_row[4], field, plex_row[column], apple_row[column]))
+    
+    report = {
+        'plex_tracks': len(plex_rows),
+        'apple_tracks': len(apple_rows),
+        'artists': len(set(plex_digests) | set(apple_digests)),
+        'reused_apple_digests': reused,
+        'differing_artists': differing_artists,
+        'differing_albums': differing_albums,
+        'field_drift': sorted(drift, key=lambda item: (item[0], item[1])),
+        'missing_in_plex': sorted(key for key in apple_changed if key not in plex_keys),
+        'unmatched_in_plex': sorted(row[4] for key, row in plex_changed.items() if key not in apple_keys),
+        'failed_pages': plex_client.failed_pages - failed_pages
+    }
+    logger.info(f"Verify complete. {len(differing_artists)} of {report['artists']} artists differ "
+                f"({len(drift)} field differences)")
+    return report
+
+
+def print_verify_report(report: Dict[str, Any], limit: int = 50) -> None:
+    """Print a drift report from verify_library()."""
+    print("\n===== Verify Report =====")
+    print(f"Plex tracks: {report['plex_tracks']}")
+    print(f"Apple Music tracks: {report['apple_tracks']}")
+    print(f"Artists compared: {report['artists']} "
+          f"({report['reused_apple_digests']} Apple digests reused)")
+    print(f"Artists differing: {len(report['differing_artists'])}")
+    print(f"Albums differing: {report['differing_albums']}")
+    print(f"Field differences: {len(report['field_drift'])}")
+    print(f"Apple Music tracks missing in Plex: {len(report['missing_in_plex'])}")
+    print(f"Plex tracks not in Apple Music: {len(report['unmatched_in_plex'])}")
+    if report['failed_pages']:
+        print(f"Failed page requests: {report['failed_pages']} (Plex side incomplete)")
+    
+    for rating_key, field, plex_value, apple_value in report['field_drift'][:limit]:
+        print(f"  Track {rating_key} {field}: Plex '{plex_value}' / Apple Music '{apple_value}'")
+    if len(report['field_drift']) > limit:
+        print(f"  ... and {len(report['field_drift']) - limit} more")
+
+
+def load_targets(targets_path: str) -> List[Dict[str, Any]]:
+    """
+    Load the list of Plex (server, section) targets for a multi-target run.
+    
+    The file is JSON – a list of servers, each with one or more music sections::
+    
+        [
+          {"name": "home", "url": "http://192.168.1.5:32400", "token": "...",
+           "sections": [27, 31], "max_writes": 5000, "playlist_section": 27,
+           "library_db": "/var/lib/plexmediaserver/.../com.plexapp.plugins.library.db"},
+          {"name": "cabin", "url": "http://10.0.0.2:32400", "sections": [5]}
+        ]
+    
+    ``token`` defaults to ``SOOBIN_TOKEN``.  ``library_db`` is optional and
+    only useful when the server's database is reachable from this machine.  Plex playlists are server-wide, so
+    playlists are only synced through ``playlist_section`` (default: the first
+    section) to stop sections of the same server overwriting each other.
+    
+    Args:
+        targets_path: Path to the JSON targets file
+        
+    Returns:
+        One dictionary per (server, section) pair
+    """
+    with open(targets_path, 'r', encoding='utf-8') as f:
+        servers = json.load(f)
+    
+    targets = []
+    for server in servers:
+        sections = [int(section) for section in server.get('sections') or [server['section']]]
+        playlist_section = int(server.get('playlist_section', sections[0]))
+        for section in sections:
+            name = server.get('name') or server['url']
+            targets.append({
+                'name': f"{name}:{section}" if len(sections) > 1 else name,
+                'url': server['url'],
+                'token': server.get('token') or os.environ.get('SOOBIN_TOKEN'),
+                'section': section,
+                'max_writes': server.get('max_writes'),
+                'library_db': server.get('library_db'),
+                'sync_playlists': section == playlist_section
+            })
+    return targets
+
+
+def _run_target(target: Dict[str, Any], apple_music_client, apple_index: AppleTrackIndex,
+                playlists: Dict[str, List[str]], clean_logger: CleanLogger) -> Dict[str, Any]:
+    """
+    Clean one Plex target and sync its playlists against the shared Apple data.
+    
+    Returns:
+        Dictionary with the clean statistics and per-playlist statistics
+    """
+    name = target['name']
+    try:
+        plex_client = PlexClient(target['url'], target['token'], target['section'],
+                                 target.get('library_db'))
+    except SystemExit:
+        # PlexClient.connect() exits on failure – only this target is lost
+        return {'error': f"Could not connect to {target['url']} section {target['section']}"}
+    
+    try:
+        result = {
+            'clean': clean_all_tracks(
+                plex_client, apple_music_client, clean_logger,
+                apple_index=apple_index, target=name,
+                budget=WriteBudget(target.get('max_writes'))
+            ),
+            'playlists': {}
+        }
+        
+        if target.get('sync_playlists'):
+            for playlist_name, track_paths in playlists.items():
+                result['playlists'][playlist_name] = sync_playlist(
+                    plex_client, apple_music_client, playlist_name, track_paths,
+                    clean_logger=clean_logger, target=name, apple_index=apple_index
+                )
+    finally:
+        plex_client.close()
+    return result
+
+
+def run_targets(targets: List[Dict[str, Any]], apple_music_client, clean_logger: CleanLogger,
+                playlist_names: Optional[List[str]] = None,
+                max_workers: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Clean and sync several Plex targets concurrently from one Apple Music load.
+    
+    The Apple Music library is read and indexed once; every target then runs
+    on its own worker thread with its own write budget.
+    
+    Args:
+        targets: Targets as returned by load_targets()
+        apple_music_client: AppleMusicClient or AppleMusicXMLClient instance
+        clean_logger: CleanLogger instance shared by all targets
+        playlist_names: Apple Music playlists to sync to each target
+        max_workers: Maximum number of targets processed at once
+        
+    Returns:
+        Dictionary mapping target names to their results
+    """
+    logger.info(f"Starting multi-target run for {len(targets)} Plex targets...")
+    
+    # Load Apple Music once – the clients are not shared across threads
+    apple_index = AppleTrackIndex.from_client(apple_music_client)
+    playlists = {
+        name: apple_music_client.get_playlist_tracks(name)
+        for name in playlist_names or []
+    }
+    
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers or len(targets) or 1) as executor:
+        futures = {
+            executor.submit(_run_target, target, apple_music_client, apple_index,
+                            playlists, clean_logger): target['name']
+            for target in targets
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                logger.error(f"Target '{name}' failed: {str(e)}")
+                results[name] = {'error': str(e)}
+    
+    return results
+
+
+def print_target_results(results: Dict[str, Dict[str, Any]]) -> None:
+    """Print a per-target summary of a multi-target run."""
+    print("\n===== Multi-target Results =====")
+    for name in sorted(results):
+        result = results[name]
+        if 'error' in result:
+            print(f"{name}: FAILED – {result['error']}")
+            continue
+        stats = result['clean']
+        print(f"{name}: updated {stats['updated_tracks']} of {stats['total_tracks']} tracks "
+              f"(matched {stats['matched_tracks']}, over budget {stats['budget_skipped']})")
+        for playlist_name, playlist_stats in result['playlists'].items():
+            print(f"  Playlist '{playlist_name}': {playlist_stats['matched_tracks']} of "
+                  f"{playlist_stats['total_tracks']} tracks matched")
+
+
 def interactive_clean_all(plex_client: PlexClient, apple_music_client: AppleMusicClient, 
-                         clean_logger: CleanLogger, threshold: int = 10) -> Dict[str, int]:
+                         clean_logger: CleanLogger, threshold: int = 10,
+                         plex_tracks: Optional[List] = None) -> Dict[str, int]:
     """
     Interactive clean of all artists in the Plex library.
     
@@ -1042,6 +3685,7 @@ def interactive_clean_all(plex_client: PlexClient, apple_music_client: AppleMusi
         apple_music_client: AppleMusicClient instance
         clean_logger: CleanLogger instance
         threshold: Maximum number of tracks to list individually
+        plex_tracks: Already retrieved Plex tracks (fetched if None)
         
     Returns:
         Dictionary with statistics about the cleaning process
@@ -1049,12 +3693,13 @@ def interactive_clean_all(plex_client: PlexClient, apple_music_client: AppleMusi
     logger.info("Starting interactive library clean...")
     
     # Get all tracks from Plex
-    plex_tracks = plex_client.get_all_tracks()
+    if plex_tracks is None:
+        plex_tracks = plex_client.get_all_tracks()
     
     # Group tracks by artist
     artists_tracks = defaultdict(list)
     for track in plex_tracks:
-        artist = getattr(track, 'originalTitle', None) or track.grandparentTitle
+        artist = _track_artist(track)
         artists_tracks[artist].append(track)
     
     # Sort artists alphabetically
@@ -1154,6 +3799,106 @@ def interactive_clean_all(plex_client: PlexClient, apple_music_client: AppleMusi
     return stats
 
 
+def load_libraries(plex_args: Tuple[str, str, int, Optional[str]], xml_path: Optional[str] = None,
+                   library_path: Optional[str] = None,
+                   fetch_plex_tracks: bool = False, sources: Optional[List[str]] = None,
+                   precedence: str = 'newest') -> Tuple[PlexClient, Optional[List], Any]:
+    """
+    Connect to Plex and load the Apple Music library at the same time.
+    
+    The Plex connection (and, if requested, the full track snapshot) is
+    network-bound and runs on a background thread.  XML parsing is CPU-bound
+    and runs in a worker process that hands back only a compact snapshot.
+    The SQLite client is opened on the calling thread, since its connection
+    cannot be moved between threads.  Startup therefore takes roughly as long
+    as the slower of the two sides instead of their sum.
+    
+    Args:
+        plex_args: (url, token, section_id, library_db) for PlexClient
+        xml_path: Path to an Apple Music XML export, if one is used
+        library_path: Path to the .musiclibrary bundle / database otherwise
+        fetch_plex_tracks: Also retrieve every Plex track while Apple loads
+        sources: Several libraries to merge instead (see load_merged_library())
+        precedence: Merge precedence for sources
+        
+    Returns:
+        Tuple of (PlexClient, Plex tracks or None, Apple Music client)
+    """
+    def plex_side():
+        plex_client = PlexClient(*plex_args)
+        return plex_client, plex_client.get_all_tracks() if fetch_plex_tracks else None
+    
+    with ThreadPoolExecutor(max_workers=1) as threads:
+        plex_future = threads.submit(plex_side)
+        
+        if sources:
+            apple_music_client = load_merged_library(sources, precedence)
+        elif xml_path:
+            # Spawn rather than fork: this process already runs the Plex
+            # loader and log listener threads, which fork would copy mid-flight
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'),
+                                     initializer=_init_worker_logging,
+                                     initargs=(logging.getLogger().level,)) as processes:
+                snapshot = processes.submit(load_library_snapshot, xml_path).result()
+            apple_music_client = AppleMusicXMLClient(xml_path, snapshot=snapshot)
+        else:
+            apple_music_client = AppleMusicClient(library_path)
+        
+        plex_client, plex_tracks = plex_future.result()
+    
+    return plex_client, plex_tracks, apple_music_client
+
+
+def load_source_snapshot(source: str) -> Dict[str, Any]:
+    """
+    Load one Apple Music library (XML export or database) as a snapshot.
+    
+    Module-level so it can run in a worker process.
+    
+    Args:
+        source: XML export, or .musiclibrary bundle / database
+        
+    Returns:
+        Snapshot in the format of AppleMusicXMLClient.to_snapshot()
+    """
+    if xml_library_suffix(source):
+        return load_library_snapshot(source)
+    apple_music_client = AppleMusicClient(source)
+    try:
+        return apple_music_client.to_snapshot()
+    finally:
+        apple_music_client.close()
+
+
+def load_merged_library(sources: List[str], precedence: str = 'newest') -> Any:
+    """
+    Load several Apple Music libraries at once and merge them into one.
+    
+    Each library is parsed in its own worker process; the merged library
+    is served by an AppleMusicXMLClient, so the clean, verify and playlist
+    flows use it like a single export.
+    
+    Args:
+        sources: XML exports and/or .musiclibrary bundles, in priority order
+        precedence: 'newest' (latest Date Modified wins) or 'priority'
+                    (earlier source wins)
+        
+    Returns:
+        AppleMusicXMLClient holding the merged library
+    """
+    workers = min(len(sources), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker_logging,
+                             initargs=(logging.getLogger().level,)) as processes:
+        snapshots = list(processes.map(load_source_snapshot, sources))
+    for source, snapshot in zip(sources, snapshots):
+        logger.info(f"Loaded {len(snapshot['tracks'])} tracks from {source}")
+    merged = merge_library_snapshots(snapshots, precedence)
+    logger.info(f"Merged {len(sources)} Apple Music libraries into {len(merged['tracks'])} tracks "
+                f"({precedence} wins)")
+    return AppleMusicXMLClient(' + '.join(sources), snapshot=merged)
+
+
 def interactive_menu(plex_client: PlexClient, apple_music_client: AppleMusicClient, 
                     clean_logger: CleanLogger) -> None:
     """
@@ -1197,7 +3942,8 @@ def interactive_menu(plex_client: PlexClient, apple_music_client: AppleMusicClie
             print(f"Skipped tracks: {stats['skipped_tracks']}")
         elif choice == '3':
             playlist_name = input("Enter playlist name: ")
-            stats = sync_playlist(plex_client, apple_music_client, playlist_name)
+            stats = sync_playlist(plex_client, apple_music_client, playlist_name,
+                                  clean_logger=clean_logger)
             print("\nPlaylist sync complete!")
             print(f"Total tracks in playlist: {stats['total_tracks']}")
             print(f"Matched tracks: {stats['matched_tracks']}")
@@ -1222,41 +3968,263 @@ def main():
     
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='Sync Plex music metadata with Apple Music')
+    parser.add_argument('--log-file', default='plex_music_cleaner.log',
+                        help='Log file (rotated at 10 MB, 5 files kept)')
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help='Level for run-level messages')
+    parser.add_argument('--track-log', default='all', choices=list(TRACK_LOG_LEVELS),
+                        help='Per-track log lines: all, warnings only, or none (errors are always logged)')
+    parser.add_argument('--progress-interval', type=float, default=10.0, metavar='SECONDS',
+                        help='Seconds between aggregated progress lines')
+    parser.add_argument('--library', action='append', default=None, metavar='PATH',
+                        help='Apple Music library to use: an XML export (.xml, .xml.gz, .xml.bz2, '
+                             '.xml.xz) or a .musiclibrary bundle / database (default: newest XML '
+                             'export in the current directory, else $LIBRARY_MUSICFILE). Repeat to '
+                             'merge several libraries, matched by file path')
+    parser.add_argument('--precedence', default='newest', choices=list(MERGE_PRECEDENCE),
+                        help='With several --library options: the most recently modified copy of '
+                             'a track wins (newest), or the earliest listed library wins (priority)')
+    parser.add_argument('--plex-db', default=os.environ.get('PLEX_LIBRARY_DB'), metavar='PATH',
+                        help='Read tracks from this com.plexapp.plugins.library.db (read-only) '
+                             'instead of the Plex API; edits still use the API (default: $PLEX_LIBRARY_DB)')
     subparsers = parser.add_subparsers(dest='command', help='Command to run')
     
     # Clean all command
     clean_all_parser = subparsers.add_parser('clean-all', help='Clean metadata for all tracks')
+    clean_all_parser.add_argument('--yes', '-y', action='store_true',
+                                  help='Run non-interactively without per-artist prompts')
+    clean_all_parser.add_argument('--artist', action='append', default=[],
+                                  help='Only clean artists matching this pattern (repeatable, wildcards allowed)')
+    clean_all_parser.add_argument('--exclude-artist', action='append', default=[],
+                                  help='Skip artists matching this pattern (repeatable, wildcards allowed)')
+    clean_all_parser.add_argument('--workers', type=int, default=4,
+                                  help='Writer threads for --yes runs (tracks are routed by artist)')
+    clean_all_parser.add_argument('--page-size', type=int, default=500,
+                                  help='Plex tracks fetched per request for --yes runs')
+    clean_all_parser.add_argument('--max-writes', type=int, default=None,
+                                  help='Maximum number of tracks to update in this run')
+    clean_all_parser.add_argument('--plan-out', default=None, metavar='FILE',
+                                  help='Write the planned changes to FILE (.csv for CSV, else NDJSON) '
+                                       'instead of to Plex; implies --yes')
     
     # Clean artist command
-    clean_artist_parser = subparsers.add_parser('clean-artist', help='Clean metadata for tracks by a specific artist')
-    clean_artist_parser.add_argument('--name', required=True, help='Name of the artist')
+    clean_artist_parser = subparsers.add_parser('clean-artist', help='Clean metadata for tracks by specific artists')
+    clean_artist_parser.add_argument('--name', action='append', default=[],
+                                     help='Name of the artist (repeatable)')
+    clean_artist_parser.add_argument('--names-file', default=None,
+                                     help='File with one artist name per line')
+    clean_artist_parser.add_argument('--workers', type=int, default=4,
+                                     help='Writer threads when cleaning several artists')
+    clean_artist_parser.add_argument('--max-writes', type=int, default=None,
+                                     help='Maximum number of tracks to update in this run')
+    clean_artist_parser.add_argument('--plan-out', default=None, metavar='FILE',
+                                     help='Write the planned changes to FILE (.csv for CSV, else NDJSON) '
+                                          'instead of to Plex')
     
     # Sync playlist command
     sync_playlist_parser = subparsers.add_parser('sync-playlist', help='Sync a playlist from Apple Music to Plex')
     sync_playlist_parser.add_argument('--name', required=True, help='Name of the playlist')
     
+    # Sync command
+    sync_parser = subparsers.add_parser(
+        'sync', help='Clean all metadata, then reconcile playlists, in one pass'
+    )
+    sync_parser.add_argument('--playlist', action='append', default=None,
+                             help='Apple Music playlist to sync (repeatable; default: all playlists)')
+    sync_parser.add_argument('--workers', type=int, default=4,
+                             help='Writer threads (tracks are routed by artist)')
+    sync_parser.add_argument('--max-writes', type=int, default=None,
+                             help='Maximum number of tracks to update in this run')
+    sync_parser.add_argument('--page-size', type=int, default=500,
+                             help='Plex tracks fetched per request')
+    
+    # Verify command
+    verify_parser = subparsers.add_parser(
+        'verify', help='Report where Plex has drifted from Apple Music, without changing anything'
+    )
+    verify_parser.add_argument('--page-size', type=int, default=500,
+                               help='Plex tracks fetched per request')
+    
+    # Multi-target command
+    multi_target_parser = subparsers.add_parser(
+        'multi-target', help='Clean and sync several Plex servers/sections from one Apple Music load'
+    )
+    multi_target_parser.add_argument('--targets', default=os.environ.get('PLEX_TARGETS'),
+                                     help='JSON file listing Plex servers and sections (default: $PLEX_TARGETS)')
+    multi_target_parser.add_argument('--playlist', action='append', default=[],
+                                     help='Apple Music playlist to sync to every target (repeatable)')
+    multi_target_parser.add_argument('--workers', type=int, default=None,
+                                     help='Maximum number of targets processed concurrently')
+    
+    # Retry command
+    retry_parser = subparsers.add_parser('retry-failed', help='Retry Plex writes that failed on earlier runs')
+    retry_parser.add_argument('--all', action='store_true',
+                              help='Ignore the backoff schedule and the attempt limit')
+    retry_parser.add_argument('--workers', type=int, default=4, help='Writer threads')
+    
+    # Commands that write to a multi-target target connect to its server
+    target_help = 'multi-target target to write to (its server is read from --targets)'
+    targets_help = 'JSON targets file for --target (default: $PLEX_TARGETS)'
+    retry_parser.add_argument('--target', default='', metavar='NAME', help=target_help)
+    retry_parser.add_argument('--targets', default=os.environ.get('PLEX_TARGETS'), help=targets_help)
+    
+    # Undo command
+    undo_parser = subparsers.add_parser('undo', help='Revert the changes of an earlier run')
+    undo_parser.add_argument('--run', metavar='RUN_ID',
+                             help='Run to undo (without it, the recent runs are listed)')
+    undo_parser.add_argument('--force', action='store_true',
+                             help='Also revert fields changed since the run (by a later run or by hand)')
+    undo_parser.add_argument('--target', default='', metavar='NAME', help=target_help)
+    undo_parser.add_argument('--targets', default=os.environ.get('PLEX_TARGETS'), help=targets_help)
+    undo_parser.add_argument('--workers', type=int, default=4, help='Writer threads')
+    undo_parser.add_argument('--max-writes', type=int, default=None, metavar='N',
+                             help='Revert at most N tracks')
+    
+    # Apply command
+    apply_parser = subparsers.add_parser('apply', help='Write the changes of a --plan-out file to Plex')
+    apply_parser.add_argument('--from', dest='plan_file', required=True, metavar='FILE',
+                              help='Plan file (.csv for CSV, else NDJSON)')
+    apply_parser.add_argument('--force', action='store_true',
+                              help='Also write fields that changed since the plan was made')
+    apply_parser.add_argument('--target', default='', metavar='NAME', help=target_help)
+    apply_parser.add_argument('--targets', default=os.environ.get('PLEX_TARGETS'), help=targets_help)
+    apply_parser.add_argument('--workers', type=int, default=4, help='Writer threads')
+    apply_parser.add_argument('--max-writes', type=int, default=None, metavar='N',
+                              help='Update at most N tracks')
+    
+    # Compact command
+    compact_parser = subparsers.add_parser('compact', help='Fold old clean log history into daily summaries')
+    compact_parser.add_argument('--older-than', type=int, default=365, metavar='DAYS',
+                                help='Summarize history older than this many days (default: 365)')
+    
     args = parser.parse_args()
     
+    log_listener = configure_logging(
+        args.log_file, getattr(logging, args.log_level), args.track_log, args.progress_interval
+    )
+    # Flush queued log records on every exit path, including sys.exit()
+    atexit.register(log_listener.stop)
+    
+    # Maintenance commands only need the clean log
+    if args.command == 'compact':
+        clean_logger = CleanLogger()
+        try:
+            folded = clean_logger.compact(args.older_than)
+            print(f"Folded {folded} change records older than {args.older_than} days into daily summaries")
+        finally:
+            clean_logger.close()
+        return
+    
+    multi_target = args.command == 'multi-target'
+    if multi_target and not args.targets:
+        parser.error('multi-target requires --targets or PLEX_TARGETS')
+    
+    artist_names = []
+    if args.command == 'clean-artist':
+        try:
+            artist_names = load_artist_names(args.name, args.names_file)
+        except OSError as e:
+            parser.error(f"cannot read names file: {e}")
+        if not artist_names:
+            parser.error('clean-artist requires --name or --names-file')
+    
+    if args.command == 'undo' and not args.run:
+        clean_logger = CleanLogger()
+        try:
+            print_runs(clean_logger.get_runs())
+        finally:
+            clean_logger.close()
+        return
+    
+    # Retrying queued writes, undoing a run and applying a plan only need
+    # Plex and the clean log.  A target's rating keys only mean something on
+    # that target's own server, so --target never falls back to the .env one.
+    if args.command in ('retry-failed', 'undo', 'apply'):
+        if args.target:
+            if not args.targets:
+                parser.error('--target requires --targets or PLEX_TARGETS')
+            try:
+                targets = {target['name']: target for target in load_targets(args.targets)}
+            except (OSError, ValueError, KeyError) as e:
+                parser.error(f"cannot read targets file: {e}")
+            target = targets.get(args.target)
+            if target is None:
+                parser.error(f"unknown target '{args.target}' (known: {', '.join(sorted(targets))})")
+            plex_client = PlexClient(target['url'], target['token'], target['section'],
+                                     target.get('library_db'))
+        else:
+            missing_vars = [var for var in ('SOOBIN_URL', 'SOOBIN_TOKEN', 'MUSIC_SECTION')
+                            if not os.environ.get(var)]
+            if missing_vars:
+                logger.error(f"Missing required environment variables: {', '.join(missing_vars)}")
+                sys.exit(1)
+            plex_client = PlexClient(os.environ.get('SOOBIN_URL'), os.environ.get('SOOBIN_TOKEN'),
+                                     int(os.environ.get('MUSIC_SECTION')))
+        clean_logger = CleanLogger(command=args.command)
+        try:
+            if args.command == 'undo':
+                stats = undo_run(plex_client, clean_logger, args.run, target=args.target,
+                                 budget=WriteBudget(args.max_writes), workers=args.workers,
+                                 force=args.force)
+                print_undo_stats(args.run, stats)
+            elif args.command == 'apply':
+                stats = apply_plan(plex_client, clean_logger, args.plan_file, target=args.target,
+                                   budget=WriteBudget(args.max_writes), workers=args.workers,
+                                   force=args.force)
+                print_clean_stats(stats)
+            else:
+                stats = retry_failed_writes(plex_client, clean_logger, target=args.target,
+                                            workers=args.workers, due_only=not args.all)
+                print(f"Retried {stats['total_tracks']} queued writes: {stats['retried_updates']} "
+                      f"succeeded, {stats['queued_retries']} failed again")
+            if stats['failed_updates']:
+                sys.exit(1)
+        finally:
+            clean_logger.close()
+            plex_client.close()
+        return
+    
     # ------------------------------------------------------------------
     # Apple Music source-of-truth selection
-    # Prefer an XML export (dropped in the repo root) if one is present.
-    # Otherwise fall back to the SQLite-based AppleMusicClient that works
-    # with the .musiclibrary bundle / network share / ssh.
+    # An explicit --library wins (several are merged into one library).
+    # Otherwise prefer the newest XML export
+    # (plain or compressed) in the working directory, and fall back to the
+    # SQLite-based AppleMusicClient that works with the .musiclibrary
+    # bundle / network share / ssh.
     # ------------------------------------------------------------------
     xml_used = False
     xml_path: Optional[str] = None
-    xml_candidates = [f for f in os.listdir('.') if f.lower().endswith('.xml')]
-    if xml_candidates and AppleMusicXMLClient:
-        # Use the first XML file found
-        xml_path = os.path.abspath(xml_candidates[0])
+    library_path = os.environ.get('LIBRARY_MUSICFILE')
+    libraries = []
+    for path in args.library or []:
+        # user@host:/path exports are streamed over SSH and kept as given
+        if AppleMusicXMLClient and xml_library_suffix(path) and not parse_ssh_location(path):
+            path = os.path.abspath(path)
+        libraries.append(path)
+    sources = libraries if len(libraries) > 1 else None
+    if sources:
+        if not AppleMusicXMLClient:
+            logger.error("Merging several libraries needs apple_music_xml_client.py")
+            sys.exit(1)
+        xml_used = True
+        logger.info(f"Merging Apple Music libraries ({args.precedence} wins): {', '.join(sources)}")
+    elif libraries and not (AppleMusicXMLClient and xml_library_suffix(libraries[0])):
+        library_path = libraries[0]
+    elif libraries:
+        xml_path = libraries[0]
+    elif AppleMusicXMLClient:
+        xml_path = find_xml_library('.')
+    if xml_path:
         xml_used = True
-        logger.info(f\"Using Apple Music XML library: {xml_path}\")
+        logger.info(f"Using Apple Music XML library: {xml_path}")
 
     # Check required environment variables
-    required_vars = ['SOOBIN_URL', 'SOOBIN_TOKEN', 'MUSIC_SECTION']
+    # (multi-target runs take their servers from the targets file instead)
+    required_vars = [] if multi_target else ['SOOBIN_URL', 'SOOBIN_TOKEN', 'MUSIC_SECTION']
     if not xml_used:
         # We'll still need the path to the .musiclibrary / db
-        required_vars.append('LIBRARY_MUSICFILE')
+        if not library_path:
+            required_vars.append('LIBRARY_MUSICFILE')
     missing_vars = [var for var in required_vars if not os.environ.get(var)]
     
     if missing_vars:
@@ -1266,33 +4234,102 @@ def main():
     
     # Initialize clients
     try:
-        plex_client = PlexClient(
-            os.environ.get('SOOBIN_URL'),
-            os.environ.get('SOOBIN_TOKEN'),
-            int(os.environ.get('MUSIC_SECTION'))
-        )
-
-        # Instantiate the appropriate Apple Music client
-        if xml_used:
+        plex_tracks = None
+        if multi_target:
+            # Instantiate the appropriate Apple Music client
+            if sources:
+                apple_music_client = load_merged_library(sources, args.precedence)
+            elif xml_used:
+                try:
+                    apple_music_client = AppleMusicXMLClient(xml_path)  # type: ignore
+                except Exception as exc:
+                    logger.error(f"Failed to load Apple Music XML library: {exc}")
+                    sys.exit(1)
+            else:
+                apple_music_client = AppleMusicClient(library_path)
+        else:
+            # Connect to Plex while the Apple Music library loads
+            plex_args = (
+                os.environ.get('SOOBIN_URL'),
+                os.environ.get('SOOBIN_TOKEN'),
+                int(os.environ.get('MUSIC_SECTION')),
+                args.plex_db
+            )
             try:
-                apple_music_client = AppleMusicXMLClient(xml_path)  # type: ignore
+                plex_client, plex_tracks, apple_music_client = load_libraries(
+                    plex_args,
+                    xml_path=xml_path,
+                    library_path=library_path,
+                    # Non-interactive cleans stream their tracks instead
+                    fetch_plex_tracks=args.command == 'clean-all' and not (args.yes or args.plan_out),
+                    sources=sources,
+                    precedence=args.precedence
+                )
+            except SystemExit:
+                raise
             except Exception as exc:
-                logger.error(f"Failed to load Apple Music XML library: {exc}")
+                logger.error(f"Failed to load Apple Music library: {exc}")
                 sys.exit(1)
-        else:
-            apple_music_client = AppleMusicClient(
-                os.environ.get('LIBRARY_MUSICFILE')
-            )
         
-        clean_logger = CleanLogger()
+        clean_logger = CleanLogger(command=args.command or 'interactive')
+        
+        # Planned changes go to a file instead of to Plex
+        plan = PlanWriter(args.plan_out) if getattr(args, 'plan_out', None) else None
         
         # Run the appropriate command
-        if args.command == 'clean-all':
-            interactive_clean_all(plex_client, apple_music_client, clean_logger)
+        if args.command == 'clean-all' and (args.yes or plan):
+            stats = clean_all_tracks(
+                plex_client, apple_music_client, clean_logger,
+                budget=WriteBudget(args.max_writes),
+                plex_tracks=plex_tracks,
+                include_artists=args.artist,
+                exclude_artists=args.exclude_artist,
+                workers=args.workers,
+                page_size=args.page_size,
+                plan=plan
+            )
+            print_clean_stats(stats)
+            if stats['failed_updates'] or stats['failed_pages']:
+                sys.exit(1)
+        elif args.command == 'clean-all':
+            interactive_clean_all(plex_client, apple_music_client, clean_logger,
+                                  plex_tracks=plex_tracks)
+        elif (args.command == 'clean-artist' and len(artist_names) == 1 and args.max_writes is None
+              and not plan):
+            clean_artist_tracks(plex_client, apple_music_client, clean_logger, artist_names[0])
         elif args.command == 'clean-artist':
-            clean_artist_tracks(plex_client, apple_music_client, clean_logger, args.name)
+            stats = clean_artists_tracks(
+                plex_client, apple_music_client, clean_logger, artist_names,
+                workers=args.workers, budget=WriteBudget(args.max_writes), plan=plan
+            )
+            print_clean_stats(stats)
+            for name in stats['artists_not_found']:
+                print(f"No Plex tracks found for artist: {name}")
+            if stats['failed_updates'] or stats['failed_pages']:
+                sys.exit(1)
         elif args.command == 'sync-playlist':
-            sync_playlist(plex_client, apple_music_client, args.name)
+            sync_playlist(plex_client, apple_music_client, args.name, clean_logger=clean_logger)
+        elif args.command == 'sync':
+            results = sync_library(plex_client, apple_music_client, clean_logger,
+                                   playlist_names=args.playlist,
+                                   budget=WriteBudget(args.max_writes),
+                                   workers=args.workers, page_size=args.page_size)
+            print_sync_results(results)
+            if results['clean']['failed_updates'] or results['clean']['failed_pages'] or any(
+                    stats['action'] == 'failed' for stats in results['playlists'].values()):
+                sys.exit(1)
+        elif args.command == 'verify':
+            report = verify_library(plex_client, apple_music_client, clean_logger,
+                                    page_size=args.page_size)
+            print_verify_report(report)
+            if report['field_drift'] or report['failed_pages']:
+                sys.exit(1)
+        elif multi_target:
+            results = run_targets(load_targets(args.targets), apple_music_client, clean_logger,
+                                  args.playlist, args.workers)
+            print_target_results(results)
+            if any('error' in result or result['clean']['failed_pages'] for result in results.values()):
+                sys.exit(1)
         else:
             # No command specified, show interactive menu
             interactive_menu(plex_client, apple_music_client, clean_logger)
@@ -1301,8 +4338,12 @@ def main():
         sys.exit(1)
     finally:
         # Clean up resources
+        if locals().get('plan') is not None:
+            plan.close()
         if 'apple_music_client' in locals():
             apple_music_client.close()
+        if 'plex_client' in locals():
+            plex_client.close()
         if 'clean_logger' in locals():
             clean_logger.close()
 
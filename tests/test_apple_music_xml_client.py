@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Checks playlist lookups and how the snapshots of several Apple Music
+libraries are merged.
+
+Snapshots are built by hand in the shape AppleMusicXMLClient.to_snapshot()
+returns, so no XML export is needed.
+"""
+
+import os
+import sys
+import unittest
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from apple_music_xml_client import AppleMusicXMLClient, merge_library_snapshots  # noqa: E402
+
+
+def snapshot_track(track_id, path, title='Title', date_modified=0):
+    """Build a snapshot track tuple (see SNAPSHOT_FIELDS)."""
+    return (track_id, path, title, 'Artist', 'Album', 1000, 200000, f'PID{track_id}',
+            path.casefold(), date_modified)
+
+
+def snapshot_playlist(name, track_ids=(), persistent_id=None, parent_id=None, is_folder=False):
+    """Build a snapshot playlist tuple."""
+    return (name, persistent_id, parent_id, is_folder, array('l', track_ids))
+
+
+class MergeLibrarySnapshotsTest(unittest.TestCase):
+    """merge_library_snapshots for tracks, playlists and folders."""
+
+    def setUp(self):
+        self.first = {
+            'tracks': [snapshot_track(1, '/Music/a.mp3', 'Old', 10),
+                       snapshot_track(2, '/Music/b.mp3')],
+            'playlists': [snapshot_playlist('Mix', [1, 2, 1], 'P1')],
+        }
+        self.second = {
+            'tracks': [snapshot_track(7, '/Music/a.mp3', 'New', 20),
+                       snapshot_track(8, '/Music/c.mp3')],
+            'playlists': [snapshot_playlist('mix', [8, 7], 'P2')],
+        }
+
+    def playlists(self, merged):
+        paths = {track[0]: track[1] for track in merged['tracks']}
+        return {(name, is_folder): [paths[track_id] for track_id in track_ids]
+                for name, _, _, is_folder, track_ids in merged['playlists']}
+
+    def test_precedence(self):
+        newest = merge_library_snapshots([self.first, self.second])
+        self.assertIn('New', [track[2] for track in newest['tracks']])
+        priority = merge_library_snapshots([self.first, self.second], 'priority')
+        self.assertIn('Old', [track[2] for track in priority['tracks']])
+        with self.assertRaises(ValueError):
+            merge_library_snapshots([self.first], 'oldest')
+
+    def test_single_library_keeps_repeats(self):
+        merged = merge_library_snapshots([self.first])
+        self.assertEqual(self.playlists(merged),
+                         {('Mix', False): ['/Music/a.mp3', '/Music/b.mp3', '/Music/a.mp3']})
+
+    def test_tracks_from_another_source_are_not_repeated(self):
+        merged = merge_library_snapshots([self.first, self.second])
+        self.assertEqual(self.playlists(merged), {
+            ('Mix', False): ['/Music/a.mp3', '/Music/b.mp3', '/Music/a.mp3', '/Music/c.mp3'],
+        })
+
+    def test_folders_are_not_merged_with_playlists(self):
+        self.second['playlists'] = [
+            snapshot_playlist('Mix', persistent_id='F2', is_folder=True),
+            snapshot_playlist('Inside', [8], 'P3', parent_id='F2'),
+        ]
+        merged = merge_library_snapshots([self.first, self.second])
+        self.assertEqual(self.playlists(merged), {
+            ('Mix', False): ['/Music/a.mp3', '/Music/b.mp3', '/Music/a.mp3'],
+            ('Mix', True): [],
+            ('Inside', False): ['/Music/c.mp3'],
+        })
+        # The folder keeps its own ID, so its contents stay inside it
+        parents = {name: parent_id for name, _, parent_id, _, _ in merged['playlists']}
+        self.assertEqual(parents['Inside'], 'F2')
+
+
+class PlaylistLookupTest(unittest.TestCase):
+    """get_playlist and get_playlist_tracks on a client built from a snapshot."""
+
+    def setUp(self):
+        self.client = AppleMusicXMLClient('library.xml', snapshot={
+            'tracks': [snapshot_track(1, '/Music/a.mp3')],
+            'playlists': [
+                snapshot_playlist('Road Trips', persistent_id='F1', is_folder=True),
+                snapshot_playlist('Road Trip Drafts', persistent_id='P1', parent_id='F1'),
+                snapshot_playlist('Road Trip Mix', [1], 'P2', parent_id='F1'),
+            ],
+        })
+
+    def test_partial_match_skips_folders_and_empty_playlists(self):
+        self.assertEqual(self.client.get_playlist('road trip').name, 'Road Trip Mix')
+        self.assertEqual(self.client.get_playlist('Road Trips').name, 'Road Trips')
+
+    def test_empty_playlist_is_not_reported_missing(self):
+        with self.assertLogs('apple_music_xml_client', 'WARNING') as logs:
+            self.assertEqual(self.client.get_playlist_tracks('Road Trip Drafts'), [])
+            self.assertEqual(self.client.get_playlist_tracks('Workout'), [])
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("'Workout' not found", logs.output[0])
+        self.assertEqual(self.client.get_playlist_tracks('P2'), ['/Music/a.mp3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
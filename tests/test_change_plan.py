@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Checks that plans written by PlanWriter read back unchanged.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from change_plan import PlannedTrack, PlanWriter, read_plan  # noqa: E402
+
+
+class PlanRoundTripTest(unittest.TestCase):
+    """PlanWriter followed by read_plan, for both file formats."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def round_trip(self, name):
+        path = os.path.join(self.tmp, name)
+        plan = PlanWriter(path)
+        plan.write(1, 'title', 'kiss', 'Kiss', 'path', '/Music/kiss.mp3')
+        plan.write(1, 'artist', None, 'Prince', 'path', '/Music/kiss.mp3')
+        plan.write(2, 'album', 'Ünïcode, "quoted"', '', 'size_duration', None)
+        plan.close()
+        self.assertEqual(plan.rows, 3)
+        return list(read_plan(path))
+
+    def test_ndjson(self):
+        self.assertEqual(self.round_trip('plan.ndjson'), [
+            PlannedTrack('1', 'path', '/Music/kiss.mp3',
+                         [('title', 'kiss', 'Kiss'), ('artist', None, 'Prince')]),
+            PlannedTrack('2', 'size_duration', None, [('album', 'Ünïcode, "quoted"', '')]),
+        ])
+
+    def test_csv(self):
+        # CSV cannot tell a missing value from an empty one: both read as None
+        self.assertEqual(self.round_trip('plan.csv'), [
+            PlannedTrack('1', 'path', '/Music/kiss.mp3',
+                         [('title', 'kiss', 'Kiss'), ('artist', None, 'Prince')]),
+            PlannedTrack('2', 'size_duration', None, [('album', 'Ünïcode, "quoted"', None)]),
+        ])
+
+    def test_row_without_field_is_rejected(self):
+        path = os.path.join(self.tmp, 'plan.ndjson')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('{"rating_key": "1", "field": "title", "new": "A"}\n{"rating_key": "2"}\n')
+        with self.assertRaises(ValueError):
+            list(read_plan(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Checks the bucket digests and change stamps used by the drift report.
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from digests import bucket_stamp, group_rows, rows_digest  # noqa: E402
+
+
+class RowsDigestTest(unittest.TestCase):
+    """rows_digest and group_rows."""
+
+    def test_row_order_does_not_matter(self):
+        rows = [('Song', 'Artist', 'Album'), ('Other', 'Artist', 'Album')]
+        self.assertEqual(rows_digest(rows), rows_digest(reversed(rows)))
+
+    def test_values_change_the_digest(self):
+        self.assertNotEqual(rows_digest([('Song', 'Artist', 'Album')]),
+                            rows_digest([('Song', 'Artist', 'Album ')]))
+        self.assertNotEqual(rows_digest([('Song', 'Artist')]), rows_digest([('Song', 'Artist')] * 2))
+
+    def test_field_boundaries_matter(self):
+        self.assertNotEqual(rows_digest([('ab', 'c')]), rows_digest([('a', 'bc')]))
+        self.assertNotEqual(rows_digest([('a', 'b')]), rows_digest([('a',), ('b',)]))
+
+    def test_none_is_an_empty_string(self):
+        self.assertEqual(rows_digest([('Song', None)]), rows_digest([('Song', '')]))
+        self.assertEqual(rows_digest([(1, 2)]), rows_digest([('1', '2')]))
+
+    def test_group_rows(self):
+        rows = [('a', 1), ('b', 2), ('a', 3)]
+        self.assertEqual(dict(group_rows(rows, lambda row: row[0])),
+                         {'a': [('a', 1), ('a', 3)], 'b': [('b', 2)]})
+
+
+class BucketStampTest(unittest.TestCase):
+    """bucket_stamp."""
+
+    def test_stamp_changes_with_the_bucket(self):
+        stamp = bucket_stamp([100, 200])
+        self.assertEqual(stamp, bucket_stamp([200, 100]))
+        self.assertNotEqual(stamp, bucket_stamp([100, 200, 150]))   # track added
+        self.assertNotEqual(stamp, bucket_stamp([200]))             # track removed
+        self.assertNotEqual(stamp, bucket_stamp([100, 250]))        # track modified
+        self.assertNotEqual(stamp, bucket_stamp([150, 200]))        # older track modified
+
+    def test_missing_times_give_no_stamp(self):
+        self.assertIsNone(bucket_stamp([]))
+        self.assertIsNone(bucket_stamp([100, None]))
+
+
+if __name__ == '__main__':
+    unittest.main()
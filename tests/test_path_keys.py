@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Checks the path keys used to match Apple Music and Plex file paths.
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from path_keys import basename_key, make_path_key  # noqa: E402
+
+
+class MakePathKeyTest(unittest.TestCase):
+    """make_path_key and basename_key."""
+
+    def test_missing_path(self):
+        self.assertIsNone(make_path_key(None))
+        self.assertIsNone(make_path_key(''))
+
+    def test_decomposed_and_composed_paths_share_a_key(self):
+        decomposed = '/Music/Bjo\u0308rk/Joga.mp3'
+        composed = '/Music/Bj\u00f6rk/Joga.mp3'
+        self.assertNotEqual(decomposed, composed)
+        self.assertEqual(make_path_key(decomposed), make_path_key(composed))
+
+    def test_separators_collapse_to_slashes(self):
+        self.assertEqual(make_path_key('\\\\SOOBIN\\Music\\\\A/B//song.mp3'), '/SOOBIN/Music/A/B/song.mp3')
+
+    def test_casefold(self):
+        self.assertEqual(make_path_key('/Music/ABBA/Song.MP3', casefold=True), '/music/abba/song.mp3')
+        self.assertEqual(make_path_key('/Music/ABBA/Song.MP3', casefold=False), '/Music/ABBA/Song.MP3')
+
+    def test_basename_key(self):
+        self.assertEqual(basename_key(make_path_key('C:\\Music\\song.mp3')), 'song.mp3')
+        self.assertEqual(basename_key('song.mp3'), 'song.mp3')
+
+
+if __name__ == '__main__':
+    unittest.main()
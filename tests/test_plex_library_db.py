@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Checks PlexLibraryDB against a small fixture database laid out like Plex's
+com.plexapp.plugins.library.db (only the tables and columns it reads).
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from plex_library_db import PlexLibraryDB, PlexDBPart, TRACK_TYPE  # noqa: E402
+
+SECTION = 7
+
+FIXTURE_SCHEMA = """
+    CREATE TABLE metadata_items (
+        id INTEGER PRIMARY KEY, library_section_id INTEGER, parent_id INTEGER,
+        metadata_type INTEGER, title TEXT, original_title TEXT
+    );
+    CREATE TABLE media_items (
+        id INTEGER PRIMARY KEY, metadata_item_id INTEGER, duration INTEGER
+    );
+    CREATE TABLE media_parts (
+        id INTEGER PRIMARY KEY, media_item_id INTEGER, file TEXT, size INTEGER, duration INTEGER
+    );
+"""
+
+# (id, section, parent, type, title, original title)
+FIXTURE_ITEMS = [
+    (1, SECTION, None, 8, 'Björk', None),
+    (2, SECTION, 1, 9, 'Post', None),
+    (10, SECTION, 2, TRACK_TYPE, 'Army of Me', None),
+    (11, SECTION, 2, TRACK_TYPE, 'Hyperballad', 'Björk feat. Someone'),
+    (12, SECTION, 2, TRACK_TYPE, 'No Media', ''),
+    (13, SECTION, 2, TRACK_TYPE, 'Isobel', None),
+    (14, SECTION, 2, TRACK_TYPE, 'Possibly Maybe', None),
+    (20, SECTION + 1, 2, TRACK_TYPE, 'Other Section', None),
+]
+
+# (id, track, duration)
+FIXTURE_MEDIA = [
+    (100, 10, 200000),
+    (101, 11, 310000),
+    (102, 11, 310500),
+    (103, 13, 340000),
+    (104, 14, 306000),
+    (105, 20, 1000),
+]
+
+# (id, media, file, size, duration)
+FIXTURE_PARTS = [
+    (1000, 100, '/music/Björk/Post/01 Army of Me.flac', 111, 200000),
+    (1001, 101, '/music/Björk/Post/02 Hyperballad.flac', 222, 310000),
+    (1002, 102, '/music/Björk/Post/02 Hyperballad.mp3', 22, 310500),
+    (1003, 103, '/music/Björk/Post/03 Isobel (1).flac', 333, 170000),
+    (1004, 103, '/music/Björk/Post/03 Isobel (2).flac', 334, 170000),
+    (1005, 104, '/music/Björk/Post/04 Possibly Maybe.flac', 444, 306000),
+    (1006, 105, '/music/elsewhere.flac', 1, 1000),
+]
+
+
+class PlexLibraryDBPageTest(unittest.TestCase):
+    """Page grouping of tracks with several media items and parts."""
+
+    def setUp(self):
+        handle, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        conn = sqlite3.connect(self.db_path)
+        conn.executescript(FIXTURE_SCHEMA)
+        conn.executemany("INSERT INTO metadata_items VALUES (?, ?, ?, ?, ?, ?)", FIXTURE_ITEMS)
+        conn.executemany("INSERT INTO media_items VALUES (?, ?, ?)", FIXTURE_MEDIA)
+        conn.executemany("INSERT INTO media_parts VALUES (?, ?, ?, ?, ?)", FIXTURE_PARTS)
+        conn.commit()
+        conn.close()
+        self.db = PlexLibraryDB(self.db_path, SECTION, immutable=True)
+
+    def tearDown(self):
+        self.db.close()
+        os.remove(self.db_path)
+
+    def test_pages_hold_whole_tracks(self):
+        # A page size below the rows per track must not split any track
+        for page_size in (1, 2, 3, 500):
+            pages = list(self.db.iter_track_pages(page_size))
+            self.assertTrue(all(0 < len(page) <= page_size for page in pages))
+            tracks = [track for page in pages for track in page]
+            self.assertEqual([track.ratingKey for track in tracks], [10, 11, 12, 13, 14])
+            self.assertEqual([len(track.media) for track in tracks], [1, 2, 0, 1, 1])
+            self.assertEqual([len(media.parts) for media in tracks[3].media], [2])
+
+    def test_track_fields(self):
+        tracks = {track.ratingKey: track for track in self.db.get_all_tracks()}
+        self.assertEqual(len(tracks), self.db.count_tracks())
+
+        hyperballad = tracks[11]
+        self.assertEqual(hyperballad.title, 'Hyperballad')
+        self.assertEqual(hyperballad.originalTitle, 'Björk feat. Someone')
+        self.assertEqual(hyperballad.parentTitle, 'Post')
+        self.assertEqual(hyperballad.grandparentTitle, 'Björk')
+        self.assertEqual([media.duration for media in hyperballad.media], [310000, 310500])
+        self.assertEqual(hyperballad.media[1].parts,
+                         [PlexDBPart('/music/Björk/Post/02 Hyperballad.mp3', 22, 310500)])
+        # An empty original title reads as no track artist
+        self.assertIsNone(tracks[12].originalTitle)
+
+    def test_tracks_by_artist(self):
+        self.assertEqual([track.ratingKey for track in self.db.get_tracks_by_artist('BJöRK')],
+                         [10, 11, 12, 13, 14])
+        self.assertEqual([track.ratingKey for track in self.db.get_tracks_by_artist('björk feat. someone')],
+                         [11])
+
+
+if __name__ == '__main__':
+    unittest.main()
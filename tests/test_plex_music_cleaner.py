@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Checks the cleaner's matching and write-back logic against in-memory tracks.
+
+Plex tracks are PlexDBTrack records (the same shape the cleaner reads from
+Plex's own database), so no server is needed.
+"""
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import plex_music_cleaner as cleaner  # noqa: E402
+from change_plan import PlanWriter, read_plan  # noqa: E402
+from plex_library_db import PlexDBMedia, PlexDBPart, PlexDBTrack  # noqa: E402
+
+
+def make_track(rating_key, path, size=None, duration=None, title='Title', artist='Artist',
+               album='Album', original_title=None):
+    """Build a Plex track record with one media part."""
+    return PlexDBTrack(rating_key, title, original_title, album, artist,
+                       [PlexDBMedia(duration, [PlexDBPart(path, size, duration)])])
+
+
+def apple_track(title='Title', artist='Artist', album='Album', size=None, duration=None,
+                persistent_id=None):
+    """Build an Apple Music metadata dictionary."""
+    return {'title': title, 'artist': artist, 'album': album, 'size': size,
+            'duration': duration, 'persistent_id': persistent_id}
+
+
+class FakePlexClient:
+    """Stands in for PlexClient, keeping tracks in a dictionary by rating key."""
+
+    def __init__(self, tracks):
+        self.tracks = {str(track.ratingKey): track for track in tracks}
+        self.failed_pages = 0
+
+    def iter_track_pages(self, page_size=500):
+        tracks = list(self.tracks.values())
+        for i in range(0, len(tracks), page_size):
+            yield tracks[i:i + page_size]
+
+    def fetch_tracks(self, rating_keys, chunk_size=200):
+        return {str(key): self.tracks[str(key)] for key in rating_keys if str(key) in self.tracks}
+
+    def update_track_metadata(self, track, title=None, artist=None, album=None, lock=True,
+                              raise_errors=False):
+        fields = {'title': title, 'originalTitle': artist, 'parentTitle': album}
+        fields = {field: value for field, value in fields.items()
+                  if value is not None and getattr(track, field) != value}
+        if not fields:
+            return False
+        self.tracks[str(track.ratingKey)] = track._replace(**fields)
+        return True
+
+    def close(self):
+        pass
+
+
+class FakeAppleMusicClient:
+    """Stands in for AppleMusicClient with a fixed set of tracks."""
+
+    def __init__(self, tracks):
+        self.tracks = tracks
+
+    def get_all_tracks(self):
+        return self.tracks
+
+
+class SqliteReadonlyUriTest(unittest.TestCase):
+    """_sqlite_readonly_uri keeps drive colons and separators readable."""
+
+    def test_colons_and_slashes_are_not_quoted(self):
+        self.assertEqual(cleaner._sqlite_readonly_uri('/Volumes/My Music/C:lib.db'),
+                         'file:///Volumes/My%20Music/C:lib.db?mode=ro')
+
+    @unittest.skipUnless(os.name == 'nt', 'drive letters only exist on Windows')
+    def test_drive_letter(self):
+        self.assertEqual(cleaner._sqlite_readonly_uri('C:\\Music\\library.db'),
+                         'file:///C:/Music/library.db?mode=ro')
+
+    def test_uri_opens_the_database(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, 'a:b #1.db')
+        conn = sqlite3.connect(path)
+        conn.execute('CREATE TABLE t (x)')
+        conn.close()
+        conn = sqlite3.connect(cleaner._sqlite_readonly_uri(path), uri=True)
+        self.addCleanup(conn.close)
+        self.assertEqual(conn.execute('SELECT count(*) FROM t').fetchone(), (0,))
+        with self.assertRaises(sqlite3.OperationalError):
+            conn.execute('INSERT INTO t VALUES (1)')
+
+
+class SizeDurationJoinTest(unittest.TestCase):
+    """AppleTrackIndex.join_size_duration and the claims made before it."""
+
+    def setUp(self):
+        self.index = cleaner.AppleTrackIndex({
+            '/Music/A/song.mp3': apple_track('Song', size=1000, duration=200000),
+            '/Music/B/other.mp3': apple_track('Other', size=2000, duration=300000),
+        })
+
+    def join(self, tracks):
+        matches, unmatched = self.index.match_direct(tracks)
+        claimed = {match.apple_path for match in matches}
+        joined, ambiguous = self.index.join_size_duration(unmatched, claimed)
+        return matches, joined, ambiguous
+
+    def test_unique_key_matches(self):
+        _, joined, ambiguous = self.join([make_track(1, '/plex/x/renamed.mp3', 2000, 300400)])
+        self.assertEqual([(match.track.ratingKey, match.apple_path) for match in joined],
+                         [(1, '/Music/B/other.mp3')])
+        self.assertEqual(ambiguous, [])
+
+    def test_path_match_claims_its_apple_track(self):
+        # The second file has the same size and duration as the first, which
+        # already matched by path; it must not take the same metadata
+        direct, joined, ambiguous = self.join([
+            make_track(1, '/Music/A/song.mp3', 1000, 200000),
+            make_track(2, '/plex/unrelated/copy.mp3', 1000, 200000),
+        ])
+        self.assertEqual([(match.track.ratingKey, match.method) for match in direct], [(1, 'path')])
+        self.assertEqual(joined, [])
+        self.assertEqual(ambiguous, [])
+
+    def test_competing_plex_tracks_are_ambiguous(self):
+        _, joined, ambiguous = self.join([
+            make_track(1, '/plex/one.mp3', 2000, 300000),
+            make_track(2, '/plex/two.mp3', 2000, 300000),
+        ])
+        self.assertEqual(joined, [])
+        self.assertEqual([track.ratingKey for track, _ in ambiguous], [1, 2])
+
+    def test_claims_carry_across_pages(self):
+        stats = cleaner._new_clean_stats(0)
+        deferred = []
+        claimed = set()
+        cleaner._match_pending(self.index, [make_track(1, '/Music/A/song.mp3', 1000, 200000)],
+                               stats, deferred=deferred, claimed=claimed)
+        cleaner._match_pending(self.index, [make_track(2, '/plex/copy.mp3', 1000, 200000)],
+                               stats, deferred=deferred, claimed=claimed)
+        self.assertEqual(cleaner._match_deferred(self.index, deferred, stats, claimed=claimed), [])
+        self.assertEqual(stats['matched_tracks'], 1)
+
+
+class ArtistSelectionTest(unittest.TestCase):
+    """load_artist_names and the artists clean_artists_tracks selects."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def test_names_file_drops_blank_and_duplicate_names(self):
+        path = os.path.join(self.tmp, 'names.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('Prince\n   \n# comment\nprince\n  Björk  \n')
+        self.assertEqual(cleaner.load_artist_names(['  ', 'Daft Punk'], path),
+                         ['Daft Punk', 'Prince', 'Björk'])
+
+    def test_whole_names_select_both_libraries(self):
+        # "Prince" must not pull in "Prince Royce" on either side; track 3 has
+        # the size and duration of a Prince Royce file and must stay unmatched
+        apple = FakeAppleMusicClient({
+            '/Music/prince.mp3': apple_track('Kiss', 'Prince', size=1000, duration=200000),
+            '/Music/royce.mp3': apple_track('Darte', 'Prince Royce', size=2000, duration=300000),
+        })
+        tracks = [
+            make_track(1, '/plex/kiss.mp3', 1000, 200000, title='kiss', artist='prince'),
+            make_track(2, '/plex/darte.mp3', 2000, 300000, title='darte', artist='Prince Royce'),
+            make_track(3, '/plex/other.mp3', 2000, 300000, title='other', artist='Prince'),
+        ]
+        plan_path = os.path.join(self.tmp, 'plan.ndjson')
+        logger = cleaner.CleanLogger(os.path.join(self.tmp, 'log.db'))
+        plan = PlanWriter(plan_path)
+        stats = cleaner.clean_artists_tracks(FakePlexClient(tracks), apple, logger, ['Prince'],
+                                             plan=plan)
+        plan.close()
+        logger.close()
+        self.assertEqual(stats['total_tracks'], 2)
+        self.assertEqual({(track.rating_key, track.apple_path) for track in read_plan(plan_path)},
+                         {('1', '/Music/prince.mp3')})
+
+
+class WriteBackTest(unittest.TestCase):
+    """apply_plan and undo_run against a fake Plex server."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.logger = self.new_run()
+        self.plex = FakePlexClient([
+            make_track(1, '/Music/kiss.mp3', title='kiss', artist='Prince', album='Hits'),
+            make_track(2, '/Music/purple.mp3', title='purple rain', artist='Prince', album='Hits'),
+        ])
+
+    def new_run(self):
+        logger = cleaner.CleanLogger(os.path.join(self.tmp, 'log.db'))
+        self.addCleanup(logger.close)
+        return logger
+
+    def clean(self, logger):
+        apple = FakeAppleMusicClient({
+            '/Music/kiss.mp3': apple_track('Kiss', 'Prince', 'Parade'),
+            '/Music/purple.mp3': apple_track('Purple Rain', 'Prince', 'Purple Rain'),
+        })
+        return cleaner.clean_artists_tracks(self.plex, apple, logger, ['Prince'])
+
+    def values(self, rating_key):
+        track = self.plex.tracks[str(rating_key)]
+        return track.title, track.parentTitle
+
+    def test_csv_plan_can_clear_a_field(self):
+        path = os.path.join(self.tmp, 'plan.csv')
+        plan = PlanWriter(path)
+        plan.write(1, 'title', 'kiss', 'Kiss', 'path')
+        plan.write(1, 'album', 'Hits', '', 'path')
+        plan.close()
+        stats = cleaner.apply_plan(self.plex, self.logger, path)
+        self.assertEqual((stats['updated_tracks'], stats['failed_updates']), (1, 0))
+        self.assertEqual(self.values(1), ('Kiss', ''))
+
+    def test_undo_reverts_a_run(self):
+        self.assertEqual(self.clean(self.logger)['updated_tracks'], 2)
+        run_id = self.logger.run_id
+        self.assertEqual(self.values(1), ('Kiss', 'Parade'))
+        # Edited by hand since the run: left alone
+        self.plex.tracks['2'] = self.plex.tracks['2']._replace(title='Purple Rain (Live)')
+
+        stats = cleaner.undo_run(self.plex, self.new_run(), run_id)
+        self.assertEqual((stats['updated_tracks'], stats['edited_fields'], stats['failed_updates']),
+                         (2, 1, 0))
+        self.assertEqual(self.values(1), ('kiss', 'Hits'))
+        self.assertEqual(self.values(2), ('Purple Rain (Live)', 'Hits'))
+        runs = {run['run_id']: run for run in self.logger.get_runs()}
+        self.assertIsNotNone(runs[run_id]['undone_by'])
+
+        # A later clean compares the reverted tracks with Apple Music again
+        self.assertEqual(self.clean(self.new_run())['updated_tracks'], 2)
+        self.assertEqual(self.values(1), ('Kiss', 'Parade'))
+        self.assertEqual(self.values(2), ('Purple Rain', 'Purple Rain'))
+
+    def test_unknown_run(self):
+        stats = cleaner.undo_run(self.plex, self.logger, 'no-such-run')
+        self.assertEqual(stats['total_tracks'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()